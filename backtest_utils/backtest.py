@@ -0,0 +1,276 @@
+"""
+Vectorized backtest of the AO signal rules in deribit_utils.execute_trade_logic.
+
+The rules replayed on historical bars:
+- A signal computed on a closed bar is traded at the open of the next bar.
+- A long signal opens a long of LONG_SIZE_MULTIPLIER x equity, a short signal a short of
+  SHORT_SIZE_MULTIPLIER x equity. An opposite signal reverses the position, a signal in the
+  direction of the open position is ignored.
+- Every position is protected by a stop loss and a take profit at STOP_LOSS_PERCENTAGE and
+  TAKE_PROFIT_PERCENTAGE from the entry, checked against each bar's high and low. If both are
+  touched within one bar the stop is assumed to trigger first. A bar opening beyond a level
+  fills at the open.
+- After a stop or a target the account is flat until the next signal, in either direction.
+- Positions are sized and settled like the BTC inverse perpetual, so equity is in BTC.
+
+Lookahead indexes, stop and target scans and the equity curve are computed with NumPy array
+operations. Only the chaining of trades, which depends on where the previous trade ended, is a
+Python loop, with one iteration per trade rather than per bar.
+
+Usage:
+    result = backtest(df)  # df has open, high, low, close, Long_Entry and Short_Entry columns
+    results = sweep(df, stop_losses=[0.05, 0.09], take_profits=[0.09, 0.15])
+"""
+import functools
+import itertools
+
+import numpy as np
+
+from backtest_utils.parallel import parallel_map
+from deribit_utils.deribit_utils import (
+    LONG_SIZE_MULTIPLIER,
+    SHORT_SIZE_MULTIPLIER,
+    STOP_LOSS_PERCENTAGE,
+    TAKE_PROFIT_PERCENTAGE,
+)
+
+FEE_RATE = 0.0005  # Taker fee per side, the worst case of the limit order chase
+BARS_PER_YEAR = 24 * 365  # Hourly bars
+
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+EXIT_REVERSAL = 3
+EXIT_END_OF_DATA = 4
+EXIT_REASONS = {
+    EXIT_STOP_LOSS: "stop_loss",
+    EXIT_TAKE_PROFIT: "take_profit",
+    EXIT_REVERSAL: "reversal",
+    EXIT_END_OF_DATA: "end_of_data",
+}
+
+SUMMARY_COLUMNS = [
+    "total_return", "max_drawdown", "sharpe", "n_trades", "win_rate",
+    "stop_losses", "take_profits", "reversals", "fees",
+]
+
+TRADE_COLUMNS = [
+    "entry_bar", "exit_bar", "direction", "leverage", "entry_price", "exit_price",
+    "exit_reason", "equity_before", "equity_after", "fees",
+]
+
+
+def prepare_arrays(df, long_column="Long_Entry", short_column="Short_Entry"):
+    """
+    Convert a DataFrame of bars and signals into the float and bool arrays used by simulate.
+    A bar with both signals set is treated as a long signal, as in execute_trade_logic.
+    """
+    long_entry = df[long_column].fillna(False).to_numpy(dtype=bool)
+    short_entry = df[short_column].fillna(False).to_numpy(dtype=bool) & ~long_entry
+    return {
+        "open": df["open"].to_numpy(dtype=np.float64),
+        "high": df["high"].to_numpy(dtype=np.float64),
+        "low": df["low"].to_numpy(dtype=np.float64),
+        "close": df["close"].to_numpy(dtype=np.float64),
+        "long_entry": long_entry,
+        "short_entry": short_entry,
+    }
+
+
+def _next_true_index(mask):
+    """
+    For every bar, the index of the first True at or after it, or len(mask) if there is none.
+    """
+    n = len(mask)
+    index = np.where(mask, np.arange(n), n)
+    return np.minimum.accumulate(index[::-1])[::-1]
+
+
+def simulate(arrays, stop_loss=STOP_LOSS_PERCENTAGE, take_profit=TAKE_PROFIT_PERCENTAGE,
+             long_multiplier=LONG_SIZE_MULTIPLIER, short_multiplier=SHORT_SIZE_MULTIPLIER,
+             fee_rate=FEE_RATE, initial_equity=1.0):
+    """
+    Replay the trading rules over prepared arrays.
+
+    Args:
+    - arrays: Output of prepare_arrays.
+    - stop_loss, take_profit: Distance of the protective orders from the entry, as a fraction.
+    - long_multiplier, short_multiplier: Position size as a multiple of equity.
+    - fee_rate: Fee per side as a fraction of the traded notional.
+    - initial_equity: Starting balance in BTC.
+
+    Returns:
+    - (trades, equity, position): a float array with one row per trade in TRADE_COLUMNS order,
+      the equity at each bar close, and the signed leverage held over each bar.
+    """
+    open_, high, low, close = arrays["open"], arrays["high"], arrays["low"], arrays["close"]
+    n = len(close)
+    next_long = np.append(_next_true_index(arrays["long_entry"]), n)
+    next_short = np.append(_next_true_index(arrays["short_entry"]), n)
+    next_signal = np.minimum(next_long, next_short)
+
+    trades = []
+    equity = initial_equity
+    signal = next_signal[0]
+    while signal < n - 1 and equity > 0:
+        direction = 1 if arrays["long_entry"][signal] else -1
+        leverage = long_multiplier if direction > 0 else short_multiplier
+        entry_bar = signal + 1
+        entry = open_[entry_bar]
+        # The position lives until the bar of the next opposite signal, and is closed at the following open
+        reversal = (next_short if direction > 0 else next_long)[entry_bar]
+        last_bar = min(reversal, n - 1)
+
+        if direction > 0:
+            stop, target = entry * (1 - stop_loss), entry * (1 + take_profit)
+            stop_hit = low[entry_bar:last_bar + 1] <= stop
+            target_hit = high[entry_bar:last_bar + 1] >= target
+        else:
+            stop, target = entry * (1 + stop_loss), entry * (1 - take_profit)
+            stop_hit = high[entry_bar:last_bar + 1] >= stop
+            target_hit = low[entry_bar:last_bar + 1] <= target
+        hit = stop_hit | target_hit
+
+        if hit.any():
+            offset = hit.argmax()
+            exit_bar = entry_bar + offset
+            bar_open = open_[exit_bar]
+            if stop_hit[offset]:
+                exit_reason = EXIT_STOP_LOSS
+                exit_price = min(stop, bar_open) if direction > 0 else max(stop, bar_open)
+            else:
+                exit_reason = EXIT_TAKE_PROFIT
+                exit_price = max(target, bar_open) if direction > 0 else min(target, bar_open)
+            signal = next_signal[exit_bar]
+        elif reversal < n - 1:
+            exit_reason = EXIT_REVERSAL
+            exit_bar = reversal + 1
+            exit_price = open_[exit_bar]
+            signal = reversal
+        else:
+            exit_reason = EXIT_END_OF_DATA
+            exit_bar = n - 1
+            exit_price = close[exit_bar]
+            signal = n
+
+        # Inverse contract: the PnL of a USD notional of leverage * equity * entry is settled in BTC
+        fees = leverage * equity * fee_rate * (1 + entry / exit_price)
+        equity_after = max(equity * (1 + direction * leverage * (1 - entry / exit_price)) - fees, 0.0)
+        trades.append((entry_bar, exit_bar, direction, leverage, entry, exit_price,
+                       exit_reason, equity, equity_after, fees))
+        equity = equity_after
+
+    trades = np.array(trades, dtype=np.float64).reshape(-1, len(TRADE_COLUMNS))
+    equity_curve, position = _equity_curve(trades, close, fee_rate, initial_equity)
+    return trades, equity_curve, position
+
+
+def _equity_curve(trades, close, fee_rate, initial_equity):
+    """
+    Mark open positions to each bar close and carry realized equity over flat periods.
+    """
+    n = len(close)
+    equity = np.full(n, np.nan)
+    equity[0] = initial_equity
+    position = np.zeros(n)
+    if len(trades):
+        exit_bars = trades[:, 1].astype(np.int64)
+        equity[exit_bars] = trades[:, 8]
+    # Forward fill the realized equity from each exit to the next one
+    filled = np.where(np.isnan(equity), 0, np.arange(n))
+    equity = equity[np.maximum.accumulate(filled)]
+
+    for entry_bar, exit_bar, direction, leverage, entry, _, _, equity_before, _, _ in trades:
+        entry_bar, exit_bar = int(entry_bar), int(exit_bar)
+        # From the exit bar on, the realized equity applies
+        marks = close[entry_bar:exit_bar]
+        equity[entry_bar:exit_bar] = equity_before * (
+            1 + direction * leverage * (1 - entry / marks) - leverage * fee_rate
+        )
+        position[entry_bar:exit_bar] = direction * leverage
+    return np.maximum(equity, 0.0), position
+
+
+def summarize(trades, equity, bars_per_year=BARS_PER_YEAR):
+    """
+    Return the headline statistics of a simulation as a dict keyed by SUMMARY_COLUMNS.
+    """
+    returns = np.diff(equity) / np.where(equity[:-1] > 0, equity[:-1], np.nan)
+    returns = returns[np.isfinite(returns)]
+    volatility = returns.std() if len(returns) else 0.0
+    exit_reasons = trades[:, 6]
+    return {
+        "total_return": float(equity[-1] / equity[0] - 1),
+        "max_drawdown": float((equity / np.maximum.accumulate(equity) - 1).min()),
+        "sharpe": float(returns.mean() / volatility * np.sqrt(bars_per_year)) if volatility > 0 else 0.0,
+        "n_trades": len(trades),
+        "win_rate": float((trades[:, 8] > trades[:, 7]).mean()) if len(trades) else 0.0,
+        "stop_losses": int((exit_reasons == EXIT_STOP_LOSS).sum()),
+        "take_profits": int((exit_reasons == EXIT_TAKE_PROFIT).sum()),
+        "reversals": int((exit_reasons == EXIT_REVERSAL).sum()),
+        "fees": float(trades[:, 9].sum()),
+    }
+
+
+def backtest(df, long_column="Long_Entry", short_column="Short_Entry", bars_per_year=BARS_PER_YEAR, **params):
+    """
+    Backtest the trading rules over a DataFrame of hourly bars and signals.
+
+    Args:
+    - df: DataFrame with open, high, low, close and the two signal columns, oldest bar first.
+    - long_column, short_column: Names of the signal columns.
+    - bars_per_year: Used to annualize the Sharpe ratio.
+    - params: Keyword arguments of simulate (stop_loss, take_profit, long_multiplier, ...).
+
+    Returns:
+    - A dict with the summary statistics, a "trades" DataFrame and "equity" and "position" Series
+      indexed like df.
+    """
+    import pandas as pd
+
+    trades, equity, position = simulate(prepare_arrays(df, long_column, short_column), **params)
+    result = summarize(trades, equity, bars_per_year)
+
+    trades = pd.DataFrame(trades, columns=TRADE_COLUMNS)
+    for column in ["entry_bar", "exit_bar", "direction", "exit_reason"]:
+        trades[column] = trades[column].astype(int)
+    trades["exit_reason"] = trades["exit_reason"].map(EXIT_REASONS)
+    trades["entry_time"] = df.index[trades["entry_bar"]]
+    trades["exit_time"] = df.index[trades["exit_bar"]]
+    result.update({
+        "trades": trades,
+        "equity": pd.Series(equity, index=df.index, name="equity"),
+        "position": pd.Series(position, index=df.index, name="position"),
+    })
+    return result
+
+
+def _run_combinations(arrays, combinations, fee_rate, bars_per_year):
+    rows = []
+    for stop_loss, take_profit, long_multiplier, short_multiplier in combinations:
+        trades, equity, _ = simulate(arrays, stop_loss, take_profit, long_multiplier,
+                                     short_multiplier, fee_rate)
+        rows.append(summarize(trades, equity, bars_per_year))
+    return rows
+
+
+def sweep(df, stop_losses=(STOP_LOSS_PERCENTAGE,), take_profits=(TAKE_PROFIT_PERCENTAGE,),
+          long_multipliers=(LONG_SIZE_MULTIPLIER,), short_multipliers=(SHORT_SIZE_MULTIPLIER,),
+          fee_rate=FEE_RATE, bars_per_year=BARS_PER_YEAR, processes=None,
+          long_column="Long_Entry", short_column="Short_Entry"):
+    """
+    Backtest every combination of the given parameters, in parallel across CPU cores.
+
+    Returns:
+    - A DataFrame with one row per combination: the parameters followed by SUMMARY_COLUMNS,
+      sorted by total return.
+    """
+    import pandas as pd
+
+    arrays = prepare_arrays(df, long_column, short_column)
+    combinations = list(itertools.product(stop_losses, take_profits, long_multipliers, short_multipliers))
+    rows = parallel_map(functools.partial(_run_combinations, fee_rate=fee_rate, bars_per_year=bars_per_year),
+                        combinations, arrays, processes)
+
+    parameters = pd.DataFrame(combinations, columns=["stop_loss", "take_profit", "long_multiplier", "short_multiplier"])
+    results = pd.concat([parameters, pd.DataFrame(rows, columns=SUMMARY_COLUMNS)], axis=1)
+    return results.sort_values("total_return", ascending=False, ignore_index=True)
@@ -0,0 +1,267 @@
+"""
+Execution-quality simulator of the post-only order chase in deribit_utils.monitor_and_update_order.
+
+Recorded top-of-book and trade streams are replayed through the chase rules, for each order of a
+list of (time, side, quantity):
+- On arrival, and on every change of the best bid/ask, the target price is CHASE_OFFSET_TICKS
+  behind the best price of the order's side. The order is placed there, and moved (edited) to the
+  target once it is more than CHASE_TOLERANCE_TICKS away from it.
+- Each placement or edit takes effect `latency` seconds after the book change that caused it,
+  and joins the back of the queue: the orders ahead of it are estimated by the size resting at
+  the best price of its side, unless the order is inside the spread.
+- Trades of the opposite side at the order price consume the queue ahead, then fill the order.
+  Trades through the order price, or an opposite best price reaching it, fill what is left.
+  Optionally the queue ahead also shrinks with cancellations, at cancel_rate per second.
+- After time_limit seconds the remainder is sent as a market order, filled at the opposite best
+  price `latency` seconds later.
+
+Each order is measured from the mid price at its arrival: the passively filled fraction, the
+time to fill, the slippage and the total cost including fees, in basis points. sweep_execution
+runs every combination of offsets, tolerances, time limits and latencies in parallel across CPU
+cores, like backtest.sweep.
+
+Usage:
+    market = prepare_market_data(book_df, trades_df)  # Recorded book tops and trades
+    result = simulate_orders(market, orders)  # orders: list of (timestamp_seconds, "buy"/"sell", amount)
+    results = sweep_execution(market, orders, offsets=range(0, 6), time_limits=[30, 60, 200])
+"""
+import bisect
+import functools
+import itertools
+import math
+
+import numpy as np
+
+from backtest_utils.parallel import parallel_map
+from deribit_utils.deribit_utils import CHASE_OFFSET_TICKS, CHASE_TOLERANCE_TICKS, TICK_SIZE, TIME_LIMIT_SECONDS
+
+LATENCY_SECONDS = 0.05  # One-way latency of an order placement or edit
+QUEUE_CANCEL_RATE = 0.0  # Share of the queue ahead cancelled per second, 0 assumes nobody ahead ever leaves
+MAKER_FEE = 0.0
+TAKER_FEE = 0.0005
+
+EVENT_BOOK = 0
+EVENT_TRADE = 1
+
+ORDER_COLUMNS = [
+    "order_time", "side", "amount", "passive_fraction", "time_to_fill", "average_price",
+    "slippage_bps", "cost_bps", "reprices", "market_fallback",
+]
+
+EXECUTION_SUMMARY_COLUMNS = [
+    "fill_rate", "passive_fraction", "time_to_fill_p50", "time_to_fill_p90", "slippage_bps_mean",
+    "slippage_bps_p50", "slippage_bps_p90", "slippage_bps_p99", "cost_bps_mean", "reprices_per_order",
+]
+
+PARAMETER_COLUMNS = ["offset_ticks", "tolerance_ticks", "time_limit", "latency"]
+
+
+def prepare_market_data(book, trades):
+    """
+    Merge recorded book tops and trades into one time-ordered event stream.
+
+    Args:
+    - book: DataFrame with timestamp (milliseconds, as sent by Deribit), best_bid_price,
+      best_bid_amount, best_ask_price and best_ask_amount columns, e.g. ticker or book notifications.
+    - trades: DataFrame with timestamp, price, amount and direction ("buy" or "sell", the aggressor) columns.
+
+    Returns:
+    - Dict of lists, one entry per event: time (seconds), kind (EVENT_BOOK or EVENT_TRADE), the best
+      prices and sizes in force at the event, and the trade price, amount and direction (+1 buy, -1 sell).
+      Lists rather than arrays: the chase is a Python loop, which reads list items much faster.
+    """
+    book = book.sort_values("timestamp", kind="stable")
+    trades = trades.sort_values("timestamp", kind="stable")
+    n_book, n_trades = len(book), len(trades)
+
+    time = np.concatenate([book["timestamp"].to_numpy(dtype=np.float64),
+                           trades["timestamp"].to_numpy(dtype=np.float64)]) / 1000
+    kind = np.concatenate([np.full(n_book, EVENT_BOOK), np.full(n_trades, EVENT_TRADE)])
+    # By time, book tops before trades on equal timestamps
+    order = np.lexsort((kind, time))
+
+    def book_column(name):
+        # The last book top at or before each event
+        values = np.concatenate([book[name].to_numpy(dtype=np.float64), np.full(n_trades, np.nan)])[order]
+        index = np.where(~np.isnan(values), np.arange(len(values)), 0)
+        return values[np.maximum.accumulate(index)]
+
+    def trade_column(values):
+        return np.concatenate([np.zeros(n_book), np.asarray(values, dtype=np.float64)])[order]
+
+    direction = np.where(trades["direction"].to_numpy() == "buy", 1.0, -1.0)
+    market = {
+        "time": time[order],
+        "kind": kind[order],
+        "bid": book_column("best_bid_price"),
+        "bid_amount": book_column("best_bid_amount"),
+        "ask": book_column("best_ask_price"),
+        "ask_amount": book_column("best_ask_amount"),
+        "trade_price": trade_column(trades["price"].to_numpy()),
+        "trade_amount": trade_column(trades["amount"].to_numpy()),
+        "trade_direction": trade_column(direction),
+    }
+    # Trades recorded before the first book top cannot be placed against a book
+    first_book = int(np.argmax(market["kind"] == EVENT_BOOK)) if n_book else len(order)
+    return {name: values[first_book:].tolist() for name, values in market.items()}
+
+
+def _queue_ahead(price, near, near_amount, direction):
+    if direction * (price - near) > 0:
+        return 0.0  # Inside the spread: first at a new price level
+    return near_amount  # At or behind the best price: the best price size stands in for the level's
+
+
+def chase(market, order_time, side, amount, offset_ticks=CHASE_OFFSET_TICKS, tolerance_ticks=CHASE_TOLERANCE_TICKS,
+          time_limit=TIME_LIMIT_SECONDS, latency=LATENCY_SECONDS, tick_size=TICK_SIZE,
+          cancel_rate=QUEUE_CANCEL_RATE, maker_fee=MAKER_FEE, taker_fee=TAKER_FEE):
+    """
+    Replay the chase of one order from order_time and return its row in ORDER_COLUMNS order, or
+    None if the market data does not cover order_time.
+    """
+    times = market["time"]
+    start = bisect.bisect_right(times, order_time)
+    if start == 0 or start >= len(times):
+        return None
+    kinds, trade_prices, trade_amounts, trade_directions = (
+        market["kind"], market["trade_price"], market["trade_amount"], market["trade_direction"])
+    direction = 1 if side == "buy" else -1
+    nears, near_amounts, fars = (
+        (market["bid"], market["bid_amount"], market["ask"]) if direction > 0
+        else (market["ask"], market["ask_amount"], market["bid"]))
+
+    arrival = start - 1
+    mid = (market["bid"][arrival] + market["ask"][arrival]) / 2
+    offset = direction * offset_ticks * tick_size
+    tolerance = tolerance_ticks * tick_size + tick_size * 1e-6
+    deadline = order_time + time_limit
+
+    sent_price = nears[arrival] - offset  # Price of the last placement or edit, what the chase compares with
+    pending_price, pending_at = sent_price, order_time + latency
+    price = None  # Price of the order on the exchange, None until the placement lands
+    queue = 0.0
+    last_time = order_time
+    remaining, passive, notional = amount, 0.0, 0.0
+    reprices = 0
+    finish = None
+
+    for index in range(start, len(times)):
+        now = times[index]
+        if now > deadline:
+            break
+        if pending_price is not None and now >= pending_at:
+            price, pending_price = pending_price, None
+            queue = _queue_ahead(price, nears[index], near_amounts[index], direction)
+        elif cancel_rate and queue:
+            queue *= math.exp(-cancel_rate * (now - last_time))
+        last_time = now
+
+        if kinds[index] == EVENT_TRADE:
+            if price is not None and trade_directions[index] == -direction:
+                trade_price = trade_prices[index]
+                fill = 0.0
+                if direction * (price - trade_price) > 0:
+                    fill = remaining
+                elif trade_price == price:
+                    queue -= trade_amounts[index]
+                    if queue < 0:
+                        fill = min(remaining, -queue)
+                        queue = 0.0
+                if fill:
+                    passive += fill
+                    notional += fill * price
+                    remaining -= fill
+                    if remaining <= 0:
+                        finish = now
+                        break
+            continue
+
+        if price is not None and direction * (fars[index] - price) <= 0:
+            # The opposite best price reached the order: everything in front of it traded
+            passive += remaining
+            notional += remaining * price
+            remaining = 0.0
+            finish = now
+            break
+        target = nears[index] - offset
+        if abs(sent_price - target) > tolerance:
+            sent_price = target
+            pending_price, pending_at = target, now + latency
+            reprices += 1
+
+    market_fallback = remaining > 0
+    if market_fallback:
+        finish = deadline + latency
+        index = max(bisect.bisect_right(times, finish) - 1, 0)
+        notional += remaining * fars[index]
+
+    average_price = notional / amount
+    slippage_bps = direction * (average_price - mid) / mid * 10_000
+    fees_bps = (maker_fee * passive + taker_fee * (amount - passive)) / amount * 10_000
+    return (order_time, direction, amount, passive / amount, finish - order_time, average_price,
+            slippage_bps, slippage_bps + fees_bps, reprices, float(market_fallback))
+
+
+def simulate_orders(market, orders, **params):
+    """
+    Replay the chase of every (order_time, side, amount) of orders with the keyword parameters of
+    chase. Returns a float array with one row per order covered by the market data, in ORDER_COLUMNS order.
+    """
+    rows = [chase(market, order_time, side, amount, **params) for order_time, side, amount in orders]
+    return np.array([row for row in rows if row is not None], dtype=np.float64).reshape(-1, len(ORDER_COLUMNS))
+
+
+def summarize_execution(rows):
+    """
+    Return the execution statistics of the rows of simulate_orders as a dict keyed by
+    EXECUTION_SUMMARY_COLUMNS. fill_rate is the share of orders filled without the market fallback.
+    """
+    if not len(rows):
+        return dict.fromkeys(EXECUTION_SUMMARY_COLUMNS, float("nan"))
+    time_to_fill = rows[:, ORDER_COLUMNS.index("time_to_fill")]
+    slippage = rows[:, ORDER_COLUMNS.index("slippage_bps")]
+    return {
+        "fill_rate": float(1 - rows[:, ORDER_COLUMNS.index("market_fallback")].mean()),
+        "passive_fraction": float(rows[:, ORDER_COLUMNS.index("passive_fraction")].mean()),
+        "time_to_fill_p50": float(np.percentile(time_to_fill, 50)),
+        "time_to_fill_p90": float(np.percentile(time_to_fill, 90)),
+        "slippage_bps_mean": float(slippage.mean()),
+        "slippage_bps_p50": float(np.percentile(slippage, 50)),
+        "slippage_bps_p90": float(np.percentile(slippage, 90)),
+        "slippage_bps_p99": float(np.percentile(slippage, 99)),
+        "cost_bps_mean": float(rows[:, ORDER_COLUMNS.index("cost_bps")].mean()),
+        "reprices_per_order": float(rows[:, ORDER_COLUMNS.index("reprices")].mean()),
+    }
+
+
+def _run_combinations(data, combinations, model):
+    market, orders = data
+    rows = []
+    for offset_ticks, tolerance_ticks, time_limit, latency in combinations:
+        simulated = simulate_orders(market, orders, offset_ticks=offset_ticks,
+                                    tolerance_ticks=tolerance_ticks, time_limit=time_limit, latency=latency, **model)
+        rows.append(summarize_execution(simulated))
+    return rows
+
+
+def sweep_execution(market, orders, offsets=(CHASE_OFFSET_TICKS,), tolerances=(CHASE_TOLERANCE_TICKS,),
+                    time_limits=(TIME_LIMIT_SECONDS,), latencies=(LATENCY_SECONDS,), tick_size=TICK_SIZE,
+                    cancel_rate=QUEUE_CANCEL_RATE, maker_fee=MAKER_FEE, taker_fee=TAKER_FEE, processes=None):
+    """
+    Simulate the orders with every combination of the chase parameters, in parallel across CPU cores.
+
+    Returns:
+    - A DataFrame with one row per combination: PARAMETER_COLUMNS followed by
+      EXECUTION_SUMMARY_COLUMNS, sorted by mean cost.
+    """
+    import pandas as pd
+
+    if min(offsets) < 0:
+        raise ValueError("Offsets must be >= 0: a post-only order cannot rest beyond the best price")
+    model = {"tick_size": tick_size, "cancel_rate": cancel_rate, "maker_fee": maker_fee, "taker_fee": taker_fee}
+    combinations = list(itertools.product(offsets, tolerances, time_limits, latencies))
+    rows = parallel_map(functools.partial(_run_combinations, model=model), combinations, (market, orders), processes)
+
+    parameters = pd.DataFrame(combinations, columns=PARAMETER_COLUMNS)
+    results = pd.concat([parameters, pd.DataFrame(rows, columns=EXECUTION_SUMMARY_COLUMNS)], axis=1)
+    return results.sort_values("cost_bps_mean", ignore_index=True)
@@ -0,0 +1,96 @@
+"""
+Process pool map over the parameter grids of sweep, sweep_execution and walk_forward.
+
+The data every task reads, the bars or the market data, is sent to each worker once through the
+pool initializer instead of with every task. Tasks receive a chunk of items, a few chunks per
+process, which balances the load without paying the task overhead per item. With
+share_memory=True, the numpy arrays of the shared data are copied once into shared memory and
+mapped by the workers without a copy.
+
+Usage:
+    def run_chunk(arrays, combinations, fee_rate):
+        return [simulate(arrays, *combination, fee_rate) for combination in combinations]
+
+    results = parallel_map(functools.partial(run_chunk, fee_rate=FEE_RATE), combinations, arrays)
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+CHUNKS_PER_PROCESS = 4
+
+_worker_shared = None
+_worker_block = None
+
+
+def parallel_map(fn, items, shared, processes=None, share_memory=False):
+    """
+    Call fn(shared, chunk) on chunks of items across worker processes.
+
+    Args:
+    - fn: Picklable function (module level, or a functools.partial of one) returning one result
+      per item of its chunk.
+    - items: The list of items, e.g. parameter combinations.
+    - shared: Data read by every call, sent to each worker once.
+    - processes: Worker processes, all cores by default. With 1, fn runs in this process.
+    - share_memory: With a dict of shared data, map its numpy arrays from shared memory in the
+      workers instead of pickling them.
+
+    Returns:
+    - The list of the results of the items, in the order of items.
+    """
+    processes = max(1, min(processes or os.cpu_count() or 1, len(items)))
+    chunk_size = max(1, len(items) // (processes * CHUNKS_PER_PROCESS))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    if processes == 1:
+        results = [fn(shared, chunk) for chunk in chunks]
+    elif share_memory:
+        block, layout = _share_arrays(shared)
+        others = {name: value for name, value in shared.items() if not isinstance(value, np.ndarray)}
+        try:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                     initargs=(others, block.name, layout)) as pool:
+                results = list(pool.map(_run_chunk, itertools.repeat(fn), chunks))
+        finally:
+            block.close()
+            block.unlink()
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(shared,)) as pool:
+            results = list(pool.map(_run_chunk, itertools.repeat(fn), chunks))
+    return [result for chunk_results in results for result in chunk_results]
+
+
+def _share_arrays(shared):
+    """
+    Copy the numpy arrays of shared into one shared memory block. Returns the block and the layout
+    of the arrays in it.
+    """
+    # The widest dtypes first, so that every array is aligned
+    names = sorted((name for name, value in shared.items() if isinstance(value, np.ndarray)),
+                   key=lambda name: -shared[name].dtype.itemsize)
+    block = shared_memory.SharedMemory(create=True, size=max(1, sum(shared[name].nbytes for name in names)))
+    layout = []
+    offset = 0
+    for name in names:
+        array = shared[name]
+        np.ndarray(array.shape, array.dtype, buffer=block.buf, offset=offset)[:] = array
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += array.nbytes
+    return block, layout
+
+
+def _init_worker(shared, block_name=None, layout=None):
+    global _worker_shared, _worker_block
+    if block_name is not None:
+        _worker_block = shared_memory.SharedMemory(name=block_name)
+        shared = dict(shared, **{name: np.ndarray(shape, dtype, buffer=_worker_block.buf, offset=offset)
+                                 for name, dtype, shape, offset in layout})
+    _worker_shared = shared
+
+
+def _run_chunk(fn, chunk):
+    return fn(_worker_shared, chunk)
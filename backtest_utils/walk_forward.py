@@ -0,0 +1,265 @@
+"""
+Walk-forward optimization of the stop loss, take profit and position size multipliers of
+deribit_utils.execute_trade_logic over the historical signals.
+
+The bars are split into rolling windows: train_bars followed by test_bars, moved forward by
+step_bars (test_bars by default, so the test periods follow each other without overlapping). In
+each window every combination of the grid is backtested over the train bars, the best one by
+`objective` is kept and backtested alone over the test bars. Every backtest starts flat with an
+equity of 1 BTC, under the rules of backtest.simulate.
+
+Two things keep a grid of 10k combinations over years of hourly bars within minutes:
+- The trades of a backtest, their entries, exits and prices, only depend on the stop loss and the
+  take profit. The multipliers only scale the PnL of each trade. The trades are simulated once per
+  (stop loss, take profit) pair, then every (long, short) multiplier pair is evaluated at once with
+  array operations over the trades and bars, in evaluate_multipliers.
+- The bars are copied once into shared memory, by parallel.parallel_map. The worker processes
+  map them without a copy and receive only chunks of (window bounds, stop loss, take profit) per task.
+
+Usage:
+    results = walk_forward(df, train_bars=365 * 24, test_bars=90 * 24,
+                           stop_losses=[0.05, 0.09], take_profits=[0.09, 0.15],
+                           long_multipliers=[1, 2], short_multipliers=[2, 4])
+
+    python -m backtest_utils.walk_forward --start 2019-01-01 --train-days 365 --test-days 90
+"""
+import argparse
+import functools
+import itertools
+
+import numpy as np
+
+from backtest_utils.backtest import (
+    BARS_PER_YEAR,
+    EXIT_REVERSAL,
+    EXIT_STOP_LOSS,
+    EXIT_TAKE_PROFIT,
+    FEE_RATE,
+    SUMMARY_COLUMNS,
+    TRADE_COLUMNS,
+    prepare_arrays,
+    simulate,
+    summarize,
+)
+from backtest_utils.parallel import parallel_map
+from deribit_utils.deribit_utils import (
+    LONG_SIZE_MULTIPLIER,
+    SHORT_SIZE_MULTIPLIER,
+    STOP_LOSS_PERCENTAGE,
+    TAKE_PROFIT_PERCENTAGE,
+)
+
+SIGNAL_TABLE = "signals-etl.btc_perpetual_binance.master_signals_ao_1h"
+SIGNAL_COLUMNS = ["open_time", "open", "high", "low", "close", "Long_Entry", "Short_Entry"]
+
+PARAMETER_COLUMNS = ["stop_loss", "take_profit", "long_multiplier", "short_multiplier"]
+WINDOW_COLUMNS = ["train_start", "train_end", "test_start", "test_end"]
+
+_TRADE = {column: i for i, column in enumerate(TRADE_COLUMNS)}
+
+
+def walk_forward_windows(n_bars, train_bars, test_bars, step_bars=None):
+    """
+    Return the (train_start, train_end, test_start, test_end) bar bounds of each window, ends
+    excluded. The test bars directly follow the train bars, and the last test period is cut short
+    at the end of the data.
+    """
+    step_bars = step_bars or test_bars
+    windows = []
+    start = 0
+    while start + train_bars < n_bars:
+        train_end = start + train_bars
+        windows.append((start, train_end, train_end, min(train_end + test_bars, n_bars)))
+        start += step_bars
+    return windows
+
+
+def trade_path(arrays, stop_loss, take_profit):
+    """
+    Simulate the trades of a (stop loss, take profit) pair, independently of the multipliers.
+    With no leverage the equity never changes, so no trade is cut short by a ruined account.
+    """
+    trades, _, _ = simulate(arrays, stop_loss, take_profit, long_multiplier=0, short_multiplier=0)
+    return trades
+
+
+def evaluate_multipliers(trades, close, long_multipliers, short_multipliers, fee_rate=FEE_RATE,
+                         initial_equity=1.0, bars_per_year=BARS_PER_YEAR):
+    """
+    Summarize the trades of a trade_path for many multiplier pairs at once, with the same results
+    as simulate and summarize run for each pair.
+
+    Args:
+    - trades: Output of trade_path.
+    - close: Close prices of the bars the trades were simulated on.
+    - long_multipliers, short_multipliers: Sequences of equal length, one multiplier pair per row.
+    - fee_rate, initial_equity, bars_per_year: As in simulate and summarize.
+
+    Returns:
+    - A float array with one row per multiplier pair, in SUMMARY_COLUMNS order.
+    """
+    n = len(close)
+    direction = trades[:, _TRADE["direction"]]
+    entry_price = trades[:, _TRADE["entry_price"]]
+    ratio = entry_price / trades[:, _TRADE["exit_price"]]
+    leverage = np.where(direction > 0, np.asarray(long_multipliers, dtype=np.float64)[:, None],
+                        np.asarray(short_multipliers, dtype=np.float64)[:, None])
+
+    # Each trade multiplies the equity by a factor, and a ruined account stays at zero
+    factors = np.maximum(1 + direction * leverage * (1 - ratio) - leverage * fee_rate * (1 + ratio), 0.0)
+    realized = initial_equity * np.hstack([np.ones((len(leverage), 1)), np.cumprod(factors, axis=1)])
+    equity_before, equity_after = realized[:, :-1], realized[:, 1:]
+
+    # Realized equity of the last exit at or before each bar, then open positions marked to the close
+    entry_bars = trades[:, _TRADE["entry_bar"]].astype(np.int64)
+    exit_bars = trades[:, _TRADE["exit_bar"]].astype(np.int64)
+    equity = realized[:, np.searchsorted(exit_bars, np.arange(n), side="right")]
+    lengths = exit_bars - entry_bars
+    holding = np.repeat(np.arange(len(trades)), lengths)
+    bars = entry_bars[holding] + np.arange(len(holding)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    equity[:, bars] = equity_before[:, holding] * (
+        1 + direction[holding] * leverage[:, holding] * (1 - entry_price[holding] / close[bars])
+        - leverage[:, holding] * fee_rate
+    )
+    equity = np.maximum(equity, 0.0)
+
+    previous = equity[:, :-1]
+    returns = np.diff(equity, axis=1) / np.where(previous > 0, previous, np.nan)
+    valid = np.isfinite(returns)
+    counts = np.maximum(valid.sum(axis=1), 1)
+    mean = np.where(valid, returns, 0.0).sum(axis=1) / counts
+    volatility = np.sqrt(np.where(valid, (returns - mean[:, None]) ** 2, 0.0).sum(axis=1) / counts)
+
+    # Trades after a ruin are never taken
+    taken = equity_before > 0
+    n_trades = taken.sum(axis=1)
+    exit_reasons = trades[:, _TRADE["exit_reason"]]
+    summary = {
+        "total_return": equity[:, -1] / equity[:, 0] - 1,
+        "max_drawdown": (equity / np.maximum.accumulate(equity, axis=1) - 1).min(axis=1),
+        "sharpe": np.where(volatility > 0, mean / np.where(volatility > 0, volatility, 1), 0.0) * np.sqrt(bars_per_year),
+        "n_trades": n_trades,
+        "win_rate": ((equity_after > equity_before) & taken).sum(axis=1) / np.maximum(n_trades, 1),
+        "stop_losses": (taken & (exit_reasons == EXIT_STOP_LOSS)).sum(axis=1),
+        "take_profits": (taken & (exit_reasons == EXIT_TAKE_PROFIT)).sum(axis=1),
+        "reversals": (taken & (exit_reasons == EXIT_REVERSAL)).sum(axis=1),
+        "fees": (leverage * equity_before * fee_rate * (1 + ratio)).sum(axis=1),
+    }
+    return np.column_stack([summary[column] for column in SUMMARY_COLUMNS]).astype(np.float64)
+
+
+def _run_pairs(arrays, tasks, multipliers, fee_rate, bars_per_year):
+    longs, shorts = zip(*multipliers)
+    results = []
+    for (start, end), (stop_loss, take_profit) in tasks:
+        window = {name: array[start:end] for name, array in arrays.items()}
+        results.append(evaluate_multipliers(trade_path(window, stop_loss, take_profit), window["close"], longs, shorts,
+                                            fee_rate, bars_per_year=bars_per_year))
+    return results
+
+
+def walk_forward(df, train_bars, test_bars, step_bars=None,
+                 stop_losses=(STOP_LOSS_PERCENTAGE,), take_profits=(TAKE_PROFIT_PERCENTAGE,),
+                 long_multipliers=(LONG_SIZE_MULTIPLIER,), short_multipliers=(SHORT_SIZE_MULTIPLIER,),
+                 objective="sharpe", fee_rate=FEE_RATE, bars_per_year=BARS_PER_YEAR, processes=None,
+                 long_column="Long_Entry", short_column="Short_Entry"):
+    """
+    Choose the best parameters on the train bars of each window and backtest them on its test bars.
+
+    Args:
+    - df: DataFrame of hourly bars and signals, oldest bar first, as for backtest.backtest.
+    - train_bars, test_bars, step_bars: Window sizes in bars, see walk_forward_windows.
+    - stop_losses, take_profits, long_multipliers, short_multipliers: The grid, every combination
+      of which is backtested on each train period.
+    - objective: Column of SUMMARY_COLUMNS maximized on the train bars. The Sharpe ratio by
+      default, since the total return always favours the highest multipliers of a winning rule.
+    - processes: Worker processes, all cores by default.
+
+    Returns:
+    - A DataFrame with one row per window: the bounds of its train and test periods (times of df's
+      index, ends excluded, the last test end being the last bar), the chosen PARAMETER_COLUMNS,
+      then SUMMARY_COLUMNS prefixed with train_ and test_.
+    """
+    import pandas as pd
+
+    if objective not in SUMMARY_COLUMNS:
+        raise ValueError(f"objective must be one of {SUMMARY_COLUMNS}")
+    arrays = prepare_arrays(df, long_column, short_column)
+    windows = walk_forward_windows(len(df), train_bars, test_bars, step_bars)
+    if not windows:
+        raise ValueError(f"{len(df)} bars do not fit one window of {train_bars} train bars and a test bar")
+    pairs = list(itertools.product(stop_losses, take_profits))
+    multipliers = list(itertools.product(long_multipliers, short_multipliers))
+    combinations = [pair + multiplier for pair in pairs for multiplier in multipliers]
+
+    tasks = [((train_start, train_end), pair) for train_start, train_end, _, _ in windows for pair in pairs]
+    run_pairs = functools.partial(_run_pairs, multipliers=multipliers, fee_rate=fee_rate, bars_per_year=bars_per_year)
+    results = parallel_map(run_pairs, tasks, arrays, processes, share_memory=True)
+
+    rows = []
+    objective_column = SUMMARY_COLUMNS.index(objective)
+    for i, (train_start, train_end, test_start, test_end) in enumerate(windows):
+        train = np.vstack(results[i * len(pairs):(i + 1) * len(pairs)])
+        best = int(np.argmax(train[:, objective_column]))
+        stop_loss, take_profit, long_multiplier, short_multiplier = combinations[best]
+        test_arrays = {name: array[test_start:test_end] for name, array in arrays.items()}
+        trades, equity, _ = simulate(test_arrays, stop_loss, take_profit, long_multiplier, short_multiplier, fee_rate)
+        test = summarize(trades, equity, bars_per_year)
+        rows.append({
+            "train_start": df.index[train_start],
+            "train_end": df.index[train_end],
+            "test_start": df.index[test_start],
+            "test_end": df.index[min(test_end, len(df) - 1)],
+            "stop_loss": stop_loss,
+            "take_profit": take_profit,
+            "long_multiplier": long_multiplier,
+            "short_multiplier": short_multiplier,
+            **{f"train_{column}": train[best, j] for j, column in enumerate(SUMMARY_COLUMNS)},
+            **{f"test_{column}": value for column, value in test.items()},
+        })
+    return pd.DataFrame(rows)
+
+
+def _grid(start, stop, step):
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward optimization of the stop loss, take profit and "
+                                                 "size multipliers over the signals table.")
+    parser.add_argument("--table", default=SIGNAL_TABLE)
+    parser.add_argument("--start", default=None, help="First bar, e.g. 2019-01-01")
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--train-days", type=int, default=365)
+    parser.add_argument("--test-days", type=int, default=90)
+    parser.add_argument("--stop-losses", type=float, nargs=3, default=(0.01, 0.2, 0.01), metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--take-profits", type=float, nargs=3, default=(0.01, 0.2, 0.01), metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--long-multipliers", type=float, nargs=3, default=(1, 5, 1), metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--short-multipliers", type=float, nargs=3, default=(1, 5, 1), metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--objective", default="sharpe", choices=SUMMARY_COLUMNS)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    from bigquery_utils.arrow_cache import cache
+
+    def bound(value):
+        return pd.Timestamp(value, tz="UTC").to_pydatetime() if value else None
+
+    table = cache.read_range(args.table, "open_time", start=bound(args.start), end=bound(args.end),
+                             columns=SIGNAL_COLUMNS)
+    df = table.to_pandas().sort_values("open_time").set_index("open_time")
+    results = walk_forward(df, args.train_days * 24, args.test_days * 24,
+                           stop_losses=_grid(*args.stop_losses), take_profits=_grid(*args.take_profits),
+                           long_multipliers=_grid(*args.long_multipliers),
+                           short_multipliers=_grid(*args.short_multipliers),
+                           objective=args.objective, processes=args.processes)
+    pd.set_option("display.width", 200)
+    print(results[WINDOW_COLUMNS[::2] + PARAMETER_COLUMNS + [f"train_{args.objective}", "test_total_return",
+                                                              "test_max_drawdown", "test_sharpe"]].to_string(index=False))
+    print(f"out of sample: {(1 + results['test_total_return']).prod() - 1:.2%} over {len(results)} test periods")
+
+
+if __name__ == "__main__":
+    main()
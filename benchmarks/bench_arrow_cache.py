@@ -0,0 +1,116 @@
+"""
+Measure the Arrow cache of historical signals: a cold read that fills the cache, warm reads
+served from the memory-mapped segments, and an incremental refresh after new bars are added.
+
+BigQuery is replaced by an in-memory table answering the cache queries after --query-latency
+seconds, the typical round trip of a small query.
+
+Usage:
+    python -m benchmarks.bench_arrow_cache --years 5 --query-latency 1.5
+"""
+import argparse
+import datetime
+import re
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bigquery_utils.arrow_cache import ArrowCache
+
+TABLE_ID = "signals-etl.btc_perpetual_binance.master_signals_ao_1h"
+
+
+def hourly_signals(start, hours, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.006, hours)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.004, hours)) * close
+    long_entry = rng.random(hours) < 0.05
+    return pa.table({
+        "open_time": pa.array(start + np.arange(hours) * np.timedelta64(1, "h"), pa.timestamp("us", tz="UTC")),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "Long_Entry": long_entry,
+        "Short_Entry": ~long_entry & (rng.random(hours) < 0.05),
+    })
+
+
+class FakeWarehouse:
+    """
+    Serves the range queries of ArrowCache from an in-memory table, after a fixed latency.
+    """
+
+    def __init__(self, table, latency):
+        self.table = table
+        self.latency = latency
+        self.modified = datetime.datetime.now(datetime.timezone.utc)
+        self.queries = 0
+
+    def append(self, rows):
+        self.table = pa.concat_tables([self.table, rows])
+        self.modified = datetime.datetime.now(datetime.timezone.utc)
+
+    def query(self, sql, parameters):
+        time.sleep(self.latency)
+        self.queries += 1
+        column = self.table.column("open_time")
+        mask = pc.greater_equal(column, pc.min(column))
+        lower = re.search(r"open_time (>=?) @lower", sql)
+        if lower:
+            compare = pc.greater if lower.group(1) == ">" else pc.greater_equal
+            mask = pc.and_(mask, compare(column, pa.scalar(parameters["lower"], column.type)))
+        if "@upper" in sql:
+            mask = pc.and_(mask, pc.less(column, pa.scalar(parameters["upper"], column.type)))
+        return self.table.filter(mask)
+
+    def table_modified(self, table_id):
+        return self.modified
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--query-latency", type=float, default=1.5)
+    args = parser.parse_args()
+
+    hours = int(args.years * 365 * 24)
+    start = np.datetime64("2019-01-01T00:00:00", "us")
+    warehouse = FakeWarehouse(hourly_signals(start, hours), args.query_latency)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ArrowCache(cache_dir, query=warehouse.query, table_modified=warehouse.table_modified)
+
+        table, cold = timed(lambda: cache.read_range(TABLE_ID, "open_time"))
+        print(f"cold read: {table.num_rows} rows in {cold:.3f}s ({warehouse.queries} query)")
+
+        table, warm = timed(lambda: cache.read_range(TABLE_ID, "open_time"))
+        print(f"warm read: {table.num_rows} rows in {warm * 1000:.2f}ms ({warehouse.queries} queries so far)")
+
+        last_year = datetime.datetime(2019 + int(args.years) - 1, 1, 1, tzinfo=datetime.timezone.utc)
+        table, ranged = timed(lambda: cache.read_range(TABLE_ID, "open_time", start=last_year, refresh=False))
+        print(f"range read of the last year: {table.num_rows} rows in {ranged * 1000:.2f}ms")
+
+        df, to_pandas = timed(table.to_pandas)
+        print(f"to_pandas of the range: {to_pandas * 1000:.2f}ms")
+
+        warehouse.append(hourly_signals(start + hours * np.timedelta64(1, "h"), 24, seed=8))
+        table, incremental = timed(lambda: cache.read_range(TABLE_ID, "open_time"))
+        print(f"incremental refresh of 24 new bars: {table.num_rows} rows in {incremental:.3f}s "
+              f"({warehouse.queries} queries so far)")
+
+    print(f"warm read {cold / warm:.0f}x faster than the cold read")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Measure the encode and decode throughput of the Deribit messages: the previous stdlib json path
+against deribit_utils.codec, with pre-serialized request templates and typed records.
+
+Usage:
+    python -m benchmarks.bench_codec --messages 200000
+"""
+import argparse
+import json
+import time
+
+from deribit_utils import codec
+from deribit_utils.deribit_utils import EDIT_ORDER_PARAMS, LIMIT_ORDER_PARAMS
+from deribit_utils.records import Order, Ticker
+
+TICKER_NOTIFICATION = json.dumps({
+    "jsonrpc": "2.0", "method": "subscription", "params": {
+        "channel": "ticker.BTC-PERPETUAL.raw",
+        "data": {
+            "timestamp": 1700000000123, "stats": {"volume_usd": 412345670.0, "volume": 13912.5, "price_change": 1.25,
+                                                  "low": 29410.5, "high": 30123.0},
+            "state": "open", "settlement_price": 29876.12, "open_interest": 612345670, "min_price": 29512.5,
+            "max_price": 30412.5, "mark_price": 29961.27, "last_price": 29961.5, "interest_value": 0.0123,
+            "instrument_name": "BTC-PERPETUAL", "index_price": 29958.33, "funding_8h": 0.00001, "estimated_delivery_price": 29958.33,
+            "current_funding": 0.0, "best_bid_price": 29961.0, "best_bid_amount": 125430.0, "best_ask_price": 29961.5,
+            "best_ask_amount": 98210.0
+        }
+    }
+})
+
+ORDER_RESPONSE = json.dumps({
+    "jsonrpc": "2.0", "id": 4213, "result": {"trades": [], "order": {
+        "web": False, "time_in_force": "good_til_cancelled", "replaced": True, "reduce_only": False,
+        "price": 29960.0, "post_only": True, "order_type": "limit", "order_state": "open", "order_id": "USDC-1234567",
+        "max_show": 12340, "last_update_timestamp": 1700000000456, "label": "b14", "is_liquidation": False,
+        "instrument_name": "BTC-PERPETUAL", "filled_amount": 0, "direction": "buy", "creation_timestamp": 1700000000001,
+        "average_price": 0.0, "api": True, "amount": 12340
+    }}
+})
+
+
+def per_second(function, messages):
+    start = time.perf_counter()
+    for i in range(messages):
+        function(i)
+    return messages / (time.perf_counter() - start)
+
+
+def encode_limit_order_json(request_id):
+    # The request as the client built it before: a fresh nested dict, then json.dumps
+    return json.dumps({"jsonrpc": "2.0", "id": request_id, "method": "private/buy", "params": {
+        "instrument_name": "BTC-PERPETUAL", "amount": 12340, "type": "limit", "price": 29960.0,
+        "post_only": True, "time_in_force": "good_til_cancelled", "reduce_only": False
+    }})
+
+
+def encode_limit_order_template(request_id):
+    return codec.encode_request(request_id, "private/buy", LIMIT_ORDER_PARAMS(
+        instrument_name="BTC-PERPETUAL", amount=12340, price=29960.0
+    ))
+
+
+def encode_edit_json(request_id):
+    return json.dumps({"jsonrpc": "2.0", "id": request_id, "method": "private/edit", "params": {
+        "order_id": "USDC-1234567", "amount": 12340, "price": 29960.5, "post_only": True
+    }})
+
+
+def encode_edit_template(request_id):
+    return codec.encode_request(request_id, "private/edit", EDIT_ORDER_PARAMS(
+        order_id="USDC-1234567", amount=12340, price=29960.5
+    ))
+
+
+def decode_ticker_json(_):
+    data = json.loads(TICKER_NOTIFICATION)["params"]["data"]
+    return data.get("best_bid_price"), data.get("best_ask_price")
+
+
+def decode_ticker_record(_):
+    ticker = Ticker.from_dict(codec.loads(TICKER_NOTIFICATION)["params"]["data"])
+    return ticker.best_bid_price, ticker.best_ask_price
+
+
+def decode_order_json(_):
+    return json.loads(ORDER_RESPONSE)["result"]["order"]
+
+
+def decode_order_record(_):
+    return Order.from_dict(codec.loads(ORDER_RESPONSE)["result"]["order"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    # Both paths must produce the same message
+    assert json.loads(encode_limit_order_template(7)) == json.loads(encode_limit_order_json(7))
+    assert json.loads(encode_edit_template(7)) == json.loads(encode_edit_json(7))
+
+    print(f"codec: {codec.name}")
+    for label, before, after in (
+        ("encode limit order", encode_limit_order_json, encode_limit_order_template),
+        ("encode edit", encode_edit_json, encode_edit_template),
+        ("decode ticker", decode_ticker_json, decode_ticker_record),
+        ("decode order", decode_order_json, decode_order_record),
+    ):
+        before_rate = per_second(before, args.messages)
+        after_rate = per_second(after, args.messages)
+        print(f"{label}: {before_rate:,.0f}/s with json, {after_rate:,.0f}/s with the codec "
+              f"({after_rate / before_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Sweep the order chase parameters with the execution simulator over synthetic book and trade
+streams, and time the sweep across all CPU cores.
+
+The streams mimic BTC-PERPETUAL around the hour: the mid price moves by whole ticks, the spread
+is mostly one tick, and trades hit the best bid or ask, a move of the mid sweeping the level it
+leaves. One order arrives at the start of every hour, alternating buys and sells.
+
+Usage:
+    python -m benchmarks.bench_execution --hours 48 --processes 8
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest_utils.execution import (PARAMETER_COLUMNS, prepare_market_data, summarize_execution, simulate_orders,
+                                      sweep_execution)
+from deribit_utils.deribit_utils import CHASE_OFFSET_TICKS, CHASE_TOLERANCE_TICKS, TIME_LIMIT_SECONDS
+
+TICK_SIZE = 0.5
+START_TIME = 1_700_000_000
+
+
+def synthetic_streams(hours, events_per_second=4, move_probability=0.15, trade_probability=0.3, seed=7):
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 * events_per_second)
+    timestamps = START_TIME * 1000 + np.cumsum(rng.exponential(1000 / events_per_second, n)).astype(np.int64)
+    moves = np.where(rng.random(n) < move_probability, rng.choice([-1, 1], n), 0)
+    mid_ticks = 60000 + np.cumsum(moves)
+    spread_ticks = np.where(rng.random(n) < 0.9, 1, 2)
+    bid = (mid_ticks - spread_ticks // 2) * TICK_SIZE
+    ask = bid + spread_ticks * TICK_SIZE
+    book = pd.DataFrame({
+        "timestamp": timestamps,
+        "best_bid_price": bid,
+        "best_bid_amount": np.round(rng.lognormal(10, 1, n) / 10) * 10,
+        "best_ask_price": ask,
+        "best_ask_amount": np.round(rng.lognormal(10, 1, n) / 10) * 10,
+    })
+
+    # Random trades at the best prices, plus the trade sweeping the level a move leaves
+    traded = rng.random(n) < trade_probability
+    sweep = moves != 0
+    previous_bid = np.r_[bid[0], bid[:-1]]
+    previous_ask = np.r_[ask[0], ask[:-1]]
+    buy = np.where(sweep, moves > 0, rng.random(n) < 0.5)
+    rows = traded | sweep
+    trades = pd.DataFrame({
+        "timestamp": timestamps[rows] - 1,
+        "price": np.where(buy, previous_ask, previous_bid)[rows],
+        "amount": np.where(sweep, 1e9, np.round(rng.lognormal(8, 1.5, n) / 10) * 10)[rows],
+        "direction": np.where(buy, "buy", "sell")[rows],
+    })
+    return book, trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=float, default=48)
+    parser.add_argument("--amount", type=float, default=50_000, help="USD contracts per order")
+    parser.add_argument("--cancel-rate", type=float, default=0.02, help="Share of the queue ahead cancelled per second")
+    parser.add_argument("--processes", type=int, default=None, help="Sweep worker processes, all cores by default")
+    args = parser.parse_args()
+
+    book, trades = synthetic_streams(args.hours)
+    market = prepare_market_data(book, trades)
+    orders = [(START_TIME + 3600 * hour + 1, "buy" if hour % 2 else "sell", args.amount)
+              for hour in range(int(args.hours))]
+    print(f"{len(market['time'])} book and trade events, {len(orders)} orders")
+
+    start = time.perf_counter()
+    current = summarize_execution(simulate_orders(market, orders, tick_size=TICK_SIZE, cancel_rate=args.cancel_rate))
+    print(f"current parameters (offset {CHASE_OFFSET_TICKS}, tolerance {CHASE_TOLERANCE_TICKS}, "
+          f"time limit {TIME_LIMIT_SECONDS}s): {time.perf_counter() - start:.3f}s")
+    print(pd.Series(current).round(3).to_string())
+
+    grid = {
+        "offsets": range(0, 6),
+        "tolerances": range(0, 5),
+        "time_limits": [15, 30, 60, 120, 200, 300, 600],
+        "latencies": [0.01, 0.05, 0.2],
+    }
+    start = time.perf_counter()
+    results = sweep_execution(market, orders, tick_size=TICK_SIZE, cancel_rate=args.cancel_rate,
+                              processes=args.processes, **grid)
+    elapsed = time.perf_counter() - start
+    print(f"\nsweep of {len(results)} combinations: {elapsed:.2f}s, {len(results) / elapsed:.0f} combinations/s")
+    columns = PARAMETER_COLUMNS + ["fill_rate", "time_to_fill_p50", "slippage_bps_p50", "slippage_bps_p99",
+                                   "cost_bps_mean", "reprices_per_order"]
+    print(results[columns].head(10).round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Check that a signal bar is traded once however its triggers are delivered, and time how fast
+the duplicates exit.
+
+Against the simulated exchange, one signal bar receives:
+- its trigger, which trades the bar (a position reversal)
+- a second trigger for the same bar, while the first run is going
+- the first trigger delivered again after the 20s ack deadline
+- a trigger on another instance after the first run, with a ledger of its own, where only the
+  labels of the orders on the exchange show that the bar was traded
+
+Usage:
+    python -m benchmarks.bench_idempotency --claims 2000
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.bench_replay import random_walk_ticks
+from deribit_utils import deribit_utils
+from deribit_utils.client import DeribitClient
+from deribit_utils.simulator import SimulatedExchange, run_simulation
+from gcp_utils.run_ledger import LocalRunStore, RunLedger
+
+START_TIME = 1_700_000_000
+ORDER_METHODS = ("private/buy", "private/sell")
+
+
+def bench_claims(count):
+    ledger = RunLedger(LocalRunStore(tempfile.mkdtemp(prefix="runs_")))
+    first, duplicate = [], []
+    for i in range(count):
+        start = time.perf_counter()
+        claim = ledger.claim(f"b14-bench-{i}")
+        first.append(time.perf_counter() - start)
+        ledger.complete(claim)
+        start = time.perf_counter()
+        assert not ledger.claim(f"b14-bench-{i}")
+        duplicate.append(time.perf_counter() - start)
+    for name, times in (("new key claim", first), ("duplicate claim", duplicate)):
+        times.sort()
+        print(f"{name}: p50 {statistics.median(times) * 1000:.3f}ms, p99 {times[int(len(times) * 0.99)] * 1000:.3f}ms")
+
+
+def bench_redelivery():
+    exchange = SimulatedExchange(random_walk_ticks(START_TIME, 1, 5))
+    exchange.position_size = -1000  # Short, so the long signal reverses the position
+    exchange.position_price = exchange._prices[0]
+    ledger = RunLedger(LocalRunStore(tempfile.mkdtemp(prefix="runs_")))
+    other_instance = RunLedger(LocalRunStore(tempfile.mkdtemp(prefix="runs_")))
+    bar = pd.DataFrame({"open_time": [START_TIME], "Long_Entry": [True], "Short_Entry": [False]})
+    outcomes = []
+
+    async def trigger(message_id, run_ledger):
+        # The Cloud Function flow, with the signal read replaced by the bar
+        start = time.perf_counter()
+        trigger_claim = run_ledger.claim(f"trigger-{message_id}")
+        if not trigger_claim:
+            outcomes.append((message_id, f"trigger {trigger_claim.state}", time.perf_counter() - start))
+            return
+        with run_ledger.running(trigger_claim):
+            run = run_ledger.claim(deribit_utils.signal_run_key(bar), trigger=message_id)
+            if not run:
+                outcomes.append((message_id, f"bar {run.state}", time.perf_counter() - start))
+                return
+            with run_ledger.running(run):
+                orders_before = sum(exchange.request_counts[method] for method in ORDER_METHODS)
+                async with DeribitClient(exchange.connect()) as client:
+                    await deribit_utils.authenticate("simulator", "simulator", client=client)
+                    await deribit_utils.execute_trade_logic(client, bar)
+                orders = sum(exchange.request_counts[method] for method in ORDER_METHODS) - orders_before
+                outcomes.append((message_id, f"traded, {orders} orders sent", time.perf_counter() - start))
+
+    async def run():
+        exchange.start()
+        first = asyncio.ensure_future(trigger("m1", ledger))
+        await asyncio.sleep(0.01)
+        await trigger("m2", ledger)  # Another trigger for the same bar
+        await asyncio.sleep(20)
+        await trigger("m1", ledger)  # Redelivered after the ack deadline
+        await first
+        await trigger("m3", other_instance)  # Another instance, another ledger
+        await exchange.stop()
+
+    run_simulation(run(), start_time=START_TIME)
+    for message_id, outcome, seconds in outcomes:
+        print(f"trigger {message_id}: {outcome} in {seconds * 1000:.2f}ms")
+    orders = [order for order in exchange.orders.values() if order["label"]]
+    print(f"{len(orders)} orders on the exchange, labels {sorted(order['label'] for order in orders)}")
+    assert len(orders) == sum(exchange.request_counts[method] for method in ORDER_METHODS)
+    assert len({order["label"] for order in orders}) == len(orders), "Order labels are not unique"
+    assert sum(outcome.startswith("traded, 0") for _, outcome, _ in outcomes) == 1, "The last trigger traded again"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--claims", type=int, default=2000)
+    args = parser.parse_args()
+    bench_claims(args.claims)
+    bench_redelivery()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure what the trade journal costs the trading path: the time of journal.append while the
+background task flushes batches to a slow writer.
+
+Usage:
+    python -m benchmarks.bench_journal --events 10000 --write-ms 200
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from bigquery_utils.journal import TradeJournal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--write-ms", type=float, default=200, help="Simulated duration of one BigQuery load job")
+    args = parser.parse_args()
+
+    batches = []
+
+    def slow_writer(table_id, rows):
+        time.sleep(args.write_ms / 1000)
+        batches.append(len(rows))
+        return True
+
+    async def run(journal):
+        order = {"instrument_name": "BTC-PERPETUAL", "side": "buy", "order_id": "12345", "order_type": "limit",
+                 "order_state": "open", "price": 29960.0, "amount": 12340, "label": "b14"}
+        worst = 0.0
+        start = time.perf_counter()
+        for i in range(args.events):
+            append_start = time.perf_counter()
+            journal.append("order", **order)
+            worst = max(worst, time.perf_counter() - append_start)
+            if i % 100 == 0:
+                await asyncio.sleep(0)  # Let the loop run, as the trading path does between requests
+        elapsed = time.perf_counter() - start
+        close_start = time.perf_counter()
+        await journal.close()
+        return elapsed, worst, time.perf_counter() - close_start
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        journal = TradeJournal("project.dataset.trade_journal", spill_dir=spill_dir, writer=slow_writer)
+        elapsed, worst, close_seconds = asyncio.run(run(journal))
+
+    print(f"append: {elapsed / args.events * 1e6:.2f}us per event, worst {worst * 1e6:.0f}us")
+    print(f"flushed {sum(batches)} rows in {len(batches)} batches, final flush {close_seconds:.3f}s")
+    print(journal.metrics())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Apply synthetic incremental `book` messages to LocalOrderBook and report the throughput,
+compared with the update rates of the BTC-PERPETUAL raw book feed, and the query latencies.
+
+Usage:
+    python -m benchmarks.bench_order_book --levels 2000 --messages 200000
+"""
+import argparse
+import random
+import time
+
+from deribit_utils.order_book import LocalOrderBook
+
+LIVE_MESSAGES_PER_SECOND = 500  # Busy periods of book.BTC-PERPETUAL.raw; 100ms batches arrive 10 times per second
+
+
+def synthetic_book_messages(levels, messages, changes_per_message=4, mid=30000.0, tick_size=0.5, seed=7):
+    """
+    A snapshot of levels price levels per side, followed by change messages that mostly touch
+    the levels near the top of the book, as the live feed does.
+    """
+    rng = random.Random(seed)
+    bids = {mid - tick_size * (i + 1): rng.randrange(10, 100_000, 10) for i in range(levels)}
+    asks = {mid + tick_size * (i + 1): rng.randrange(10, 100_000, 10) for i in range(levels)}
+    yield {
+        "type": "snapshot", "change_id": 0,
+        "bids": [["new", price, amount] for price, amount in bids.items()],
+        "asks": [["new", price, amount] for price, amount in asks.items()]
+    }
+    for change_id in range(1, messages + 1):
+        message = {"type": "change", "prev_change_id": change_id - 1, "change_id": change_id, "bids": [], "asks": []}
+        for _ in range(changes_per_message):
+            is_bid = rng.random() < 0.5
+            side, sign = (bids, -1) if is_bid else (asks, 1)
+            price = mid + sign * tick_size * (1 + int(rng.expovariate(1 / 20)))
+            if price in side and rng.random() < 0.3:
+                del side[price]
+                change = ["delete", price, 0]
+            else:
+                change = ["change" if price in side else "new", price, rng.randrange(10, 100_000, 10)]
+                side[price] = change[2]
+            message["bids" if is_bid else "asks"].append(change)
+        yield message
+
+
+def time_per_call_us(function, repeat=10_000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", type=int, default=2000, help="Price levels per side in the snapshot")
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    messages = list(synthetic_book_messages(args.levels, args.messages))
+    book = LocalOrderBook("BTC-PERPETUAL")
+    book.on_message(book.channel, messages[0])
+
+    start = time.perf_counter()
+    for message in messages[1:]:
+        book.on_message(book.channel, message)
+    elapsed = time.perf_counter() - start
+
+    rate = args.messages / elapsed
+    print(f"applied {args.messages} messages in {elapsed:.2f}s: {rate:,.0f} messages/s, "
+          f"{elapsed / args.messages * 1e6:.2f}us per message")
+    print(f"headroom over {LIVE_MESSAGES_PER_SECOND} messages/s live rate: {rate / LIVE_MESSAGES_PER_SECOND:,.0f}x")
+    print(f"book: {len(book.bids)} bids, {len(book.asks)} asks, resyncs: {book.resyncs}")
+    print(f"best bid/ask: {time_per_call_us(book.best_bid):.2f}us, "
+          f"depth_at_price: {time_per_call_us(lambda: book.depth_at_price(book.best_bid() - 5)):.2f}us, "
+          f"depth_to_price: {time_per_call_us(lambda: book.depth_to_price('buy', book.best_ask() + 50)):.2f}us, "
+          f"vwap_to_size(100k): {time_per_call_us(lambda: book.vwap_to_size('buy', 100_000)):.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measure the reconnect-to-ready time of a SessionManager against the simulated exchange: the
+connection, with an order book and the order state subscriptions, is dropped repeatedly and
+reopened, re-authenticated and resubscribed. Times are on the simulated clock, so they count
+round trips of --latency-ms rather than CPU time.
+
+Usage:
+    python -m benchmarks.bench_reconnect --drops 20 --latency-ms 25
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+
+from benchmarks.bench_replay import random_walk_ticks
+from deribit_utils.order_book import LocalOrderBook
+from deribit_utils.session import SessionManager
+from deribit_utils.simulator import SimulatedExchange, run_simulation
+from deribit_utils.state_tracker import get_state_tracker
+
+START_TIME = 1_700_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--drops", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=25)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)  # One warning per drop otherwise
+
+    exchange = SimulatedExchange(random_walk_ticks(START_TIME, 1, 60))
+    exchange.latency = args.latency_ms / 1000
+
+    async def run():
+        exchange.start()
+        session = SessionManager("simulator", "simulator", connect=exchange.connect)
+        client = await session.start()
+        book = LocalOrderBook(exchange.instrument_name)
+        await book.start(client)
+        await get_state_tracker(client, exchange.instrument_name)
+
+        ready_times = []
+        for _ in range(args.drops):
+            exchange.drop_connections()
+            await asyncio.sleep(0)
+            while session.reconnects == len(ready_times):
+                await asyncio.sleep(0.001)
+            ready_times.append(session.last_reconnect_seconds)
+            await book.wait_ready()
+            await asyncio.sleep(60)
+        metrics = session.metrics()
+        await session.close()
+        await exchange.stop()
+        return ready_times, metrics
+
+    ready_times, metrics = run_simulation(run(), start_time=START_TIME)
+    print(f"first connection ready in {metrics['connect_seconds'] * 1000:.0f}ms")
+    print(f"reconnect to ready over {len(ready_times)} drops: median {statistics.median(ready_times) * 1000:.0f}ms, "
+          f"max {max(ready_times) * 1000:.0f}ms ({max(ready_times) / (args.latency_ms / 1000):.1f} round trips)")
+    print(metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Measure the market-data recorder on one core: the cost of recording synthetic book, trades and
+ticker notifications of Deribit's shape, the size of the segments, and the speed of reading them
+back. The messages read back are checked against the ones recorded.
+
+A second check records the book and ticker of the simulated exchange for a virtual hour, then
+replays the book into a LocalOrderBook, which must end on the exchange's book at the end of the hour.
+
+Usage:
+    python -m benchmarks.bench_recorder --messages 200000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_replay import random_walk_ticks
+from deribit_utils.order_book import LocalOrderBook
+from deribit_utils.recorder import MarketDataReader, MarketDataRecorder, market_data_channels
+from deribit_utils.session import SessionManager
+from deribit_utils.simulator import SimulatedExchange, run_simulation
+
+INSTRUMENT_NAME = "BTC-PERPETUAL"
+START_TIME = 1_700_000_000
+
+
+def synthetic_notifications(count, seed=3):
+    """
+    Yield (channel, data) in the proportions of a busy BTC-PERPETUAL feed: mostly book changes,
+    then ticker updates and trades.
+    """
+    book, trades, ticker = market_data_channels([INSTRUMENT_NAME])
+    rng = random.Random(seed)
+    mid = 37000.0
+    change_id = 1
+    trade_seq = 1
+    timestamp = START_TIME * 1000
+    yield book, {"type": "snapshot", "instrument_name": INSTRUMENT_NAME, "timestamp": timestamp, "change_id": change_id,
+                 "bids": [["new", mid - 0.5 * i, 10.0 * i] for i in range(1, 51)],
+                 "asks": [["new", mid + 0.5 * i, 10.0 * i] for i in range(1, 51)]}
+    for _ in range(count - 1):
+        timestamp += rng.randint(0, 3)
+        kind = rng.random()
+        if kind < 0.7:
+            change_id += 1
+            levels = lambda sign: [[rng.choice(("new", "change", "delete")), mid + sign * 0.5 * rng.randint(1, 50),
+                                    float(rng.randint(0, 100) * 10)] for _ in range(rng.randint(0, 3))]
+            yield book, {"type": "change", "instrument_name": INSTRUMENT_NAME, "timestamp": timestamp,
+                         "prev_change_id": change_id - 1, "change_id": change_id,
+                         "bids": levels(-1), "asks": levels(1)}
+        elif kind < 0.85:
+            mid += rng.choice((-0.5, 0, 0.5))
+            yield ticker, {"instrument_name": INSTRUMENT_NAME, "timestamp": timestamp,
+                           "best_bid_price": mid - 0.25, "best_bid_amount": float(rng.randint(1, 1000) * 10),
+                           "best_ask_price": mid + 0.25, "best_ask_amount": float(rng.randint(1, 1000) * 10),
+                           "last_price": mid, "mark_price": mid + 0.1, "index_price": mid - 2.0,
+                           "open_interest": 5e8, "funding_8h": 1e-4, "current_funding": 0.0}
+        else:
+            batch = []
+            for _ in range(rng.randint(1, 4)):
+                direction = rng.choice(("buy", "sell"))
+                batch.append({"instrument_name": INSTRUMENT_NAME, "timestamp": timestamp, "trade_seq": trade_seq,
+                              "trade_id": str(200_000_000 + trade_seq), "tick_direction": rng.randint(0, 3),
+                              "price": mid + (0.25 if direction == "buy" else -0.25),
+                              "amount": float(rng.randint(1, 500) * 10), "direction": direction,
+                              "mark_price": mid + 0.1, "index_price": mid - 2.0})
+                trade_seq += 1
+            yield trades, batch
+
+
+def bench_synthetic(count, directory):
+    notifications = list(synthetic_notifications(count))
+    json_bytes = sum(len(json.dumps(data)) for _, data in notifications)
+    recorder = MarketDataRecorder(market_data_channels([INSTRUMENT_NAME]), directory)
+
+    async def run():
+        for channel in recorder.channels:
+            os.makedirs(os.path.join(directory, channel), exist_ok=True)
+        recorder._flush_lock = asyncio.Lock()
+        start = time.perf_counter()
+        for channel, data in notifications:
+            recorder.on_message(channel, data)
+        handler_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        await recorder.flush()
+        await asyncio.to_thread(recorder._close_segments)
+        return handler_seconds, time.perf_counter() - start
+
+    handler_seconds, write_seconds = asyncio.run(run())
+    total = handler_seconds + write_seconds
+    print(f"recorded {count} messages: handler {handler_seconds / count * 1e6:.2f}us, "
+          f"write {write_seconds / count * 1e6:.2f}us per message, {count / total:,.0f} messages/s on one core")
+    print(f"segments: {recorder.bytes_written / 1e6:.1f}MB, {recorder.bytes_written / count:.1f} bytes per message, "
+          f"{json_bytes / recorder.bytes_written:.1f}x smaller than the JSON")
+
+    reader = MarketDataReader(directory)
+    start = time.perf_counter()
+    replayed = [(channel, data) for _, channel, data in reader.messages()]
+    read_seconds = time.perf_counter() - start
+    print(f"read back {len(replayed)} messages in {read_seconds:.2f}s, {len(replayed) / read_seconds:,.0f} messages/s")
+
+    by_channel = lambda messages: {channel: [data for c, data in messages if c == channel] for channel in recorder.channels}
+    assert by_channel(replayed) == by_channel(notifications), "Replayed messages differ from the recorded ones"
+    assert recorder.book_gaps == 0 and recorder.trade_gaps == 0
+    print("replayed messages identical to the recorded ones")
+
+
+def bench_simulator(directory):
+    exchange = SimulatedExchange(random_walk_ticks(START_TIME, 1, 1))
+    channels = [f"book.{INSTRUMENT_NAME}.100ms", f"ticker.{INSTRUMENT_NAME}.100ms"]
+
+    async def run():
+        exchange.start()
+        async with SessionManager(None, None, connect=exchange.connect) as session:
+            client = await session.start()
+            recorder = MarketDataRecorder(channels, directory)
+            await recorder.start(client)
+            await asyncio.sleep(3600)
+            # Before the feed, left without subscribers, runs ahead
+            best_bid, best_ask = exchange.bids.best_price(), exchange.asks.best_price()
+            await recorder.stop()
+        await exchange.stop()
+        return recorder.metrics(), best_bid, best_ask
+
+    metrics, best_bid, best_ask = run_simulation(run(), start_time=START_TIME)
+    print(f"simulator hour: {metrics}")
+
+    book = LocalOrderBook(INSTRUMENT_NAME)
+    replayed = asyncio.run(MarketDataReader(directory).replay(book.on_message, channels[:1]))
+    assert book.ready, "Replayed book is not ready"
+    assert (book.best_bid(), book.best_ask()) == (best_bid, best_ask), \
+        f"Replayed book {book.best_bid()}/{book.best_ask()} differs from the exchange {best_bid}/{best_ask}"
+    print(f"replayed {replayed} book messages into a LocalOrderBook: {book.best_bid()}/{book.best_ask()}, "
+          f"same as the exchange")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="market_data_")
+    try:
+        bench_synthetic(args.messages, os.path.join(directory, "synthetic"))
+        bench_simulator(os.path.join(directory, "simulator"))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Replay hourly signals over a synthetic random-walk tick feed through execute_trade_logic on the
+local exchange simulator, and report throughput and order-path request counts.
+
+Usage:
+    python -m benchmarks.bench_replay --days 90 --tick-seconds 60 --latency 0.05
+"""
+import argparse
+import contextlib
+import io
+import random
+
+import pandas as pd
+
+from deribit_utils.simulator import SimulatedExchange, replay_signals, run_simulation
+from telemetry_utils.telemetry import telemetry
+
+
+def random_walk_ticks(start_time, days, tick_seconds, start_price=30000.0, volatility=0.0008, seed=7):
+    rng = random.Random(seed)
+    price = start_price
+    ticks = []
+    for i in range(int(days * 86400 / tick_seconds)):
+        price *= 1 + rng.gauss(0, volatility)
+        ticks.append((start_time + i * tick_seconds, round(price * 2) / 2))
+    return ticks
+
+
+def random_signals(start_time, days, seed=7):
+    rng = random.Random(seed)
+    open_times = [start_time + 3600 * hour for hour in range(1, int(days * 24))]
+    long_entry = [rng.random() < 0.5 for _ in open_times]
+    return pd.DataFrame({
+        "open_time": open_times,
+        "Long_Entry": long_entry,
+        "Short_Entry": [not signal for signal in long_entry]
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--tick-seconds", type=float, default=60)
+    parser.add_argument("--polling", action="store_true", help="Use the polling order monitor")
+    parser.add_argument("--latency", type=float, default=0.0, help="One-way latency of the simulated exchange, in seconds")
+    args = parser.parse_args()
+
+    start_time = 1_700_000_000
+    ticks = random_walk_ticks(start_time, args.days, args.tick_seconds)
+    signals = random_signals(start_time, args.days)
+    exchange = SimulatedExchange(ticks, latency=args.latency)
+
+    # The trading helpers print every decision, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = run_simulation(replay_signals(exchange, signals, streaming=not args.polling), start_time=start_time)
+
+    print(f"ticks: {len(ticks)}, signals: {stats['signals']}")
+    print(f"wall time: {stats['wall_seconds']:.2f}s for {stats['simulated_seconds'] / 86400:.1f} simulated days")
+    print(f"ticks/s: {len(ticks) / stats['wall_seconds']:.0f}, signals/s: {stats['signals'] / stats['wall_seconds']:.0f}")
+    print(f"requests: {sum(stats['requests'].values())}, reprices: {stats['reprices']}, fills: {stats['fills']}")
+    print(f"requests per signal: {sum(stats['requests'].values()) / stats['signals']:.1f}")
+    for pool, metrics in stats["rate_limits"].items():
+        print(f"{pool}: {metrics['throttled']} of {metrics['requests']} requests throttled, "
+              f"max queue delay {metrics['max_queue_delay_seconds']:.3f}s, {metrics['rate_limit_errors']} rate limit errors")
+    print(f"final equity: {stats['account']['equity']:.6f} {exchange.currency}")
+
+    snapshot = telemetry.snapshot()
+    for name in ("order.signal_to_first_order", "order.time_to_fill", "order.slippage_bps", "rpc.private/edit", "deribit_utils.execute_trade_logic"):
+        summary = snapshot["histograms"].get(name)
+        if summary and summary["count"]:
+            print(f"{name}: count {summary['count']}, p50 {summary['p50']:.4g}, p99 {summary['p99']:.4g}")
+    print(f"reprices counted: {snapshot['counters'].get('order.reprices', 0)}")
+
+
+if __name__ == "__main__":
+    main()
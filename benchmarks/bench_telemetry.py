@@ -0,0 +1,65 @@
+"""
+Measure the overhead telemetry adds to each instrumented call, enabled and disabled.
+
+Usage:
+    python -m benchmarks.bench_telemetry --calls 200000
+"""
+import argparse
+import asyncio
+import time
+
+from telemetry_utils.telemetry import Telemetry
+
+
+def overhead_us(telemetry, calls):
+    @telemetry.traced("bench.sync")
+    def traced_call():
+        pass
+
+    def plain_call():
+        pass
+
+    @telemetry.traced("bench.async")
+    async def traced_coroutine():
+        pass
+
+    async def plain_coroutine():
+        pass
+
+    async def run_coroutines(coroutine):
+        for _ in range(calls):
+            await coroutine()
+
+    results = {}
+    for label, function in (("sync", traced_call), ("sync baseline", plain_call)):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        results[label] = (time.perf_counter() - start) / calls * 1e6
+    for label, coroutine in (("async", traced_coroutine), ("async baseline", plain_coroutine)):
+        start = time.perf_counter()
+        asyncio.run(run_coroutines(coroutine))
+        results[label] = (time.perf_counter() - start) / calls * 1e6
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        telemetry.record("bench.record", 0.0123)
+    results["record"] = (time.perf_counter() - start) / calls * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    for enabled in (True, False):
+        results = overhead_us(Telemetry(enabled=enabled), args.calls)
+        print(f"telemetry {'enabled' if enabled else 'disabled'}: "
+              f"sync call +{results['sync'] - results['sync baseline']:.2f}us, "
+              f"async call +{results['async'] - results['async baseline']:.2f}us, "
+              f"record() {results['record']:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
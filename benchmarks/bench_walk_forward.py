@@ -0,0 +1,45 @@
+"""
+Time a walk-forward optimization of a 10k combination grid over years of synthetic hourly bars.
+That the multipliers evaluated at once give the results of one backtest per combination is
+checked by tests/test_backtest.py.
+
+Usage:
+    python -m benchmarks.bench_walk_forward --years 5 --processes 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backtest_utils.walk_forward import walk_forward
+from benchmarks.bench_backtest import random_hourly_bars
+
+STOP_LOSSES = TAKE_PROFITS = np.round(np.arange(0.01, 0.205, 0.01), 2)  # 20 values each
+MULTIPLIERS = (1, 2, 3, 4, 5)  # 5 values each for longs and shorts, 10k combinations in all
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--train-days", type=int, default=365)
+    parser.add_argument("--test-days", type=int, default=90)
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes, all cores by default")
+    args = parser.parse_args()
+
+    df = random_hourly_bars(args.years)
+
+    start = time.perf_counter()
+    results = walk_forward(df, args.train_days * 24, args.test_days * 24,
+                           stop_losses=STOP_LOSSES, take_profits=TAKE_PROFITS,
+                           long_multipliers=MULTIPLIERS, short_multipliers=MULTIPLIERS, processes=args.processes)
+    elapsed = time.perf_counter() - start
+    combinations = len(STOP_LOSSES) * len(TAKE_PROFITS) * len(MULTIPLIERS) ** 2
+    print(f"walk forward: {combinations} combinations x {len(results)} windows of {args.train_days} train days "
+          f"over {len(df)} bars in {elapsed:.1f}s ({combinations * len(results) / elapsed:,.0f} backtests/s)")
+    print(results[["test_start", "stop_loss", "take_profit", "long_multiplier", "short_multiplier",
+                   "train_sharpe", "test_total_return", "test_sharpe"]].to_string(index=False))
+    print(f"out of sample: {(1 + results['test_total_return']).prod() - 1:.2%}")
+
+
+if __name__ == "__main__":
+    main()
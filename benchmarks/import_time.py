@@ -0,0 +1,96 @@
+"""
+Import-time budget check for the modules loaded on a cold start.
+
+Each module is imported in a fresh interpreter with `python -X importtime` and its cumulative
+import time is compared with its budget. The best of several runs is kept to filter out noise.
+Exits with status 1 if a module is over budget or fails to import. A module whose third-party
+dependencies are not installed is skipped. tests/test_import_time.py runs the same check.
+
+Usage:
+    python -m benchmarks.import_time --repeat 5
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets in milliseconds. Heavy dependencies (pandas, google-cloud-*,
+# websockets, requests) must only be imported when first used, never at module import.
+IMPORT_TIME_BUDGETS_MS = {
+    "gcp_utils.secret_manager": 50,
+    "telemetry_utils.telemetry": 50,
+    "bigquery_utils.bq_utils": 50,
+    "deribit_utils.deribit_utils": 150,
+    "pipeline": 150,
+    "main": 250,
+}
+
+
+def measure_import_time_ms(module):
+    """
+    Import module in a fresh interpreter and return its cumulative import time in milliseconds,
+    together with the slowest modules it pulled in. Raises ModuleNotFoundError, with the name of
+    the missing module, if a module it imports is not installed, and ImportError on other errors.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=REPO_ROOT
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+        missing = re.search(r"No module named '([\w.]+)'", error)
+        if missing:
+            raise ModuleNotFoundError(error, name=missing.group(1))
+        raise ImportError(error)
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings.append((int(cumulative) / 1000, name.strip()))
+    total = next(ms for ms, name in timings if name == module)
+    slowest = sorted((t for t in timings if t[1] != module), reverse=True)[:3]
+    return total, slowest
+
+
+def is_missing_dependency(error):
+    """
+    True if a ModuleNotFoundError is about a third-party module, not a module of this repository.
+    """
+    top_level = (error.name or "").split(".")[0]
+    return bool(top_level) and not (os.path.isdir(os.path.join(REPO_ROOT, top_level))
+                                    or os.path.isfile(os.path.join(REPO_ROOT, top_level + ".py")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold import times against their budgets.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    over_budget = False
+    for module, budget_ms in IMPORT_TIME_BUDGETS_MS.items():
+        try:
+            total_ms, slowest = min(measure_import_time_ms(module) for _ in range(args.repeat))
+        except ModuleNotFoundError as e:
+            if not is_missing_dependency(e):
+                raise
+            print(f"skip {module}: {e.name} is not installed")
+            continue
+        except ImportError as e:
+            print(f"FAIL {module}: {e}")
+            over_budget = True
+            continue
+        status = "ok  " if total_ms <= budget_ms else "FAIL"
+        over_budget |= total_ms > budget_ms
+        details = ", ".join(f"{name} {ms:.1f}ms" for ms, name in slowest)
+        print(f"{status} {module}: {total_ms:.1f}ms (budget {budget_ms}ms; slowest: {details})")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Check that the incremental SignalEngine produces the signals of the ETL table: the historical bars
+of the table are fed to the engine one by one, and its AO, Long_Entry and Short_Entry are compared
+with the columns of the table, and with the vectorized ao_signals (and pandas_ta's AO if it is
+installed). The first AO_SLOW_PERIOD bars, before the engine is warmed up, are not compared.
+
+The signals table is computed from Binance BTCUSDT hourly bars (the btc_perpetual_binance
+dataset), while the live SignalEngine is fed Deribit BTC-PERPETUAL candles. This check feeds the
+engine the table's own Binance bars, so it proves that the rules are the same, not that the
+signals are: the two venues' prices differ by a few dollars, and a bar where the AO is close to
+zero can cross on one venue and not on the other.
+
+Exits with status 1 if any signal differs. --export-fixture writes the table rows compared to a CSV
+file instead, e.g. the fixture of tests/test_signal_engine.py. With --synthetic-years, the exported
+signal columns are computed by reference_signals, written independently of the engine.
+
+Usage:
+    python -m benchmarks.signal_parity --start 2023-01-01            # against the signals table
+    python -m benchmarks.signal_parity --synthetic-years 5           # engine against the vectorized rules only
+    python -m benchmarks.signal_parity --start 2024-01-01 --end 2024-03-01 --export-fixture tests/fixtures/master_signals_ao_1h.csv
+    python -m benchmarks.signal_parity --synthetic-years 0.04 --export-fixture tests/fixtures/master_signals_ao_1h.csv
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from deribit_utils.signal_engine import AO_FAST_PERIOD, AO_SLOW_PERIOD, SIGNAL_COLUMNS, SignalEngine, ao_signals
+
+SIGNAL_TABLE = "signals-etl.btc_perpetual_binance.master_signals_ao_1h"
+AO_TOLERANCE = 1e-6  # Relative to the price, far below the tick size
+
+
+def table_bars(table_id, start, end):
+    from bigquery_utils.arrow_cache import cache
+
+    def bound(value):
+        return pd.Timestamp(value, tz="UTC").to_pydatetime() if value else None
+
+    table = cache.read_range(table_id, "open_time", start=bound(start), end=bound(end))
+    return table.to_pandas().sort_values("open_time").reset_index(drop=True)
+
+
+def synthetic_bars(years, seed=7):
+    rng = np.random.default_rng(seed)
+    n = int(years * 365 * 24)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.008, n)))
+    open_ = np.r_[30000.0, close[:-1]]
+    spread = np.abs(rng.normal(0, 0.004, n)) * close
+    return pd.DataFrame({
+        "open_time": pd.date_range("2019-01-01", periods=n, freq="h", tz="UTC"),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+    })
+
+
+def reference_signals(bars, fast_period=AO_FAST_PERIOD, slow_period=AO_SLOW_PERIOD):
+    """
+    The rules of the signals table computed the plain way, with no rolling state: each moving
+    average is the sum of its window of median prices divided by its length, bar by bar. Returns
+    bars with the AO, Long_Entry and Short_Entry columns.
+    """
+    medians = ((bars["high"] + bars["low"]) / 2).tolist()
+    ao = [None] * len(medians)
+    for i in range(slow_period - 1, len(medians)):
+        fast = sum(medians[i - fast_period + 1:i + 1]) / fast_period
+        slow = sum(medians[i - slow_period + 1:i + 1]) / slow_period
+        ao[i] = fast - slow
+    result = bars[["open_time", "open", "high", "low", "close"]].copy()
+    result["AO"] = [float("nan") if value is None else value for value in ao]
+    result["Long_Entry"] = [i > 0 and ao[i - 1] is not None and ao[i - 1] <= 0 < ao[i] for i in range(len(ao))]
+    result["Short_Entry"] = [i > 0 and ao[i - 1] is not None and ao[i - 1] >= 0 > ao[i] for i in range(len(ao))]
+    return result
+
+
+def export_fixture(bars, path, synthetic):
+    """
+    Write the signal rows of bars to a CSV file. Synthetic bars are rounded to the cent, like the
+    table's, and a comment line records that their signals come from reference_signals.
+    """
+    with open(path, "w") as f:
+        if synthetic:
+            bars = reference_signals(bars.round({"open": 2, "high": 2, "low": 2, "close": 2}))
+            f.write("# Synthetic bars in the schema of master_signals_ao_1h, signals from "
+                    "benchmarks.signal_parity.reference_signals, not rows of the table\n")
+        bars[SIGNAL_COLUMNS].to_csv(f, index=False)
+    print(f"{len(bars)} rows written to {path}")
+
+
+def compare(name, expected, actual, price):
+    """
+    Print and return the number of bars where the signals, or the AO beyond AO_TOLERANCE, differ.
+    """
+    compared = slice(AO_SLOW_PERIOD, None)
+    mismatches = 0
+    for column in ("Long_Entry", "Short_Entry"):
+        if column not in expected:
+            continue
+        differs = expected[column].fillna(False).astype(bool).to_numpy() != actual[column].to_numpy(dtype=bool)
+        differs[:AO_SLOW_PERIOD] = False
+        mismatches += int(differs.sum())
+        print(f"  {name} {column}: {int(differs.sum())} of {len(differs[compared])} bars differ, "
+              f"{int(actual[column].to_numpy(dtype=bool)[compared].sum())} signals")
+        for index in np.flatnonzero(differs)[:5]:
+            print(f"    {actual['open_time'].iloc[index]}: expected {expected[column].iloc[index]}, "
+                  f"got {actual[column].iloc[index]}")
+    if "AO" in expected:
+        error = np.abs(expected["AO"].to_numpy(dtype=float) - actual["AO"].to_numpy(dtype=float)) / price
+        print(f"  {name} AO: max relative error {np.nanmax(error[compared]):.2e}")
+        mismatches += int((error[compared] > AO_TOLERANCE).sum())
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--table", default=SIGNAL_TABLE)
+    parser.add_argument("--start", help="First open_time compared, e.g. 2023-01-01")
+    parser.add_argument("--end", help="open_time where the comparison stops")
+    parser.add_argument("--synthetic-years", type=float, help="Use synthetic bars instead of the table")
+    parser.add_argument("--export-fixture", help="Write the table rows to this CSV file instead of comparing")
+    args = parser.parse_args()
+
+    bars = synthetic_bars(args.synthetic_years) if args.synthetic_years else table_bars(args.table, args.start, args.end)
+    if args.export_fixture:
+        export_fixture(bars, args.export_fixture, bool(args.synthetic_years))
+        return
+    if len(bars) <= AO_SLOW_PERIOD:
+        sys.exit(f"Only {len(bars)} bars, the comparison needs more than {AO_SLOW_PERIOD}")
+
+    start = time.perf_counter()
+    incremental = SignalEngine().run(bars)
+    elapsed = time.perf_counter() - start
+    print(f"{len(bars)} bars from {bars['open_time'].iloc[0]} to {bars['open_time'].iloc[-1]}, "
+          f"engine {elapsed / len(bars) * 1e6:.2f}us per bar")
+
+    price = bars["close"].to_numpy(dtype=float)
+    mismatches = 0
+    if not args.synthetic_years:
+        mismatches += compare("table", bars, incremental, price)
+    mismatches += compare("vectorized", ao_signals(bars), incremental, price)
+    try:
+        import pandas_ta
+        reference = pd.DataFrame({"AO": pandas_ta.ao(bars["high"], bars["low"]).to_numpy()})
+        mismatches += compare("pandas_ta", reference, incremental, price)
+    except ImportError:
+        print("  pandas_ta not installed, skipped")
+
+    print("PARITY OK" if mismatches == 0 else f"PARITY FAILED: {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
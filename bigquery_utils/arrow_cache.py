@@ -0,0 +1,263 @@
+"""
+Local, memory-mapped Arrow cache of BigQuery tables ordered by a monotonic column, such as the
+hourly klines and AO signals used by backtests and replays.
+
+Each cached table is a directory of Arrow IPC files (segments) and a manifest. Segments are
+written once and never modified: a refresh only queries the rows newer than the last cached
+value and appends them as a new segment, and a range older than the cached ones is backfilled
+as a segment of its own. Reads memory-map the segments, so a cached range is served without
+copying it into memory or running a query.
+
+Configuration, read once at import:
+    ARROW_CACHE_DIR=/tmp/cache  root directory of the cache
+
+Usage:
+    from bigquery_utils.arrow_cache import cache
+
+    table = cache.read_range("signals-etl.btc_perpetual_binance.master_signals_ao_1h", "open_time",
+                             start=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc))
+    df = table.to_pandas()
+"""
+import json
+import logging
+import os
+import re
+import time
+
+from bigquery_utils.bq_utils import decode_json_value, encode_json_value, query_parameter_type
+
+ARROW_CACHE_DIR = os.environ.get("ARROW_CACHE_DIR", "/tmp/deribit_trading/arrow_cache")
+ARROW_CACHE_MAX_SEGMENTS = 32  # Segments are merged into one beyond this, to keep reads to a few files
+
+logger = logging.getLogger()
+
+
+def _query_arrow(query, parameters):
+    from google.cloud import bigquery
+    from bigquery_utils.bq_utils import read_arrow
+
+    query_parameters = [
+        bigquery.ScalarQueryParameter(name, query_parameter_type(value), value) for name, value in parameters.items()
+    ]
+    return read_arrow(query, query_parameters)
+
+
+def _table_modified(table_id):
+    from bigquery_utils.bq_utils import get_client
+    return get_client().get_table(table_id).modified
+
+
+class ArrowCache:
+    """
+    Append-only Arrow IPC cache of ordered BigQuery tables, keyed by table and column.
+    """
+
+    def __init__(self, cache_dir=ARROW_CACHE_DIR, query=_query_arrow, table_modified=_table_modified,
+                 max_segments=ARROW_CACHE_MAX_SEGMENTS):
+        """
+        Args:
+        - cache_dir: Root directory of the cache.
+        - query: Callable query(sql, parameters) returning a pyarrow.Table, where parameters is a dict
+          of the @name parameters of the query. Runs it with bq_utils.read_arrow by default.
+        - table_modified: Callable returning the last modification time of a table, used to skip
+          refreshes when the table has not changed.
+        - max_segments: Number of segments above which a table's segments are merged.
+        """
+        self.cache_dir = cache_dir
+        self.query = query
+        self.table_modified = table_modified
+        self.max_segments = max_segments
+
+    def _directory(self, table_id, column):
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", f"{table_id}.{column}"))
+
+    def _load_manifest(self, directory):
+        try:
+            with open(os.path.join(directory, "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": [], "next_segment": 0}
+
+    def _save_manifest(self, directory, manifest):
+        # Written after the segments it lists, and atomically, so a crash leaves the previous manifest
+        path = os.path.join(directory, "manifest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def refresh(self, table_id, column, start=None):
+        """
+        Bring the cache of table_id up to date: backfill the rows from start if they are older
+        than the cached ones, then append the rows newer than the last cached value.
+        Returns the number of rows added.
+        """
+        directory = self._directory(table_id, column)
+        os.makedirs(directory, exist_ok=True)
+        manifest = self._load_manifest(directory)
+        added = 0
+
+        covered_from = manifest.get("covered_from")
+        if manifest["segments"] and covered_from is not None and \
+                (start is None or _sort_key(start) < _sort_key(decode_json_value(covered_from))):
+            # The requested range starts before the cached rows
+            added += self._fetch(directory, manifest, table_id, column, start, decode_json_value(covered_from))
+            manifest["covered_from"] = encode_json_value(start)
+
+        modified = self.table_modified(table_id)
+        cached_modified = manifest.get("table_modified")
+        if manifest["segments"] and modified is not None and cached_modified is not None \
+                and modified <= decode_json_value(cached_modified):
+            logger.info("%s not modified since the last refresh, no query", table_id)
+        else:
+            last_value = decode_json_value(manifest["segments"][-1]["max"]) if manifest["segments"] else None
+            if last_value is None:
+                added += self._fetch(directory, manifest, table_id, column, start, None)
+                manifest["covered_from"] = encode_json_value(start)
+            else:
+                added += self._fetch(directory, manifest, table_id, column, last_value, None, after=True)
+            manifest["table_modified"] = encode_json_value(modified)
+
+        if len(manifest["segments"]) > self.max_segments:
+            self._compact(directory, manifest)
+        self._save_manifest(directory, manifest)
+        return added
+
+    def _fetch(self, directory, manifest, table_id, column, lower, upper, after=False):
+        conditions, parameters = [], {}
+        if lower is not None:
+            conditions.append(f"{column} {'>' if after else '>='} @lower")
+            parameters["lower"] = lower
+        if upper is not None:
+            conditions.append(f"{column} < @upper")
+            parameters["upper"] = upper
+        query = f"SELECT DISTINCT * FROM `{table_id}`"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {column} ASC"
+
+        start = time.perf_counter()
+        table = self.query(query, parameters)
+        if table.num_rows == 0:
+            return 0
+        if manifest["segments"]:
+            # Keep every segment on the schema of the first, so they concatenate without copies
+            schema = self._open_segment(directory, manifest["segments"][0]).schema
+            if not table.schema.equals(schema):
+                table = table.select(schema.names).cast(schema)
+
+        name = f"segment-{manifest['next_segment']:06d}.arrow"
+        manifest["next_segment"] += 1
+        self._write_segment(os.path.join(directory, name), table)
+        values = table.column(column)
+        segment = {"file": name, "rows": table.num_rows,
+                   "min": encode_json_value(values[0].as_py()), "max": encode_json_value(values[-1].as_py())}
+        manifest["segments"].append(segment)
+        manifest["segments"].sort(key=lambda s: _sort_key(decode_json_value(s["min"])))
+        logger.info("Cached %s rows of %s in %s (%.3fs)", table.num_rows, table_id, name, time.perf_counter() - start)
+        return table.num_rows
+
+    def _write_segment(self, path, table):
+        import pyarrow as pa
+
+        # Uncompressed IPC file format, so readers can memory-map the buffers as they are
+        with pa.OSFile(f"{path}.tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(f"{path}.tmp", path)
+
+    def _open_segment(self, directory, segment):
+        import pyarrow as pa
+
+        source = pa.memory_map(os.path.join(directory, segment["file"]), "r")
+        return pa.ipc.open_file(source).read_all()
+
+    def _compact(self, directory, manifest):
+        import pyarrow as pa
+
+        table = pa.concat_tables([self._open_segment(directory, segment) for segment in manifest["segments"]])
+        name = f"segment-{manifest['next_segment']:06d}.arrow"
+        manifest["next_segment"] += 1
+        self._write_segment(os.path.join(directory, name), table.combine_chunks())
+        old_files = [segment["file"] for segment in manifest["segments"]]
+        manifest["segments"] = [{"file": name, "rows": table.num_rows,
+                                 "min": manifest["segments"][0]["min"], "max": manifest["segments"][-1]["max"]}]
+        self._save_manifest(directory, manifest)
+        for old_file in old_files:
+            os.remove(os.path.join(directory, old_file))
+
+    def read_range(self, table_id, column, start=None, end=None, refresh=True, columns=None):
+        """
+        Return the rows of table_id with start <= column < end as a pyarrow.Table, served from the
+        memory-mapped cache. With refresh, the cache is first brought up to date, which runs a
+        query only for rows that are not cached yet.
+
+        Args:
+        - table_id: Bigquery table ID
+        - column: Monotonic column the table is ordered and cached by, e.g. open_time
+        - start, end: Bounds of the range, None for unbounded
+        - refresh: Fetch the missing rows first. Without it only the cached rows are returned.
+        - columns: Optional list of columns to return
+        """
+        import pyarrow as pa
+
+        directory = self._directory(table_id, column)
+        if refresh:
+            self.refresh(table_id, column, start)
+        manifest = self._load_manifest(directory)
+
+        tables = []
+        for segment in manifest["segments"]:
+            if end is not None and _sort_key(decode_json_value(segment["min"])) >= _sort_key(end):
+                continue
+            if start is not None and _sort_key(decode_json_value(segment["max"])) < _sort_key(start):
+                continue
+            table = self._open_segment(directory, segment)
+            tables.append(_slice(table, column, start, end))
+        if not tables:
+            return pa.table({})
+        table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+        return table.select(columns) if columns else table
+
+    def clear(self, table_id, column):
+        """
+        Drop the cache of table_id.
+        """
+        import shutil
+        shutil.rmtree(self._directory(table_id, column), ignore_errors=True)
+
+
+def _slice(table, column, start, end):
+    # Rows are sorted by column: binary search the bounds and slice, which copies nothing
+    import numpy as np
+    import pyarrow as pa
+
+    values = table.column(column)
+    if values.num_chunks == 1:
+        values = values.chunk(0)
+    else:
+        values = values.combine_chunks()
+    if pa.types.is_timestamp(values.type) or pa.types.is_date(values.type):
+        keys = values.cast(pa.int64()).to_numpy()
+    else:
+        keys = values.to_numpy()
+    first = 0 if start is None else int(np.searchsorted(keys, _bound(start, values.type), side="left"))
+    last = len(keys) if end is None else int(np.searchsorted(keys, _bound(end, values.type), side="left"))
+    return table.slice(first, max(last - first, 0))
+
+
+def _bound(value, arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        return pa.scalar(value, type=arrow_type).cast(pa.int64()).as_py()
+    return value
+
+
+def _sort_key(value):
+    # Timestamps from the manifest and the caller may differ in type but compare by instant
+    if hasattr(value, "timestamp"):
+        return value.timestamp()
+    return value
+
+
+cache = ArrowCache()
@@ -1,11 +1,46 @@
 """
 library containing bigquery functions
 """
+import datetime
+import json
 import logging
-from google.cloud import bigquery
+import os
+import threading
+import time
+
+from gcp_utils.versioning import VersionConflict
+from telemetry_utils.telemetry import traced
 
 logger = logging.getLogger()
 
+WATERMARK_WRITE_ATTEMPTS = 5  # Concurrent updates of a shared watermark store, retried on a version conflict
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide BigQuery client, created on first use.
+    Reusing it keeps its HTTP connections and credentials warm between calls.
+    """
+    with _clients_lock:
+        if "bigquery" not in _clients:
+            from google.cloud import bigquery
+            _clients["bigquery"] = bigquery.Client()
+        return _clients["bigquery"]
+
+
+def get_bqstorage_client():
+    """
+    Return the process-wide BigQuery Storage read client, created on first use.
+    """
+    with _clients_lock:
+        if "bqstorage" not in _clients:
+            from google.cloud import bigquery_storage
+            _clients["bqstorage"] = bigquery_storage.BigQueryReadClient()
+        return _clients["bqstorage"]
+
 
 def write_data(table_id, data: [dict]) -> bool:
     """
@@ -14,7 +49,7 @@ def write_data(table_id, data: [dict]) -> bool:
     :param data: Data formatted as array of dicts to be inserted in Bigquery
     :return: A boolean of the status of the import
     """
-    client = bigquery.Client()
+    client = get_client()
 
     errors = client.insert_rows_json(table_id, data, row_ids=[None] * len(data))
     if errors:
@@ -25,23 +60,100 @@ def write_data(table_id, data: [dict]) -> bool:
     return insert_status
 
 
-def read_data(query: str) -> [dict]:
-    bqclient = bigquery.Client()
+def append_rows(table_id: str, rows: [dict], schema: [tuple] = None) -> bool:
+    """
+    Function appending rows to a bigquery table with a load job.
+    Load jobs are free, unlike streaming inserts, and a failed job writes nothing, so a batch can be retried as a whole.
+    :param table_id: Bigquery table ID
+    :param rows: Data formatted as array of dicts to be appended
+    :param schema: Optional list of (column name, bigquery type) tuples, used if the table has to be created
+    :return: A boolean of the status of the load
+    """
+    from google.cloud import bigquery
+
+    job_config = bigquery.LoadJobConfig(
+        write_disposition="WRITE_APPEND",
+        create_disposition="CREATE_IF_NEEDED",
+        schema=[bigquery.SchemaField(name, field_type) for name, field_type in schema] if schema else None,
+        autodetect=not schema,
+    )
+    job = get_client().load_table_from_json(rows, table_id, job_config=job_config)
+    try:
+        job.result()
+    except Exception as e:
+        logger.error("Encountered errors while loading rows into %s: %s", table_id, e)
+        return False
+    return True
+
+
+@traced()
+def read_data(query: str, query_parameters: list = None):
+    """
+    Function reading the result of a query into a pandas DataFrame
+    :param query: SQL query
+    :param query_parameters: Optional list of bigquery.ScalarQueryParameter
+    :return: A DataFrame of the query result
+    """
     df = (
-    bqclient.query(query)
-        .result()
+        _run_query(query, query_parameters)
         .to_dataframe(
-            # Optionally, explicitly request to use the BigQuery Storage API. As of
-            # google-cloud-bigquery version 1.26.0 and above, the BigQuery Storage
-            # API is used by default.
-            create_bqstorage_client=True,
+            # Explicitly use the shared BigQuery Storage client instead of creating one per call
+            bqstorage_client=get_bqstorage_client(),
         )
     )
     return df
 
 
+def read_rows(query: str, query_parameters: list = None) -> [dict]:
+    """
+    Function reading a small query result as plain dicts, without Arrow or pandas
+    :param query: SQL query
+    :param query_parameters: Optional list of bigquery.ScalarQueryParameter
+    :return: A list of dicts, one per row
+    """
+    return [dict(row.items()) for row in _run_query(query, query_parameters)]
+
+
+@traced()
+def read_arrow(query: str, query_parameters: list = None, use_storage_api: bool = True):
+    """
+    Function reading a query result into a pyarrow Table, without building a DataFrame
+    :param query: SQL query
+    :param query_parameters: Optional list of bigquery.ScalarQueryParameter
+    :param use_storage_api: Download through the BigQuery Storage API, faster for large results
+    :return: A pyarrow.Table of the query result
+    """
+    bqstorage_client = get_bqstorage_client() if use_storage_api else None
+    return _run_query(query, query_parameters).to_arrow(
+        bqstorage_client=bqstorage_client, create_bqstorage_client=False
+    )
+
+
+def iter_batches(query: str, query_parameters: list = None, as_dicts: bool = False, use_storage_api: bool = True):
+    """
+    Function streaming a query result batch by batch, so large results never sit in memory at once
+    :param query: SQL query
+    :param query_parameters: Optional list of bigquery.ScalarQueryParameter
+    :param as_dicts: Yield lists of plain dicts instead of pyarrow RecordBatches
+    :param use_storage_api: Download through the BigQuery Storage API, faster for large results
+    :return: A generator of pyarrow.RecordBatch, or of lists of dicts if as_dicts is set
+    """
+    bqstorage_client = get_bqstorage_client() if use_storage_api else None
+    for batch in _run_query(query, query_parameters).to_arrow_iterable(bqstorage_client=bqstorage_client):
+        yield batch.to_pylist() if as_dicts else batch
+
+
+def _run_query(query: str, query_parameters: list = None):
+    from google.cloud import bigquery
+
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters or [])
+    return get_client().query(query, job_config=job_config).result()
+
+
 def load_array_dict(table_id: str, schema: [], df):
-    client = bigquery.Client()
+    from google.cloud import bigquery
+
+    client = get_client()
 
     job_config = bigquery.LoadJobConfig(
         schema=schema,
@@ -59,3 +171,219 @@ def load_array_dict(table_id: str, schema: [], df):
             table.num_rows, len(table.schema), table_id
         )
     )
+
+
+class Watermark:
+    """
+    Store of incremental read positions, keyed by table and column.
+
+    Each entry holds the last processed value of the watermark column, and the table
+    modification time seen when a read returned every new row, which lets the next read
+    skip the query entirely if the table has not changed since.
+
+    The entries are cached in a local JSON file. A local file alone is lost on every cold start
+    of a Cloud Function and is not shared between its instances, so a durable store can hold the
+    reference copy: any object with the read and write methods of gcp_utils.run_ledger's
+    LocalRunStore and GcsRunStore. With a store, every read of the entries reads the store, so a
+    warm instance sees what other instances committed, and the file is only used when the store
+    cannot be read. Every update is written to the store, then to the file. The stored value never
+    moves backwards, whichever instance writes last.
+    """
+
+    def __init__(self, path, store=None, store_key="watermarks"):
+        """
+        Args:
+        - path: Local JSON file caching the entries.
+        - store: Durable store shared by every process, None to keep the entries in the file only.
+        - store_key: Key of the entries in store.
+        """
+        self.path = path
+        self.store = store
+        self.store_key = store_key
+        self._entries = None
+
+    def _load(self):
+        if self.store is not None:
+            try:
+                record, _ = self.store.read(self.store_key)
+            except Exception as e:
+                logging.warning(f"Watermark store unavailable, reading the local copy: {e}")
+            else:
+                entries = (record or {}).get("entries", {})
+                if entries != self._entries:
+                    self._entries = entries
+                    self._write_file()
+                return self._entries
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+        return self._entries
+
+    def get(self, key) -> dict:
+        return dict(self._load().get(key, {}))
+
+    def set(self, key, **fields):
+        fields = {name: encode_json_value(value) for name, value in fields.items()}
+        if self.store is not None:
+            self._entries = self._write_store(key, fields)
+        else:
+            self._load().setdefault(key, {}).update(fields)
+        self._write_file()
+
+    def _write_store(self, key, fields):
+        for _ in range(WATERMARK_WRITE_ATTEMPTS):
+            record, version = self.store.read(self.store_key)
+            entries = (record or {}).get("entries", {})
+            entry = entries.setdefault(key, {})
+            current = entry.get("value")
+            if "value" in fields and current is not None \
+                    and decode_json_value(fields["value"]) < decode_json_value(current):
+                # Another process already went further
+                fields = dict(fields, value=current)
+            entry.update(fields)
+            try:
+                self.store.write(self.store_key, {"entries": entries}, version)
+                return entries
+            except VersionConflict:
+                continue
+        raise VersionConflict(self.store_key)
+
+    def _write_file(self):
+        # Write to a temporary file first so a crash never leaves a truncated store behind
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def watermark_key(table_id: str, column: str) -> str:
+    return f"{table_id}.{column}"
+
+
+@traced()
+def read_incremental(table_id: str, column: str, watermark: Watermark, limit: int = None, start_at_latest: bool = False):
+    """
+    Read the rows of a table that are newer than the stored watermark, oldest first.
+
+    The watermark is passed as a query parameter in a WHERE clause on the column, so
+    BigQuery prunes the partitions and clusters that cannot contain new rows. If the last
+    read returned every new row and the table has not been modified since, no query is run.
+    Without a stored watermark the whole table is read, as before, or only its newest row
+    with start_at_latest.
+
+    :param table_id: Bigquery table ID
+    :param column: Monotonic column to read from, e.g. open_time
+    :param watermark: Store holding the last processed value
+    :param limit: Maximum number of rows to return
+    :param start_at_latest: Without a stored watermark, read the newest row only instead of the whole table
+    :return: A (DataFrame, stats) tuple. stats has the bytes processed and billed, the latency,
+        whether the query was skipped, and the fields to pass to commit_incremental.
+    """
+    from google.cloud import bigquery
+    import pandas as pd
+
+    start = time.perf_counter()
+    client = get_client()
+    key = watermark_key(table_id, column)
+    entry = watermark.get(key)
+    table_modified = client.get_table(table_id).modified
+    stats = {
+        "table_id": table_id,
+        "watermark": entry.get("value"),
+        "table_modified": table_modified,
+        "skipped": False,
+        "bytes_processed": 0,
+        "bytes_billed": 0,
+    }
+
+    drained_at = entry.get("drained_table_modified")
+    if drained_at is not None and table_modified is not None and table_modified <= decode_json_value(drained_at):
+        stats["skipped"] = True
+        stats["latency_seconds"] = time.perf_counter() - start
+        logger.info("No new rows in %s since %s, query skipped", table_id, entry.get("value"))
+        return pd.DataFrame(), stats
+
+    query = f"SELECT DISTINCT * FROM `{table_id}`"
+    query_parameters = []
+    latest_only = start_at_latest and "value" not in entry
+    if "value" in entry:
+        last_value = decode_json_value(entry["value"])
+        query += f" WHERE {column} > @watermark"
+        query_parameters.append(bigquery.ScalarQueryParameter("watermark", query_parameter_type(last_value), last_value))
+    if latest_only:
+        # Nothing newer than the newest row is left to read
+        query += f" ORDER BY {column} DESC LIMIT 1"
+        limit = None
+    else:
+        query += f" ORDER BY {column} ASC"
+    if limit is not None:
+        query += " LIMIT @limit"
+        query_parameters.append(bigquery.ScalarQueryParameter("limit", "INT64", limit))
+
+    job = client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=query_parameters))
+    df = job.result().to_dataframe(create_bqstorage_client=False)  # Incremental reads are small
+
+    stats.update({
+        "rows": len(df),
+        "drained": limit is None or len(df) < limit,
+        "bytes_processed": job.total_bytes_processed or 0,
+        "bytes_billed": job.total_bytes_billed or 0,
+        "cache_hit": job.cache_hit,
+        "latency_seconds": time.perf_counter() - start,
+    })
+    logger.info("Read %s new rows from %s in %.3fs, %s bytes processed, %s bytes billed",
+                stats["rows"], table_id, stats["latency_seconds"], stats["bytes_processed"], stats["bytes_billed"])
+    return df, stats
+
+
+def commit_incremental(watermark: Watermark, column: str, df, stats: dict):
+    """
+    Advance the watermark once the rows returned by read_incremental have been processed.
+    """
+    key = watermark_key(stats["table_id"], column)
+    if stats["skipped"]:
+        return
+    if not df.empty:
+        watermark.set(key, value=df[column].iloc[-1])
+    if stats["drained"] and stats["table_modified"] is not None:
+        watermark.set(key, drained_table_modified=stats["table_modified"])
+
+
+def query_parameter_type(value) -> str:
+    """
+    BigQuery type of a ScalarQueryParameter holding value.
+    """
+    if isinstance(value, datetime.datetime):
+        return "TIMESTAMP"
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, int):
+        return "INT64"
+    if isinstance(value, float):
+        return "FLOAT64"
+    return "STRING"
+
+
+def encode_json_value(value):
+    """
+    JSON-serializable form of a column value, for the watermarks and the Arrow cache manifests.
+    """
+    # JSON keeps ints, floats and strings; datetimes are tagged so they decode back to datetimes
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if hasattr(value, "item"):
+        return value.item()  # numpy scalar
+    return value
+
+
+def decode_json_value(value):
+    """
+    Column value of the output of encode_json_value.
+    """
+    if isinstance(value, dict) and "datetime" in value:
+        return datetime.datetime.fromisoformat(value["datetime"])
+    return value
@@ -0,0 +1,254 @@
+"""
+Trade journal: the orders, reprices, fills and positions of the trading path, written to BigQuery
+in the background.
+
+The trading path only appends events to an in-memory ring buffer, which costs a dict and a deque
+append and never waits on I/O. A background task started by the first append flushes the buffer
+in batches of at most JOURNAL_BATCH_SIZE rows, or every JOURNAL_FLUSH_INTERVAL_SECONDS, with a
+BigQuery load job run in a worker thread. A batch that cannot be written is spilled to a local
+JSONL file and loaded again before the next batch.
+
+Configuration, read once at import:
+    TRADE_JOURNAL_TABLE=project.dataset.table  destination table, journaling is off if not set
+    TRADE_JOURNAL_SPILL_DIR=/tmp/journal       directory of the batches that could not be written
+
+Usage:
+    from bigquery_utils.journal import journal
+
+    journal.append("order", order_id=order["order_id"], price=order["price"])
+    await journal.close()  # Before the event loop ends, e.g. at the end of a Cloud Function run
+"""
+import asyncio
+import collections
+import contextvars
+import datetime
+import glob
+import json
+import logging
+import os
+import time
+
+JOURNAL_CAPACITY = 10_000  # Oldest events are dropped, and counted, beyond this many unflushed events
+JOURNAL_BATCH_SIZE = 500
+JOURNAL_FLUSH_INTERVAL_SECONDS = 5
+JOURNAL_SPILL_DIR = os.environ.get("TRADE_JOURNAL_SPILL_DIR", "/tmp/deribit_trading/journal")
+
+JOURNAL_SCHEMA = [
+    ("event_time", "TIMESTAMP"),
+    ("event_type", "STRING"),
+    ("account", "STRING"),
+    ("instrument_name", "STRING"),
+    ("side", "STRING"),
+    ("order_id", "STRING"),
+    ("order_type", "STRING"),
+    ("order_state", "STRING"),
+    ("price", "FLOAT"),
+    ("amount", "FLOAT"),
+    ("details", "STRING"),  # JSON of the other fields of the event
+]
+_COLUMNS = {name for name, _ in JOURNAL_SCHEMA}
+
+# Fields added to every event appended in the current context, e.g. the account of a trade task
+journal_context = contextvars.ContextVar("journal_context", default={})
+
+
+def _write_rows(table_id, rows):
+    from bigquery_utils.bq_utils import append_rows
+    return append_rows(table_id, rows, JOURNAL_SCHEMA)
+
+
+class TradeJournal:
+    """
+    Ring buffer of trade events with a background, batched writer.
+    """
+
+    def __init__(self, table_id=None, capacity=JOURNAL_CAPACITY, batch_size=JOURNAL_BATCH_SIZE,
+                 flush_interval=JOURNAL_FLUSH_INTERVAL_SECONDS, spill_dir=JOURNAL_SPILL_DIR, writer=_write_rows):
+        """
+        Args:
+        - table_id: Destination BigQuery table. Events are discarded if it is None.
+        - capacity: Maximum number of buffered events.
+        - batch_size: Maximum number of rows per write.
+        - flush_interval: Seconds between two flushes of a partial batch.
+        - spill_dir: Directory where batches that failed to be written are kept.
+        - writer: Callable writer(table_id, rows) returning True on success, run in a worker thread.
+        """
+        self.table_id = table_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.writer = writer
+        self._buffer = collections.deque(maxlen=capacity)
+        self._task = None
+        self._stopping = False
+        self._loop = None
+        self._wakeup = None
+        self._flush_lock = None
+        self._spill_sequence = 0
+
+        self.appended = 0
+        self.dropped = 0
+        self.written = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+
+    @property
+    def enabled(self):
+        return self.table_id is not None
+
+    def append(self, event_type, **fields):
+        """
+        Record an event. Never blocks: the row is written later by the background task.
+        """
+        if not self.enabled:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((time.time(), event_type, journal_context.get(), fields))
+        self.appended += 1
+        self._ensure_started()
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Outside an event loop the events wait for the next flush()
+        self._bind(loop)
+        self._task = loop.create_task(self._run())
+
+    def _bind(self, loop):
+        # Each run of a Cloud Function has its own event loop, so the primitives are created per loop
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.warning(f"Trade journal flush failed: {e}")
+
+    async def flush(self):
+        """
+        Write the spilled batches, then the buffered events, in batches. If a write fails, the
+        remaining events are spilled to disk. Returns True if everything was written.
+        """
+        if not self.enabled:
+            return True
+        self._bind(asyncio.get_running_loop())
+        async with self._flush_lock:
+            if not await self._write_spilled():
+                # The table is still unreachable, keep the new events on disk behind the old ones
+                self._spill_buffer()
+                return False
+            while self._buffer:
+                rows = self._take_batch()
+                if not await self._write(rows):
+                    self._spill(rows)
+                    self._spill_buffer()
+                    return False
+            return True
+
+    async def close(self):
+        """
+        Stop the background task and write everything still buffered.
+        """
+        loop = asyncio.get_running_loop()
+        self._bind(loop)
+        task = self._task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            # Stopped rather than cancelled, so a flush in progress is never cut short
+            self._stopping = True
+            self._wakeup.set()
+            await task
+        self._task = None
+        self._stopping = False
+        return await self.flush()
+
+    def _take_batch(self):
+        rows = []
+        while self._buffer and len(rows) < self.batch_size:
+            rows.append(_to_row(*self._buffer.popleft()))
+        return rows
+
+    async def _write(self, rows):
+        try:
+            written = await asyncio.to_thread(self.writer, self.table_id, rows)
+        except Exception as e:
+            logging.warning(f"Trade journal write of {len(rows)} rows failed: {e}")
+            written = False
+        if written:
+            self.written += len(rows)
+        else:
+            self.failed_flushes += 1
+        return written
+
+    def _spill(self, rows):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._spill_sequence += 1
+        path = os.path.join(self.spill_dir, f"journal-{time.time_ns()}-{os.getpid()}-{self._spill_sequence}.jsonl")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(tmp_path, path)
+        self.spilled += len(rows)
+        logging.warning(f"Trade journal spilled {len(rows)} rows to {path}")
+
+    def _spill_buffer(self):
+        while self._buffer:
+            self._spill(self._take_batch())
+
+    async def _write_spilled(self):
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "journal-*.jsonl"))):
+            try:
+                with open(path) as f:
+                    rows = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                continue  # Loaded by another process sharing the spill directory
+            if rows and not await self._write(rows):
+                return False
+            os.remove(path)
+            logging.info(f"Trade journal loaded {len(rows)} spilled rows from {path}")
+        return True
+
+    def metrics(self):
+        return {
+            "buffered": len(self._buffer),
+            "appended": self.appended,
+            "dropped": self.dropped,
+            "written": self.written,
+            "spilled": self.spilled,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+def _to_row(timestamp, event_type, context, fields):
+    row = {"event_time": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(),
+           "event_type": event_type}
+    details = {}
+    for name, value in {**context, **fields}.items():
+        if name in _COLUMNS:
+            row[name] = value
+        elif value is not None:
+            details[name] = value
+    if row.get("order_id") is not None:
+        row["order_id"] = str(row["order_id"])
+    row["details"] = json.dumps(details, default=str) if details else None
+    return row
+
+
+journal = TradeJournal(os.environ.get("TRADE_JOURNAL_TABLE"))
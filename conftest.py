@@ -0,0 +1,3 @@
+"""
+Shared pytest configuration: the repository root is on sys.path, so the tests import the packages as the entry points do.
+"""
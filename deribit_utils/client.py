@@ -0,0 +1,252 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from deribit_utils import codec
+from deribit_utils.instruments import InstrumentCache
+from deribit_utils.rate_limiter import RateLimiter, is_rate_limited
+from telemetry_utils.telemetry import telemetry
+
+RATE_LIMIT_RETRIES = 3  # Resends of a request rejected with "too_many_requests", after the credits refill
+
+
+class DeribitClient:
+    """
+    JSON-RPC client that owns a single Deribit WebSocket connection.
+
+    Every request gets a unique id and its own future, and a single reader task routes each
+    response back to the request that sent it. Any number of requests can therefore be in
+    flight at the same time, and messages without a matching id (notifications, late answers
+    to timed out requests) no longer break the request/response pairing.
+
+    Subscription notifications are routed by channel to the handlers registered with
+    subscribe().
+
+    Requests are paced by a RateLimiter so they stay within the Deribit credit limits, and a
+    request rejected for exceeding them is sent again once credits are available.
+
+    Usage:
+        async with websockets.connect(url) as websocket:
+            async with DeribitClient(websocket) as client:
+                response = await client.request("public/ticker", {"instrument_name": "BTC-PERPETUAL"})
+    """
+
+    def __init__(self, websocket, request_timeout=10, rate_limiter=None):
+        """
+        Args:
+        - websocket: An open connection exposing async send() and recv().
+        - request_timeout: Seconds to wait for a response before giving up on a request.
+        - rate_limiter: RateLimiter pacing the requests, shared by the connections of an account.
+          A new one is created if not given.
+        """
+        self.websocket = websocket
+        self.request_timeout = request_timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._subscriptions = {}
+        self._reader_task = None
+        self._closed_error = None
+        self.reconnecting = None  # Future of the reconnection in progress, set by a SessionManager
+        self.instruments = InstrumentCache()
+        self.order_books = {}  # Local order books kept up to date on this connection, by instrument name
+        self.state_trackers = {}  # Order and position trackers fed by this connection, by instrument name
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        """
+        Start the background task reading responses from the socket.
+        """
+        if self._reader_task is None:
+            self._closed_error = None
+            self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def close(self):
+        """
+        Stop the reader task and fail every request still waiting for an answer.
+        """
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        self._fail_pending(ConnectionError("Deribit client closed"))
+
+    def attach(self, websocket):
+        """
+        Resume on a new connection after the previous one failed. Requests pending on the old
+        connection have already failed; the subscription handlers are kept, see resubscribe().
+        """
+        self.websocket = websocket
+        if self._reader_task is not None and self._reader_task.done():
+            self._reader_task = None
+        self.start()
+
+    async def wait_closed(self):
+        """
+        Wait until the connection fails or the client is closed.
+        """
+        if self._reader_task is not None:
+            await asyncio.wait([self._reader_task])
+
+    @property
+    def closed(self):
+        """
+        True once the connection has failed or the client has been closed.
+        """
+        return self._reader_task is None or self._reader_task.done()
+
+    async def request(self, method, params=None, priority=None, wait_connected=True):
+        """
+        Send a JSON-RPC request and wait for its response.
+
+        Args:
+        - method: JSON-RPC method name, e.g. "private/buy".
+        - params: Dict of method parameters, or the TemplatedParams of a codec.RequestTemplate.
+        - priority: Rate limiter priority, lower first. Derived from the method if not given.
+        - wait_connected: Wait for a reconnection in progress before sending. Only the requests of
+          the reconnection itself (auth, resubscriptions) go out without waiting.
+
+        Returns:
+        - The full decoded response message, including "result" or "error".
+        """
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            await self.rate_limiter.acquire(method, priority)
+            response = await self._send_request(method, params, wait_connected)
+            if not is_rate_limited(response) or attempt == RATE_LIMIT_RETRIES:
+                return response
+            logging.warning(f"{method} rejected by the rate limit, retrying (attempt {attempt + 1})")
+            self.rate_limiter.penalize(method)
+
+    async def _send_request(self, method, params, wait_connected=True):
+        if wait_connected and self.reconnecting is not None:
+            await asyncio.wait_for(asyncio.shield(self.reconnecting), self.request_timeout)
+        if self._closed_error is not None:
+            raise ConnectionError("Deribit connection is closed") from self._closed_error
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = codec.encode_request(request_id, method, params)
+        start = time.perf_counter()
+        try:
+            await self.websocket.send(message)
+            return await asyncio.wait_for(future, self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+            telemetry.record(f"rpc.{method}", time.perf_counter() - start)  # Round trip, without the rate limiter queue
+
+    async def subscribe(self, channels, handler):
+        """
+        Subscribe to Deribit channels and route their notifications to handler.
+
+        Args:
+        - channels: List of channel names, e.g. ["ticker.BTC-PERPETUAL.raw"].
+        - handler: Callable invoked as handler(channel, data) from the reader task. It must not block.
+
+        Returns:
+        - The subscribe response, or None if every channel was already subscribed. If the request
+          fails, with an error response or an exception, handler is removed from channels again,
+          so that the next subscribe() sends the request again.
+        """
+        new_channels = [channel for channel in channels if channel not in self._subscriptions]
+        for channel in channels:
+            self._subscriptions.setdefault(channel, []).append(handler)
+        if not new_channels:
+            return None
+        try:
+            response = await self.request(_subscription_method("subscribe", new_channels), {"channels": new_channels})
+        except BaseException:
+            self._remove_handler(channels, handler)
+            raise
+        if "error" in response:
+            logging.warning(f"Subscription to {new_channels} failed: {response['error']}")
+            self._remove_handler(channels, handler)
+        return response
+
+    async def resubscribe(self, channels=None):
+        """
+        Subscribe the new connection of attach() again to channels, every channel with a handler
+        by default. Does not wait for the reconnection in progress.
+        """
+        channels = list(self._subscriptions) if channels is None else channels
+        if not channels:
+            return None
+        return await self.request(_subscription_method("subscribe", channels), {"channels": channels},
+                                  wait_connected=False)
+
+    def subscribed_channels(self):
+        return list(self._subscriptions)
+
+    async def unsubscribe(self, channels, handler):
+        """
+        Remove handler from channels, unsubscribing channels that have no handler left.
+        """
+        unused_channels = self._remove_handler(channels, handler)
+        if not unused_channels or self._closed_error is not None:
+            return None
+        return await self.request(_subscription_method("unsubscribe", unused_channels), {"channels": unused_channels})
+
+    def _remove_handler(self, channels, handler):
+        """
+        Remove handler from channels and return the channels left without a handler.
+        """
+        unused_channels = []
+        for channel in channels:
+            handlers = self._subscriptions.get(channel, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            if not handlers and channel in self._subscriptions:
+                del self._subscriptions[channel]
+                unused_channels.append(channel)
+        return unused_channels
+
+    async def _read_loop(self):
+        try:
+            while True:
+                message = await self.websocket.recv()
+                self._dispatch(codec.loads(message))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Deribit connection reader stopped: {e}")
+            self._closed_error = e
+            self._fail_pending(e)
+
+    def _dispatch(self, message):
+        future = self._pending.get(message.get("id"))
+        if future is not None:
+            if not future.done():
+                future.set_result(message)
+            return
+        if message.get("method") == "subscription":
+            params = message["params"]
+            for handler in list(self._subscriptions.get(params["channel"], ())):
+                try:
+                    handler(params["channel"], params["data"])
+                except Exception as e:
+                    # A faulty handler must not stop the reader and fail every pending request
+                    logging.exception(f"Handler of {params['channel']} failed: {e}")
+            return
+        logging.debug(f"Unrouted Deribit message: {message}")
+
+    def _fail_pending(self, error):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+
+def _subscription_method(action, channels):
+    # user.* channels are only available through the private endpoint
+    scope = "private" if any(channel.startswith("user.") for channel in channels) else "public"
+    return f"{scope}/{action}"
@@ -0,0 +1,92 @@
+"""
+JSON encoding of the Deribit WebSocket messages.
+
+orjson is used when it is installed, the standard library json module otherwise. Set
+DERIBIT_JSON_CODEC=json to force the standard library.
+
+Requests are encoded from pre-serialized parts: the JSON-RPC envelope of each method is built
+once, and RequestTemplate serializes the parameters that never change between calls of a helper
+(order type, post_only, time_in_force, ...) once, so only the varying values are encoded per call.
+"""
+import json
+import os
+
+CODEC = os.environ.get("DERIBIT_JSON_CODEC", "orjson")
+
+orjson = None
+if CODEC != "json":
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+if orjson is not None:
+    name = "orjson"
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+else:
+    name = "json"
+    loads = json.loads
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+
+_envelopes = {}
+
+
+def encode_request(request_id, method, params=None):
+    """
+    Encode a JSON-RPC request. params may be a dict, None, or the TemplatedParams of a RequestTemplate.
+    """
+    envelope = _envelopes.get(method)
+    if envelope is None:
+        envelope = _envelopes[method] = f'{{"jsonrpc":"2.0","method":{dumps(method)},"params":'
+    if isinstance(params, TemplatedParams):
+        encoded_params = params.encode()
+    else:
+        encoded_params = dumps(params) if params else "{}"
+    return f'{envelope}{encoded_params},"id":{request_id}}}'
+
+
+class RequestTemplate:
+    """
+    Parameters of a request whose fixed part is serialized once.
+
+    Usage:
+        LIMIT_ORDER = RequestTemplate(type="limit", post_only=True)
+        await client.request("private/buy", LIMIT_ORDER(instrument_name="BTC-PERPETUAL", amount=10, price=30000))
+    """
+
+    __slots__ = ("fixed", "_fragment")
+
+    def __init__(self, **fixed):
+        self.fixed = fixed
+        self._fragment = dumps(fixed)[1:-1]
+
+    def __call__(self, **params):
+        return TemplatedParams(self, params)
+
+
+class TemplatedParams:
+    """
+    The fixed parameters of a RequestTemplate completed with the values of one call.
+    """
+
+    __slots__ = ("template", "params")
+
+    def __init__(self, template, params):
+        self.template = template
+        self.params = params
+
+    def encode(self):
+        fragment = self.template._fragment
+        if not self.params:
+            return f"{{{fragment}}}"
+        variable = dumps(self.params)
+        if not fragment:
+            return variable
+        return f"{{{fragment},{variable[1:]}"
+
+    def to_dict(self):
+        return {**self.template.fixed, **self.params}
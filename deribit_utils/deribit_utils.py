@@ -1,53 +1,105 @@
-import pandas_ta as ta
-import requests
-import json
-import websockets
 import asyncio
-import pandas as pd
-import numpy as np
-import time
+import contextvars
+import datetime
 import logging
-from gcp_utils.secret_manager import GCPManager
-
-# Subacount btcridermulti
+from bigquery_utils.journal import journal
+from deribit_utils.client import DeribitClient
+from deribit_utils.codec import RequestTemplate
+from deribit_utils.order_book import LocalOrderBook
+from deribit_utils.records import Order, Position, PreTradeSnapshot, Ticker
+from deribit_utils.state_tracker import STATE_WAIT_TIMEOUT_SECONDS, get_state_tracker
+from telemetry_utils.telemetry import telemetry, traced
 
 # Deribit  API URL for authentication
 auth_url = "https://deribit.com/api/v2/public/auth"
+# Deribit WebSocket API URL
+websocket_url = "wss://www.deribit.com/ws/api/v2"
 # Deribit  API URL for placing an order
 order_url = "https://deribit.com/api/v2/private/buy"  # Change "buy" to "sell" for a sell order
 
-# Create an instance of the GCPManager with your project Id
-project_id = "trading-etl"
-gcp_manager = GCPManager(project_id=project_id)
-
-# Access the secrets
-api_key = gcp_manager.access_secret_version(secret_id="btcridermulti-api-key")
-api_secret = gcp_manager.access_secret_version(secret_id="btcridermulti-api-secret")
-
-
-# Prepare the authentication data
-auth_data = {
-    "jsonrpc": "2.0",
-    "id": 1,
-    "method": "public/auth",
-    "params": {
-        "grant_type": "client_credentials",  # Authentication method
-        "client_id": api_key,
-        "client_secret": api_secret
-    }
-}
-
 # Others trading parameters
-cl_ord_id = "b14"
+cl_ord_id = "b14"  # Prefix of the run keys and order labels of this strategy
 
 # Global configuration variables
 INSTRUMENT_NAME = "BTC-PERPETUAL"
-TICK_SIZE = 0.5  # Tick size for rounding
+TICK_SIZE = 0.5  # Default tick size, used only when the exchange metadata is unavailable
+CONTRACT_SIZE = 10  # Default contract size, used only when the exchange metadata is unavailable
 STOP_LOSS_PERCENTAGE = 0.09  # 9% for stop loss
 TAKE_PROFIT_PERCENTAGE = 0.09  # 9% for take profit
+LONG_SIZE_MULTIPLIER = 2  # Long positions are opened at 2x the available balance
+SHORT_SIZE_MULTIPLIER = 4  # Short positions are opened at 4x the available balance
 TIME_LIMIT_SECONDS = 200  # Time limit for order execution in seconds
+CHASE_OFFSET_TICKS = 2  # The chased limit order rests this many ticks behind the best bid/ask
+CHASE_TOLERANCE_TICKS = 1  # The order is repriced once it is more than this many ticks from its target
+STREAMING_ORDER_CHASE = True  # Chase orders from ticker/order subscriptions instead of polling
+BRACKET_LEG_RETRIES = 2  # Extra attempts for a stop loss or take profit leg rejected by the exchange
+PRE_TRADE_SNAPSHOT_MAX_AGE_SECONDS = 1  # The best bid/ask of an older snapshot are not used to price an order
+
+# Fixed parameters of the order requests, serialized once
+LIMIT_ORDER_PARAMS = RequestTemplate(type="limit", post_only=True, time_in_force="good_til_cancelled", reduce_only=False)
+EDIT_ORDER_PARAMS = RequestTemplate(post_only=True)
+MARKET_ORDER_PARAMS = RequestTemplate(type="market", reduce_only=False)
+TRIGGER_ORDER_PARAMS = RequestTemplate(trigger="last_price", reduce_only=True, time_in_force="good_til_cancelled")
+
+# Price when the current signal was acted on, the reference for the slippage of its orders
+signal_price = contextvars.ContextVar("signal_price", default=None)
+# Labels of the orders of the current run, see OrderLabels
+order_labels = contextvars.ContextVar("order_labels", default=None)
+# Loop time when the current signal was received, cleared once its first order is sent
+signal_received = contextvars.ContextVar("signal_received", default=None)
+
+
+def signal_run_key(df):
+    """
+    Deterministic key of the run acting on the first signal bar of df: cl_ord_id and the bar open
+    time in UTC, e.g. "b14-202401011300". None if df has no open_time column.
+    """
+    if df.empty or "open_time" not in df:
+        return None
+    open_time = df["open_time"].iloc[0]
+    seconds = open_time.timestamp() if hasattr(open_time, "timestamp") else float(open_time)
+    return f"{cl_ord_id}-{datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc):%Y%m%d%H%M}"
 
-async def authenticate(api_key, api_secret, connection_type="websocket", websocket=None, auth_url=None):
+
+class OrderLabels:
+    """
+    Labels of the orders of one run on one instrument, "{run_key}-{instrument_name}-{n}" with n
+    counting the orders in the order they are sent. The run of a bar repeated on the same
+    instrument produces the same labels, so the label of its first order tells whether the run
+    already reached the exchange.
+    """
+
+    def __init__(self, run_key, instrument_name):
+        self.prefix = f"{run_key}-{instrument_name}"
+        self.count = 0
+
+    @property
+    def first(self):
+        return f"{self.prefix}-1"
+
+    def next(self):
+        self.count += 1
+        return f"{self.prefix}-{self.count}"
+
+
+def _label_params():
+    labels = order_labels.get()
+    return {} if labels is None else {"label": labels.next()}
+
+
+def _record_first_order(instrument_name):
+    # The first entry order of a run measures how long the signal took to reach the exchange
+    received = signal_received.get()
+    if received is None:
+        return
+    signal_received.set(None)
+    latency = asyncio.get_running_loop().time() - received
+    telemetry.record("order.signal_to_first_order", latency)
+    logging.info(f"First {instrument_name} order sent {latency * 1000:.1f}ms after the signal")
+
+
+@traced()
+async def authenticate(api_key, api_secret, connection_type="websocket", client=None, auth_url=None):
     """
     Authenticate with the Deribit API.
 
@@ -55,7 +107,7 @@ async def authenticate(api_key, api_secret, connection_type="websocket", websock
     - api_key: Your API key
     - api_secret: Your API secret
     - connection_type: "websocket" or "http"
-    - websocket: WebSocket connection object (required if connection_type is "websocket")
+    - client: DeribitClient owning the WebSocket connection (required if connection_type is "websocket")
     - auth_url: Authentication URL (required if connection_type is "http")
 
     Returns:
@@ -76,13 +128,13 @@ async def authenticate(api_key, api_secret, connection_type="websocket", websock
 
     if connection_type == "http":
         # HTTP authentication
+        import requests
         response = requests.post(auth_url, json=auth_msg)
         if response.status_code == 200:
             auth_response = response.json()
             access_token = auth_response["result"]["access_token"]
             expires_in = auth_response["result"]["expires_in"]
-            print(f"Access Token: {access_token}")
-            print(f"Expires in: {expires_in} seconds")
+            print(f"Authenticated, token expires in {expires_in} seconds")
             return access_token
         else:
             print(f"Failed to authenticate. Status code: {response.status_code}")
@@ -91,153 +143,194 @@ async def authenticate(api_key, api_secret, connection_type="websocket", websock
 
     elif connection_type == "websocket":
         # WebSocket authentication
-        await websocket.send(json.dumps(auth_msg))
-        response = await websocket.recv()
-        response_json = json.loads(response)
+        response_json = await client.request(auth_msg["method"], auth_msg["params"])
         if "result" in response_json and "access_token" in response_json["result"]:
-            print("WebSocket Auth Response:", response)
+            # The response holds the access and refresh tokens, never print it
+            print(f"WebSocket authenticated, token expires in {response_json['result'].get('expires_in')} seconds")
             return True
         else:
-            print("WebSocket Authentication failed:", response)
+            print("WebSocket Authentication failed:", response_json.get("error"))
             return False
 
     else:
         print("Invalid connection type. Choose either 'http' or 'websocket'.")
         return None
 
-async def get_available_balance_btc(websocket):
-    balance_request = {
-        "jsonrpc": "2.0",
-        "id": 4219,
-        "method": "private/get_account_summary",
-        "params": {
-            "currency": "BTC"
-        }
-    }
-
-    await websocket.send(json.dumps(balance_request))
-    response = await websocket.recv()
-    balance_data = json.loads(response)
+@traced()
+async def get_available_balance_btc(client, currency="BTC"):
+    balance_data = await client.request("private/get_account_summary", {
+        "currency": currency
+    })
 
     if "result" in balance_data:
         return balance_data["result"]["available_funds"]
     else:
-        print("Error retrieving BTC balance:", balance_data)
+        print(f"Error retrieving {currency} balance:", balance_data)
         return 0
 
-async def get_btc_usd_price(websocket):
-    price_request = {
-        "jsonrpc": "2.0",
-        "id": 4220,
-        "method": "public/ticker",
-        "params": {
-            "instrument_name": INSTRUMENT_NAME
-        }
-    }
-
-    await websocket.send(json.dumps(price_request))
-    response = await websocket.recv()
-    price_data = json.loads(response)
+@traced()
+async def get_btc_usd_price(client, instrument_name=INSTRUMENT_NAME):
+    price_data = await client.request("public/ticker", {
+        "instrument_name": instrument_name
+    })
 
     if "result" in price_data:
         return price_data["result"]["last_price"]
     else:
-        print("Error retrieving BTC/USD price:", price_data)
+        print(f"Error retrieving {instrument_name} price:", price_data)
         return 0
 
-async def calculate_usd_quantity_from_btc(websocket):
-    available_balance_btc = await get_available_balance_btc(websocket)
-    btc_usd_price = await get_btc_usd_price(websocket)
+@traced()
+async def get_ticker(client, instrument_name=INSTRUMENT_NAME):
+    response = await client.request("public/ticker", {
+        "instrument_name": instrument_name
+    })
+
+    if "result" in response:
+        return Ticker.from_dict(response["result"])
+    else:
+        print(f"Error retrieving {instrument_name} ticker:", response)
+        return None
+
+@traced()
+async def calculate_usd_quantity_from_btc(client, instrument_name=INSTRUMENT_NAME):
+    # Both requests are independent, send them together over the multiplexed connection
+    available_balance_btc, btc_usd_price = await asyncio.gather(
+        get_available_balance_btc(client, instrument_currency(instrument_name)),
+        get_btc_usd_price(client, instrument_name)
+    )
+    return usd_quantity_from_btc(available_balance_btc, btc_usd_price)
+
+def instrument_currency(instrument_name):
+    """
+    Returns the base currency of an instrument, e.g. "ETH" for "ETH-PERPETUAL".
+    Perpetuals are inverse contracts, so it is also the margin and settlement currency.
+    """
+    return instrument_name.split("-")[0]
 
+def usd_quantity_from_btc(available_balance_btc, btc_usd_price):
     if available_balance_btc > 0 and btc_usd_price > 0:
         quantity_usd = available_balance_btc * btc_usd_price - 10  # Subtract $10 buffer
         return int(quantity_usd)  # Round down to nearest USD amount
     else:
         return 0
 
-async def get_current_position(websocket):
-    position_msg = {
-        "jsonrpc": "2.0",
-        "id": 4217,
-        "method": "private/get_positions",
-        "params": {
-            "currency": "BTC",
-            "kind": "future"
-        }
-    }
-    await websocket.send(json.dumps(position_msg))
-    response = await websocket.recv()
-    response_json = json.loads(response)
-    if response_json.get("result"):
-        # Return the full position details
-        return response_json["result"][0]
+@traced()
+async def get_current_position(client, instrument_name=INSTRUMENT_NAME):
+    response_json = await client.request("private/get_positions", {
+        "currency": instrument_currency(instrument_name),
+        "kind": "future"
+    })
+    for position in response_json.get("result") or []:
+        if position.get("instrument_name", instrument_name) == instrument_name:
+            return Position.from_dict(position)
     return None
 
-async def cancel_order(websocket, order_id):
-    cancel_order_msg = {
-        "jsonrpc": "2.0",
-        "id": 4222,
-        "method": "private/cancel",
-        "params": {
-            "order_id": order_id
-        }
-    }
+async def get_tracked_position(client, instrument_name=INSTRUMENT_NAME):
+    """
+    Returns the position kept up to date by the StateTracker of the connection, without a request,
+    or requests it if no tracker of instrument_name is subscribed.
+    """
+    tracker = client.state_trackers.get(instrument_name)
+    if tracker is not None and tracker.client is not None and tracker.position is not None:
+        return tracker.position
+    return await get_current_position(client, instrument_name)
 
-    await websocket.send(json.dumps(cancel_order_msg))
-    response = await websocket.recv()
-    return json.loads(response)
+@traced()
+async def get_pre_trade_snapshot(client, instrument_name=INSTRUMENT_NAME, label=None):
+    """
+    Gathers what the trading logic reads before its first order in one concurrent round: the
+    available balance, the ticker, the position, the instrument metadata and, if label is given,
+    the orders already sent with that label. The position and the metadata cost no request when
+    a StateTracker and the instrument cache of the connection already hold them.
 
-async def place_limit_order(websocket, side, quantity, price, instrument_name=INSTRUMENT_NAME):
-    instrument_details = await get_instrument_details(websocket, instrument_name)
-    tick_size = instrument_details.get('tick_size', 0.5)
-    price = round(price / tick_size) * tick_size
+    Returns:
+    - A PreTradeSnapshot.
+    """
+    currency = instrument_currency(instrument_name)
+    lookups = [
+        get_available_balance_btc(client, currency),
+        get_ticker(client, instrument_name),
+        get_tracked_position(client, instrument_name),
+        get_instrument_details(client, instrument_name)
+    ]
+    if label is not None:
+        lookups.append(get_orders_by_label(client, label, currency))
+    available_balance, ticker, position, instrument_details, *sent_orders = await asyncio.gather(*lookups)
+    return PreTradeSnapshot(instrument_name, asyncio.get_running_loop().time(), available_balance, ticker,
+                            position, instrument_details, sent_orders[0] if sent_orders else ())
+
+@traced()
+async def cancel_order(client, order_id):
+    response = await client.request("private/cancel", {
+        "order_id": order_id
+    })
+    if "result" in response:
+        journal_order("cancel", response["result"])
+    return response
+
+
+def journal_order(event_type, order):
+    """
+    Append an order state to the trade journal. Only buffers the event, the write happens in the background.
+    """
+    if not journal.enabled or not order:
+        return
+    price = order.get("price")
+    journal.append(
+        event_type,
+        instrument_name=order.get("instrument_name"),
+        side=order.get("direction"),
+        order_id=order.get("order_id"),
+        order_type=order.get("order_type"),
+        order_state=order.get("order_state"),
+        price=price if isinstance(price, (int, float)) else None,  # "market_price" for market orders
+        amount=order.get("amount"),
+        filled_amount=order.get("filled_amount"),
+        average_price=order.get("average_price"),
+        trigger_price=order.get("trigger_price"),
+        label=order.get("label")
+    )
 
-    order_data = {
-        "jsonrpc": "2.0",
-        "id": 4215,
-        "method": f"private/{side}",
-        "params": {
-            "instrument_name": instrument_name,
-            "amount": quantity,
-            "type": "limit",
-            "price": price,
-            "post_only": True,
-            "time_in_force": "good_til_cancelled",
-            "reduce_only": False
-        }
-    }
+@traced()
+async def place_limit_order(client, side, quantity, price, instrument_name=INSTRUMENT_NAME):
+    instrument_details = await get_instrument_details(client, instrument_name)
+    price = round_to_tick_size(price, instrument_details)
 
-    await websocket.send(json.dumps(order_data))
-    response = await websocket.recv()
-    response_json = json.loads(response)
+    _record_first_order(instrument_name)
+    response_json = await client.request(f"private/{side}", LIMIT_ORDER_PARAMS(
+        instrument_name=instrument_name,
+        amount=quantity,
+        price=price,
+        **_label_params()
+    ))
 
     if "result" not in response_json:
         print(f"Error placing limit order: {response_json}")
         return None
 
+    journal_order("order", response_json["result"]["order"])
     return response_json
 
-async def get_instrument_details(websocket, instrument_name):
-    details_request = {
-        "jsonrpc": "2.0",
-        "id": 4221,
-        "method": "public/get_instrument",
-        "params": {
-            "instrument_name": instrument_name
-        }
-    }
-    await websocket.send(json.dumps(details_request))
-    response = await websocket.recv()
-    details_data = json.loads(response)
-    if "result" in details_data:
-        return details_data["result"]
-    else:
-        print("Error retrieving instrument details:", details_data)
-        return {}
+@traced()
+async def get_instrument_details(client, instrument_name):
+    """
+    Returns the instrument metadata, served from the connection's TTL cache after the first request.
+    """
+    return await client.instruments.get(client, instrument_name)
+
+def round_to_tick_size(price, instrument_details):
+    """
+    Rounds a price to the nearest multiple of the instrument tick size.
+    """
+    tick_size = instrument_details.get("tick_size") or TICK_SIZE
+    return round(price / tick_size) * tick_size
 
-async def handle_long_signal(websocket, quantity):
+@traced()
+async def handle_long_signal(client, quantity, instrument_name=INSTRUMENT_NAME, snapshot=None):
     logging.info("Handling long signal")
-    current_position = await get_current_position(websocket)
+    # The pre-trade snapshot of the run already holds the position
+    current_position = snapshot.position if snapshot is not None else await get_current_position(client, instrument_name)
     logging.debug(f"Current position: {current_position}")
 
     if current_position and current_position["direction"] == "buy":
@@ -247,24 +340,32 @@ async def handle_long_signal(websocket, quantity):
     # Cancel all existing orders only if reversing from short to long
     if current_position and current_position["direction"] == "sell":
         logging.info("Closing existing short position")
-        await cancel_all_orders(websocket)  # Cancel existing orders
-        await monitor_and_update_order(websocket, "buy", abs(current_position["size"]))
-        while await get_current_position_quantity(websocket) < 0:
-            logging.debug("Waiting for short position to close...")
-            await asyncio.sleep(1)
+        # Cancel existing orders of this instrument while the tracker subscribes
+        tracker, _ = await asyncio.gather(get_state_tracker(client, instrument_name),
+                                          cancel_all_orders(client, instrument_name))
+        await monitor_and_update_order(client, "buy", abs(current_position["size"]), instrument_name=instrument_name,
+                                       snapshot=snapshot)
+        try:
+            await tracker.wait_until_flat()
+        except asyncio.TimeoutError:
+            print("Short position did not close in time. No long position opened.")
+            return
 
     logging.info("Opening new long position")
-    execution_price = await monitor_and_update_order(websocket, "buy", quantity)
+    execution_price = await monitor_and_update_order(client, "buy", quantity, instrument_name=instrument_name,
+                                                     snapshot=snapshot)
 
     if execution_price:
         logging.debug(f"Execution price for long position: {execution_price}")
         logging.info("Placing stop-loss and take-profit orders for long position")
-        await place_take_profit_and_stop_loss_orders(websocket, execution_price, quantity,
-                                                     "buy")  # Use "buy" for long position
+        await place_take_profit_and_stop_loss_orders(client, execution_price, quantity,
+                                                     "buy", instrument_name)  # Use "buy" for long position
 
-async def handle_short_signal(websocket, quantity):
+@traced()
+async def handle_short_signal(client, quantity, instrument_name=INSTRUMENT_NAME, snapshot=None):
     logging.info("Handling short signal")
-    current_position = await get_current_position(websocket)
+    # The pre-trade snapshot of the run already holds the position
+    current_position = snapshot.position if snapshot is not None else await get_current_position(client, instrument_name)
     logging.debug(f"Current position: {current_position}")
 
     if current_position and current_position["direction"] == "sell":
@@ -274,212 +375,522 @@ async def handle_short_signal(websocket, quantity):
     # Cancel all existing orders only if reversing from long to short
     if current_position and current_position["direction"] == "buy":
         logging.info("Closing existing long position")
-        await cancel_all_orders(websocket)  # Cancel existing orders
-        await monitor_and_update_order(websocket, "sell", abs(current_position["size"]))
-        while await get_current_position_quantity(websocket) > 0:
-            logging.debug("Waiting for long position to close...")
-            await asyncio.sleep(1)
+        # Cancel existing orders of this instrument while the tracker subscribes
+        tracker, _ = await asyncio.gather(get_state_tracker(client, instrument_name),
+                                          cancel_all_orders(client, instrument_name))
+        await monitor_and_update_order(client, "sell", abs(current_position["size"]), instrument_name=instrument_name,
+                                       snapshot=snapshot)
+        try:
+            await tracker.wait_until_flat()
+        except asyncio.TimeoutError:
+            print("Long position did not close in time. No short position opened.")
+            return
 
     logging.info("Opening new short position")
-    execution_price = await monitor_and_update_order(websocket, "sell", quantity)
+    execution_price = await monitor_and_update_order(client, "sell", quantity, instrument_name=instrument_name,
+                                                     snapshot=snapshot)
 
     if execution_price:
         logging.debug(f"Execution price for short position: {execution_price}")
         logging.info("Placing stop-loss and take-profit orders for short position")
-        await place_take_profit_and_stop_loss_orders(websocket, execution_price, quantity,
-                                                     "sell")  # Use "sell" for short position
+        await place_take_profit_and_stop_loss_orders(client, execution_price, quantity,
+                                                     "sell", instrument_name)  # Use "sell" for short position
 
 
-def adjust_quantity_to_contract_size(quantity, contract_size):
+def adjust_quantity_to_contract_size(quantity, contract_size, min_trade_amount=0):
     """
     Adjusts the quantity to the nearest lower multiple of the contract size.
+    Returns 0 if the result is below the instrument minimum trade amount.
+    """
+    quantity = (quantity // contract_size) * contract_size
+    return quantity if quantity >= min_trade_amount else 0
+
+def adjust_quantity_to_instrument(quantity, instrument_details):
+    """
+    Adjusts the quantity using the contract size and minimum trade amount of the instrument metadata.
     """
-    return (quantity // contract_size) * contract_size
+    return adjust_quantity_to_contract_size(
+        quantity,
+        instrument_details.get("contract_size") or CONTRACT_SIZE,
+        instrument_details.get("min_trade_amount", 0)
+    )
+
+@traced()
+async def monitor_and_update_order(client, side, quantity, streaming=None, instrument_name=INSTRUMENT_NAME, snapshot=None):
+    """
+    Executes quantity with a chased post-only limit order, then a market order after TIME_LIMIT_SECONDS.
+    Records the time to fill and the slippage against the signal price. The instrument metadata
+    is taken from the pre-trade snapshot of the run if one is given.
 
-async def monitor_and_update_order(websocket, side, quantity):
-    adjusted_quantity = adjust_quantity_to_contract_size(quantity, 10)  # Assuming contract size is 10
+    Returns:
+    - The average execution price once the full quantity is filled, otherwise None.
+    """
+    if streaming is None:
+        streaming = STREAMING_ORDER_CHASE
+    clock = asyncio.get_running_loop().time
+    start_time = clock()
+    if streaming:
+        execution_price = await monitor_and_update_order_streaming(client, side, quantity, instrument_name, snapshot)
+    else:
+        execution_price = await monitor_and_update_order_polling(client, side, quantity, instrument_name, snapshot)
+
+    if execution_price:
+        time_to_fill = clock() - start_time
+        telemetry.record("order.time_to_fill", time_to_fill)
+        reference_price = signal_price.get()
+        slippage_bps = None
+        if reference_price:
+            # Positive when the fill is worse than the signal price
+            direction = 1 if side == "buy" else -1
+            slippage_bps = direction * (execution_price - reference_price) / reference_price * 10_000
+            telemetry.record("order.slippage_bps", slippage_bps)
+        telemetry.event("fill", instrument_name=instrument_name, side=side, quantity=quantity, execution_price=execution_price,
+                        signal_price=reference_price, slippage_bps=slippage_bps, time_to_fill=time_to_fill)
+        journal.append("fill", instrument_name=instrument_name, side=side, amount=quantity, price=execution_price,
+                       signal_price=reference_price, slippage_bps=slippage_bps, time_to_fill=time_to_fill)
+    else:
+        telemetry.increment("order.unfilled")
+        journal.append("unfilled", instrument_name=instrument_name, side=side, amount=quantity)
+    return execution_price
+
+@traced()
+async def monitor_and_update_order_polling(client, side, quantity, instrument_name=INSTRUMENT_NAME, snapshot=None):
+    """
+    Polling version of the order chase: reads the order book and the order state every second.
+    """
+    if snapshot is not None:
+        instrument_details = snapshot.instrument_details
+    else:
+        instrument_details = await get_instrument_details(client, instrument_name)
+    tick_size = instrument_details.get("tick_size") or TICK_SIZE
+    adjusted_quantity = adjust_quantity_to_instrument(quantity, instrument_details)
     remaining_quantity = adjusted_quantity
     last_order_id = None
-    tolerance = 0.5
-    start_time = time.time()
+    tolerance = tick_size*CHASE_TOLERANCE_TICKS
+    clock = asyncio.get_running_loop().time  # Follows the virtual clock when run in the simulator
+    start_time = clock()
     execution_price = None
 
-    while remaining_quantity > 0:
-        order_book = await get_order_book(websocket)
-        best_bid = order_book.get("best_bid_price", 0)
-        best_ask = order_book.get("best_ask_price", 0)
-        target_price = best_bid - (TICK_SIZE*2) if side == "buy" else best_ask + (TICK_SIZE*2)
-
-        if last_order_id:
-            order_details = await get_order_details(websocket, last_order_id)
-            if order_details:
-                current_order_price = order_details.get("price", 0)
-                filled_amount = order_details.get("filled_amount", 0)
-                if filled_amount >= remaining_quantity:
-                    execution_price = current_order_price
-                    remaining_quantity = 0
-                    break
+    # Keep a local order book from incremental updates instead of fetching a full snapshot every second
+    local_order_book = LocalOrderBook(instrument_name)
+    try:
+        await local_order_book.start(client)
+    except asyncio.TimeoutError:
+        print("Order book snapshot not received, falling back to order book requests.")
 
-                if abs(current_order_price - target_price) > tolerance:
-                    await cancel_order(websocket, last_order_id)
-                    last_order_id = None
-
-        if last_order_id is None:
-            order_response = await place_limit_order(websocket, side, remaining_quantity, target_price)
-            if order_response:
-                last_order_id = order_response["result"]["order"]["order_id"]
-
-        # Execute market order if timeout is reached
-        if time.time() - start_time > TIME_LIMIT_SECONDS:
-            await cancel_order(websocket, last_order_id)
-            print(f"Time limit reached. Placing market order for remaining quantity: {remaining_quantity}")
-            market_order_response = await place_market_order(websocket, side, remaining_quantity)
-
-            # Check if market order was filled and get execution price
-            if market_order_response:
-                last_order_id = market_order_response["result"]["order"]["order_id"]
-                while True:
-                    order_details = await get_order_details(websocket, last_order_id)
-                    if order_details and order_details["order_state"] == "filled":
-                        execution_price = order_details.get("average_price", None)
+    try:
+        while remaining_quantity > 0:
+            order_book = await get_order_book(client, instrument_name)
+            best_bid = order_book.get("best_bid_price", 0)
+            best_ask = order_book.get("best_ask_price", 0)
+            target_price = best_bid - tick_size*CHASE_OFFSET_TICKS if side == "buy" else best_ask + tick_size*CHASE_OFFSET_TICKS
+
+            if last_order_id:
+                order_details = await get_order_details(client, last_order_id)
+                if order_details:
+                    current_order_price = order_details.get("price", 0)
+                    filled_amount = order_details.get("filled_amount", 0)
+                    if filled_amount >= remaining_quantity:
+                        execution_price = current_order_price
                         remaining_quantity = 0
                         break
-            break
 
-        await asyncio.sleep(1)
+                    if abs(current_order_price - target_price) > tolerance:
+                        await cancel_order(client, last_order_id)
+                        telemetry.increment("order.reprices")
+                        last_order_id = None
+
+            if last_order_id is None:
+                order_response = await place_limit_order(client, side, remaining_quantity, target_price, instrument_name)
+                if order_response:
+                    last_order_id = order_response["result"]["order"]["order_id"]
+
+            # Execute market order if timeout is reached
+            if clock() - start_time > TIME_LIMIT_SECONDS:
+                await cancel_order(client, last_order_id)
+                print(f"Time limit reached. Placing market order for remaining quantity: {remaining_quantity}")
+                tracker = await get_state_tracker(client, instrument_name)
+                market_order_response = await place_market_order(client, side, remaining_quantity, instrument_name)
+
+                # Wait for the fill notification of the market order and get execution price
+                if market_order_response:
+                    tracker.track(market_order_response["result"]["order"])
+                    try:
+                        order_details = await tracker.wait_until_filled(market_order_response["result"]["order"]["order_id"])
+                    except asyncio.TimeoutError:
+                        print("Market order not filled in time.")
+                    else:
+                        if order_details["order_state"] == "filled":
+                            execution_price = order_details.get("average_price", None)
+                            remaining_quantity = 0
+                break
+
+            await asyncio.sleep(1)
+    finally:
+        await local_order_book.stop()
 
     return execution_price  # Return execution price only if position is fully opened
 
-async def place_market_order(websocket, side, quantity):
-    order_data = {
-        "jsonrpc": "2.0",
-        "id": 4219,
-        "method": f"private/{side}",
-        "params": {
-            "instrument_name": INSTRUMENT_NAME,
-            "amount": quantity,
-            "type": "market",
-            "reduce_only": False
-        }
-    }
+@traced()
+async def monitor_and_update_order_streaming(client, side, quantity, instrument_name=INSTRUMENT_NAME, snapshot=None):
+    """
+    Event-driven version of monitor_and_update_order.
+
+    Subscribes to the instrument ticker and to the user's order updates, and reprices or
+    finishes as soon as the best bid/ask or the order state changes, instead of polling the
+    order book and the order state every second. Repricing edits the resting order in place.
+    The ticker of a pre-trade snapshot younger than PRE_TRADE_SNAPSHOT_MAX_AGE_SECONDS prices the
+    first order, which is then sent without waiting for a ticker notification.
 
-    await websocket.send(json.dumps(order_data))
-    response = await websocket.recv()
-    response_json = json.loads(response)
+    Args:
+    - client: The DeribitClient connection.
+    - side: "buy" or "sell".
+    - quantity: The amount to execute.
+    - instrument_name: The instrument name (e.g., "BTC-PERPETUAL").
+    - snapshot: The PreTradeSnapshot of the run, if any.
+
+    Returns:
+    - The average execution price once the full quantity is filled, otherwise None.
+    """
+    if snapshot is not None:
+        instrument_details = snapshot.instrument_details
+    else:
+        instrument_details = await get_instrument_details(client, instrument_name)
+    tick_size = instrument_details.get("tick_size") or TICK_SIZE
+    adjusted_quantity = adjust_quantity_to_instrument(quantity, instrument_details)
+    remaining_quantity = adjusted_quantity
+    tolerance = tick_size*CHASE_TOLERANCE_TICKS
+    clock = asyncio.get_running_loop().time  # Follows the virtual clock when run in the simulator
+    start_time = clock()
+    filled_quantity = 0
+    filled_notional = 0
+    best_bid = best_ask = None
+    order = None
+
+    ticker_channel = f"ticker.{instrument_name}.raw"
+    orders_channel = f"user.orders.{instrument_name}.raw"
+    events = asyncio.Queue()
+
+    def on_event(channel, data):
+        events.put_nowait((channel, data))
+
+    def record_fill(order_state):
+        # Book the filled part of an order that will not trade any further
+        nonlocal filled_quantity, filled_notional
+        amount = order_state.get("filled_amount", 0)
+        if amount:
+            filled_quantity += amount
+            filled_notional += amount * order_state.get("average_price", order_state.get("price", 0))
+
+    if snapshot is not None and snapshot.ticker is not None and clock() - snapshot.taken_at <= PRE_TRADE_SNAPSHOT_MAX_AGE_SECONDS:
+        # Queued before the notifications, which are newer
+        on_event(ticker_channel, snapshot.ticker.to_dict())
+    await client.subscribe([ticker_channel, orders_channel], on_event)
+    try:
+        while remaining_quantity > 0:
+            time_left = TIME_LIMIT_SECONDS - (clock() - start_time)
+            if time_left <= 0:
+                break
+            try:
+                channel, data = await asyncio.wait_for(events.get(), time_left)
+            except asyncio.TimeoutError:
+                break
+
+            if channel == ticker_channel:
+                ticker = Ticker.from_dict(data)
+                best_bid = ticker.best_bid_price
+                best_ask = ticker.best_ask_price
+            elif order and data.get("order_id") == order.order_id:
+                order = Order.from_dict(data)
+                if order["order_state"] == "filled":
+                    record_fill(order)
+                    remaining_quantity = 0
+                    break
+                if order["order_state"] in ("cancelled", "rejected"):
+                    record_fill(order)
+                    remaining_quantity -= order.get("filled_amount", 0)
+                    order = None
+
+            if not best_bid or not best_ask:
+                continue
+            target_price = best_bid - tick_size*CHASE_OFFSET_TICKS if side == "buy" else best_ask + tick_size*CHASE_OFFSET_TICKS
+
+            if order is None:
+                order_response = await place_limit_order(client, side, remaining_quantity, target_price, instrument_name)
+                if order_response:
+                    order = Order.from_dict(order_response["result"]["order"])
+            elif abs(order.price - target_price) > tolerance:
+                edit_response = await edit_order(client, order.order_id, order.amount, target_price, instrument_name)
+                telemetry.increment("order.reprices")
+                if edit_response:
+                    order = Order.from_dict(edit_response["result"]["order"])
+
+        if remaining_quantity > 0:
+            if order:
+                cancel_response = await cancel_order(client, order.order_id)
+                if "result" in cancel_response:
+                    record_fill(cancel_response["result"])
+                    remaining_quantity -= cancel_response["result"].get("filled_amount", 0)
+            if remaining_quantity > 0:
+                print(f"Time limit reached. Placing market order for remaining quantity: {remaining_quantity}")
+                market_order_response = await place_market_order(client, side, remaining_quantity, instrument_name)
+                if not market_order_response:
+                    return None
+                order = Order.from_dict(market_order_response["result"]["order"])
+                deadline = clock() + STATE_WAIT_TIMEOUT_SECONDS
+                while order.order_state == "open":
+                    try:
+                        channel, data = await asyncio.wait_for(events.get(), max(deadline - clock(), 0))
+                    except asyncio.TimeoutError:
+                        # The order update was lost, e.g. over a reconnection: read the order state instead
+                        print("Market order update not received in time, reading the order state.")
+                        order_details = await get_order_details(client, order.order_id)
+                        if order_details:
+                            order = Order.from_dict(order_details)
+                        break
+                    if channel == orders_channel and data.get("order_id") == order.order_id:
+                        order = Order.from_dict(data)
+                record_fill(order)
+    finally:
+        await client.unsubscribe([ticker_channel, orders_channel], on_event)
+
+    if adjusted_quantity <= 0 or filled_quantity < adjusted_quantity:
+        return None  # Return execution price only if position is fully opened
+    return filled_notional / filled_quantity  # Volume weighted execution price
+
+@traced()
+async def edit_order(client, order_id, quantity, price, instrument_name=INSTRUMENT_NAME):
+    """
+    Moves a resting post-only limit order to a new price in a single request.
+    """
+    instrument_details = await get_instrument_details(client, instrument_name)
+    price = round_to_tick_size(price, instrument_details)
+
+    response_json = await client.request("private/edit", EDIT_ORDER_PARAMS(
+        order_id=order_id,
+        amount=quantity,
+        price=price
+    ))
+
+    if "result" not in response_json:
+        print(f"Error editing order: {response_json}")
+        return None
+
+    journal_order("reprice", response_json["result"]["order"])
+    return response_json
+
+@traced()
+async def place_market_order(client, side, quantity, instrument_name=INSTRUMENT_NAME):
+    _record_first_order(instrument_name)
+    response_json = await client.request(f"private/{side}", MARKET_ORDER_PARAMS(
+        instrument_name=instrument_name,
+        amount=quantity,
+        **_label_params()
+    ))
 
     if "result" not in response_json:
         print(f"Error placing market order: {response_json}")
         return None
 
+    journal_order("order", response_json["result"]["order"])
     return response_json
 
-async def place_trigger_order(websocket, side, quantity, trigger_price, limit_price, order_type="stop_limit", instrument_name=INSTRUMENT_NAME):
+@traced()
+async def place_trigger_order(client, side, quantity, trigger_price, limit_price, order_type="stop_limit", instrument_name=INSTRUMENT_NAME, instrument_details=None):
     """
     Places a stop-limit or take-profit order with a trigger price.
 
     Args:
-    - websocket: The WebSocket connection.
+    - client: The DeribitClient connection.
     - side: "buy" or "sell".
     - quantity: The amount of the asset to be traded.
     - trigger_price: The price at which the limit order is triggered.
     - limit_price: The price at which the order will be placed once triggered.
     - order_type: "stop_limit" for stop loss, "take_limit" for take profit.
     - instrument_name: The instrument name (e.g., "BTC-PERPETUAL").
+    - instrument_details: Instrument metadata, fetched if not given.
 
     Returns:
     - The order response from the exchange.
     """
-    # Adjust the limit price to conform to the tick size
-    instrument_details = await get_instrument_details(websocket, instrument_name)
-    tick_size = instrument_details.get('tick_size', 0.5)  # Use 0.5 as a default tick size if not available
-    limit_price = round(limit_price / tick_size) * tick_size
-
-    order_data = {
-        "jsonrpc": "2.0",
-        "id": 4215,
-        "method": f"private/{side}",
-        "params": {
-            "instrument_name": instrument_name,
-            "amount": quantity,
-            "type": order_type,
-            "trigger_price": trigger_price,
-            "price": limit_price,
-            "trigger": "last_price",
-            "reduce_only": True,
-            "time_in_force": "good_til_cancelled"
-        }
-    }
-
-    await websocket.send(json.dumps(order_data))
-    response = await websocket.recv()
-    response_json = json.loads(response)
+    # Adjust the trigger and limit prices to conform to the tick size
+    if instrument_details is None:
+        instrument_details = await get_instrument_details(client, instrument_name)
+    trigger_price = round_to_tick_size(trigger_price, instrument_details)
+    limit_price = round_to_tick_size(limit_price, instrument_details)
+
+    response_json = await client.request(f"private/{side}", TRIGGER_ORDER_PARAMS(
+        instrument_name=instrument_name,
+        amount=quantity,
+        type=order_type,
+        trigger_price=trigger_price,
+        price=limit_price,
+        **_label_params()
+    ))
 
     if "result" not in response_json:
         print(f"Error placing trigger order: {response_json}")
         return None
 
+    journal_order("order", response_json["result"]["order"])
     return response_json
 
-async def place_take_profit_and_stop_loss_orders(websocket, execution_price, quantity, side):
+def bracket_prices(execution_price, side):
+    """
+    Returns the exit side, stop loss price and take profit price of a position opened on side
+    ("buy" for a long, "sell" for a short) at execution_price.
+    """
+    if side == "buy":  # Long position
+        stop_loss_price = execution_price * (1 - STOP_LOSS_PERCENTAGE)  # Below execution price
+        take_profit_price = execution_price * (1 + TAKE_PROFIT_PERCENTAGE)  # Above execution price
+        return "sell", stop_loss_price, take_profit_price  # Sell for stop-loss and take-profit
+    stop_loss_price = execution_price * (1 + STOP_LOSS_PERCENTAGE)  # Above execution price
+    take_profit_price = execution_price * (1 - TAKE_PROFIT_PERCENTAGE)  # Below execution price
+    return "buy", stop_loss_price, take_profit_price  # Buy for stop-loss and take-profit
+
+@traced()
+async def place_take_profit_and_stop_loss_orders(client, execution_price, quantity, side, instrument_name=INSTRUMENT_NAME):
     """
     Place take profit and stop loss orders after position is fully opened.
 
     Args:
-        websocket: WebSocket connection.
+        client: DeribitClient connection.
         execution_price: The price at which the position was opened.
         quantity: The total quantity of the position.
         side: "buy" for long position, "sell" for short position.
+        instrument_name: The instrument of the position.
+
+    Returns:
+        The bracket placed by place_bracket_orders, or None if the position could not be protected.
     """
-    if side == "buy":  # Long position
-        stop_loss_price = execution_price * (1 - STOP_LOSS_PERCENTAGE)  # 5% below execution price
-        take_profit_price = execution_price * (1 + TAKE_PROFIT_PERCENTAGE)  # 5% above execution price
-        stop_loss_order_side = "sell"  # Sell for stop-loss
-        take_profit_order_side = "sell"  # Sell for take-profit
-    else:  # Short position
-        stop_loss_price = execution_price * (1 + STOP_LOSS_PERCENTAGE)  # 5% above execution price
-        take_profit_price = execution_price * (1 - TAKE_PROFIT_PERCENTAGE)  # 5% below execution price
-        stop_loss_order_side = "buy"  # Buy for stop-loss
-        take_profit_order_side = "buy"  # Buy for take-profit
-
-    # Place the stop loss order as a trigger order
-    stop_loss_order = await place_trigger_order(
-        websocket=websocket,
-        side=stop_loss_order_side,
-        quantity=quantity,
-        trigger_price=stop_loss_price,
-        limit_price=stop_loss_price,
-        order_type="stop_limit"
-    )
+    exit_side, stop_loss_price, take_profit_price = bracket_prices(execution_price, side)
+    bracket = await place_bracket_orders(client, exit_side, quantity, stop_loss_price, take_profit_price, instrument_name)
+    if bracket is None:
+        print("Failed to place stop loss and take profit orders. The position is unprotected.")
+    return bracket
+
+@traced()
+async def place_bracket_orders(client, side, quantity, stop_loss_price, take_profit_price, instrument_name=INSTRUMENT_NAME, retries=BRACKET_LEG_RETRIES):
+    """
+    Places the stop loss and take profit legs of a position as one bracket.
+
+    Both legs are submitted concurrently with the same instrument metadata, so once the metadata
+    is cached the position is protected after a single round trip. A leg rejected by the exchange
+    is resubmitted up to `retries` times. If it still fails, the other leg is cancelled, so the
+    bracket is either fully in place or not at all.
+
+    Args:
+    - client: The DeribitClient connection.
+    - side: Side of both legs, opposite to the position: "sell" for a long, "buy" for a short.
+    - quantity: The position size covered by each leg.
+    - stop_loss_price, take_profit_price: Trigger prices of the two legs.
+    - instrument_name: The instrument of the position.
+    - retries: Number of extra attempts for a rejected leg.
+
+    Returns:
+    - A dict with the "stop_loss" and "take_profit" orders, "time_to_protected" in seconds and
+      the number of "attempts", or None if the bracket could not be placed.
+    """
+    clock = asyncio.get_running_loop().time
+    start = clock()
+    instrument_details = await get_instrument_details(client, instrument_name)
 
-    if not stop_loss_order:
-        print("Failed to place stop loss order.")
-
-    # Place the take profit order as a trigger order
-    take_profit_order = await place_trigger_order(
-        websocket=websocket,
-        side=take_profit_order_side,
-        quantity=quantity,
-        trigger_price=take_profit_price,
-        limit_price=take_profit_price,
-        order_type="take_limit"
+    (stop_loss_order, stop_loss_attempts), (take_profit_order, take_profit_attempts) = await asyncio.gather(
+        _place_bracket_leg(client, side, quantity, "stop_limit", stop_loss_price, instrument_name, instrument_details, retries),
+        _place_bracket_leg(client, side, quantity, "take_limit", take_profit_price, instrument_name, instrument_details, retries)
     )
 
-    if not take_profit_order:
-        print("Failed to place take profit order.")
+    if stop_loss_order is None or take_profit_order is None:
+        # Roll back the leg that was placed so no half bracket is left on the book
+        for order in (stop_loss_order, take_profit_order):
+            if order is not None:
+                response = await cancel_order(client, order["order_id"])
+                if "result" not in response:
+                    print(f"Error rolling back bracket leg {order['order_id']}: {response}")
+        print(f"Bracket rolled back: stop loss placed: {stop_loss_order is not None}, "
+              f"take profit placed: {take_profit_order is not None}")
+        return None
 
-async def get_order_book(websocket, instrument_name=INSTRUMENT_NAME):
-    order_book_msg = {
-        "jsonrpc": "2.0",
-        "id": 4217,
-        "method": "public/get_order_book",
-        "params": {
-            "instrument_name": instrument_name
-        }
+    time_to_protected = clock() - start
+    logging.info(f"Position protected in {time_to_protected * 1000:.1f}ms: "
+                 f"stop loss {stop_loss_order['order_id']}, take profit {take_profit_order['order_id']}")
+    return {
+        "stop_loss": stop_loss_order,
+        "take_profit": take_profit_order,
+        "time_to_protected": time_to_protected,
+        "attempts": max(stop_loss_attempts, take_profit_attempts)
     }
 
-    await websocket.send(json.dumps(order_book_msg))
-    response = await websocket.recv()
-    order_book_data = json.loads(response)
+async def _place_bracket_leg(client, side, quantity, order_type, price, instrument_name, instrument_details, retries):
+    # A reduce only trigger order may fail transiently; retry a bounded number of times
+    for attempt in range(1, retries + 2):
+        response = await place_trigger_order(
+            client=client,
+            side=side,
+            quantity=quantity,
+            trigger_price=price,
+            limit_price=price,
+            order_type=order_type,
+            instrument_name=instrument_name,
+            instrument_details=instrument_details
+        )
+        if response:
+            return response["result"]["order"], attempt
+        logging.warning(f"{order_type} leg rejected (attempt {attempt} of {retries + 1})")
+    return None, attempt
+
+@traced()
+async def protect_open_position(client, snapshot, instrument_name=INSTRUMENT_NAME, retries=BRACKET_LEG_RETRIES):
+    """
+    Completes the bracket of the open position, for a run repeating one whose entry filled but
+    whose stop loss or take profit was not placed. A missing leg is placed at the price
+    bracket_prices derives from the average price of the position, for the size of the position.
+
+    Returns:
+    - A dict of the legs placed, "stop_loss" and/or "take_profit", empty if there is no position
+      or its bracket is complete.
+    """
+    position = snapshot.position
+    if not position or not position.get("size"):
+        return {}
+    open_orders = await get_open_orders(client, instrument_name)
+    if open_orders is None:
+        raise RuntimeError(f"The open orders of {instrument_name} could not be read to check the bracket of its position")
+
+    exit_side, stop_loss_price, take_profit_price = bracket_prices(position["average_price"], position["direction"])
+    exit_orders = [order for order in open_orders if order.get("direction") == exit_side and order.get("reduce_only")]
+    if any(order.get("triggered") for order in exit_orders):
+        return {}  # A leg fired, the position is being closed
+    present = {order.get("order_type") for order in exit_orders}
+    missing = {name: (order_type, price)
+               for name, order_type, price in (("stop_loss", "stop_limit", stop_loss_price),
+                                               ("take_profit", "take_limit", take_profit_price))
+               if order_type not in present}
+    if not missing:
+        return {}
+
+    print(f"The {instrument_name} position has no {' or '.join(missing)} order, placing it.")
+    instrument_details = await get_instrument_details(client, instrument_name)
+    quantity = abs(position["size"])
+    placed = await asyncio.gather(*[
+        _place_bracket_leg(client, exit_side, quantity, order_type, price, instrument_name, instrument_details, retries)
+        for order_type, price in missing.values()
+    ])
+    legs = {name: order for name, (order, _) in zip(missing, placed) if order is not None}
+    if len(legs) < len(missing):
+        print("Failed to complete the stop loss and take profit orders. The position is unprotected.")
+    return legs
+
+@traced()
+async def get_order_book(client, instrument_name=INSTRUMENT_NAME):
+    # Served from the local order book when one is kept up to date on this connection
+    local_order_book = client.order_books.get(instrument_name)
+    if local_order_book is not None and local_order_book.ready:
+        return local_order_book.summary()
+
+    order_book_data = await client.request("public/get_order_book", {
+        "instrument_name": instrument_name
+    })
 
     if "result" in order_book_data:
         return {
@@ -492,19 +903,11 @@ async def get_order_book(websocket, instrument_name=INSTRUMENT_NAME):
         print("Error: Order book data not found in the response")
         return None
 
-async def get_order_details(websocket, order_id):
-    order_details_msg = {
-        "jsonrpc": "2.0",
-        "id": 4223,
-        "method": "private/get_order_state",
-        "params": {
-            "order_id": order_id
-        }
-    }
-
-    await websocket.send(json.dumps(order_details_msg))
-    response = await websocket.recv()
-    order_details_data = json.loads(response)
+@traced()
+async def get_order_details(client, order_id):
+    order_details_data = await client.request("private/get_order_state", {
+        "order_id": order_id
+    })
 
     if "result" in order_details_data:
         return order_details_data["result"]
@@ -512,61 +915,131 @@ async def get_order_details(websocket, order_id):
         print("Error retrieving order details:", order_details_data)
         return None
 
-async def get_current_position_quantity(websocket):
-    position = await get_current_position(websocket)
+@traced()
+async def get_orders_by_label(client, label, currency="BTC"):
+    """
+    Returns the orders of currency labelled label, open or recently closed.
+    """
+    response = await client.request("private/get_order_state_by_label", {
+        "currency": currency,
+        "label": label
+    })
+    return response.get("result") or []
+
+@traced()
+async def get_open_orders(client, instrument_name=INSTRUMENT_NAME, order_type="all"):
+    """
+    Returns the open orders of instrument_name, triggered or not, or None if they could not be read.
+    """
+    response = await client.request("private/get_open_orders_by_instrument", {
+        "instrument_name": instrument_name,
+        "type": order_type
+    })
+    if "result" not in response:
+        print("Error retrieving open orders:", response)
+        return None
+    return response["result"]
+
+@traced()
+async def get_current_position_quantity(client, instrument_name=INSTRUMENT_NAME):
+    position = await get_current_position(client, instrument_name)
     if position:
         return position.get("size", 0)
     return 0
 
-async def cancel_all_orders(websocket):
-    cancel_all_msg = {
-        "jsonrpc": "2.0",
-        "id": 4214,
-        "method": "private/cancel_all",
-        "params": {}
-    }
-    await websocket.send(json.dumps(cancel_all_msg))
-    response = await websocket.recv()
+@traced()
+async def cancel_all_orders(client, instrument_name=None):
+    """
+    Cancels the open orders of instrument_name, or of every instrument if it is None.
+    Other instruments traded on the same account keep their stop loss and take profit orders.
+    """
+    if instrument_name is None:
+        response = await client.request("private/cancel_all", {})
+    else:
+        response = await client.request("private/cancel_all_by_instrument", {"instrument_name": instrument_name})
     print("Cancel All Orders Response:", response)
 
-async def execute_trade_logic(websocket, df):
+@traced()
+async def execute_trade_logic(client, df, instrument_name=INSTRUMENT_NAME, raise_errors=False):
+    """
+    Trade instrument_name on the account of client according to the first signal row of df.
+    Errors are printed, and raised again if raise_errors is set, so a caller running several
+    accounts or instruments can tell which ones failed.
+
+    The orders are labelled from the run key of the signal bar. If the first order of the run
+    is already on the exchange, the bar was traded by an earlier run: no new entry is sent, and
+    only the stop loss or take profit that run failed to place on its position is, if any.
+
+    The balance, price, position, instrument metadata and first label are read in one concurrent
+    round, into the PreTradeSnapshot passed down to the order handlers. The time from the call
+    to the first order sent is recorded as order.signal_to_first_order.
+    """
     if df.empty:
         print("DataFrame is empty. No trading actions will be performed.")
         return
 
+    received_token = signal_received.set(asyncio.get_running_loop().time())
+    run_key = signal_run_key(df)
+    labels = OrderLabels(run_key, instrument_name) if run_key else None
+    labels_token = order_labels.set(labels)
+    # Set again from the snapshot, and reset with the others so a later run never reads this one's
+    price_token = signal_price.set(None)
     try:
-        quantity = await calculate_usd_quantity_from_btc(websocket)
+        snapshot = await get_pre_trade_snapshot(client, instrument_name, labels.first if labels else None)
+        if snapshot.sent_orders:
+            print(f"Run {run_key} already sent its orders on {instrument_name}. Checking the bracket of the position.")
+            telemetry.increment("runs.duplicate")
+            journal.append("duplicate_run", instrument_name=instrument_name, label=labels.first)
+            # Its entry may have filled without its stop loss and take profit
+            order_labels.set(OrderLabels(f"{run_key}-repair", instrument_name))
+            await protect_open_position(client, snapshot, instrument_name)
+            return
+        signal_price.set(snapshot.price or None)
+        quantity = usd_quantity_from_btc(snapshot.available_balance, snapshot.price)
         if quantity <= 0:
-            print("Insufficient BTC balance to place an order.")
+            print(f"Insufficient {instrument_currency(instrument_name)} balance to place an order.")
             return
 
-        contract_size = 10
-        quantity = adjust_quantity_to_contract_size(quantity, contract_size)
+        quantity = adjust_quantity_to_instrument(quantity, snapshot.instrument_details)
         if quantity <= 0:
             print("Calculated quantity is too small to place an order.")
             return
 
-        current_position = await get_current_position(websocket)
+        current_position = snapshot.position
+        if current_position is not None:
+            journal.append("position", instrument_name=instrument_name, side=current_position.direction,
+                           amount=current_position.size, price=current_position.average_price,
+                           signal="long" if df["Long_Entry"].iloc[0] else "short" if df["Short_Entry"].iloc[0] else None)
 
         if df["Long_Entry"].iloc[0]:
-            await handle_long_signal(websocket, quantity*2)
+            await handle_long_signal(client, quantity*LONG_SIZE_MULTIPLIER, instrument_name, snapshot)
         elif df["Short_Entry"].iloc[0]:
-            await handle_short_signal(websocket, quantity*4)
+            await handle_short_signal(client, quantity*SHORT_SIZE_MULTIPLIER, instrument_name, snapshot)
         else:
             print("No trading signal detected.")
 
-        print(f"Current position: {current_position}, Latest signal: {'Long' if df['Long_Entry'].iloc[0] else 'Short' if df['Short_Entry'].iloc[0] else 'No Signal'}")
+        print(f"{instrument_name} position: {current_position}, Latest signal: {'Long' if df['Long_Entry'].iloc[0] else 'Short' if df['Short_Entry'].iloc[0] else 'No Signal'}")
 
     except Exception as e:
-        print(f"An error occurred: {e}")
-
+        print(f"An error occurred trading {instrument_name}: {e}")
+        if raise_errors:
+            raise
+    finally:
+        order_labels.reset(labels_token)
+        signal_received.reset(received_token)
+        signal_price.reset(price_token)
+
+@traced()
 async def call_api(df, api_key, api_secret):
-    websocket_url = "wss://www.deribit.com/ws/api/v2"
+    import websockets
 
     async with websockets.connect(websocket_url) as websocket:
-        authenticated = await authenticate(api_key, api_secret, connection_type="websocket", websocket=websocket)
-
-        if authenticated:
-            await execute_trade_logic(websocket, df)
-        else:
-            print("WebSocket authentication failed.")
\ No newline at end of file
+        async with DeribitClient(websocket) as client:
+            authenticated = await authenticate(api_key, api_secret, connection_type="websocket", client=client)
+
+            if authenticated:
+                await execute_trade_logic(client, df)
+            else:
+                print("WebSocket authentication failed.")
+    await journal.close()
+    telemetry.export()
\ No newline at end of file
@@ -0,0 +1,186 @@
+import asyncio
+import itertools
+import logging
+
+from bigquery_utils.journal import journal, journal_context
+from deribit_utils import deribit_utils
+from deribit_utils.rate_limiter import RateLimiter
+from deribit_utils.session import RECONNECT_MAX_ATTEMPTS, SessionManager
+from telemetry_utils.telemetry import telemetry, traced
+
+
+class ExecutionFailed(Exception):
+    """
+    Some trade tasks of a fan-out failed. report is the report of execute_parallel.
+    """
+
+    def __init__(self, report):
+        super().__init__(f"{report['failed']} of {len(report['results'])} trade tasks failed")
+        self.report = report
+
+
+class ConnectionPool:
+    """
+    Authenticated Deribit connections, one per account, opened on first use and shared by every
+    trade task of that account.
+
+    Each account gets its own RateLimiter, since the exchange counts credits per account, while
+    the instruments traded on one account share its connection and credits. Concurrent requests
+    for a connection that is still opening wait for the same handshake. Connections are held by
+    SessionManagers, so a dropped one is reopened and its token refreshed during the run.
+
+    Usage:
+        pool = ConnectionPool({"btcridermulti": (api_key, api_secret)})
+        client = await pool.get("btcridermulti")
+        ...
+        await pool.close_all()
+    """
+
+    def __init__(self, credentials, connect=None, url=None, max_attempts=RECONNECT_MAX_ATTEMPTS):
+        """
+        Args:
+        - credentials: Dict of account name -> (api_key, api_secret).
+        - connect: Optional callable taking the account name and returning an open WebSocket,
+          or an awaitable of one. Defaults to websockets.connect(url).
+        - url: WebSocket URL of the default connect, the Deribit production API if not given.
+        - max_attempts: Attempts to open the socket of an account before giving up, None to retry forever.
+        """
+        self.credentials = credentials
+        self.url = url or deribit_utils.websocket_url
+        self.max_attempts = max_attempts
+        self._connect = connect
+        self._clients = {}
+        self._sessions = {}
+        self._opening = {}
+
+    async def get(self, account):
+        """
+        Return the authenticated client of account, opening the connection if needed.
+        Raises ConnectionError if the account cannot authenticate.
+        """
+        client = self._clients.get(account)
+        if client is not None:
+            return client
+        task = self._opening.get(account)
+        if task is None:
+            task = self._opening[account] = asyncio.get_running_loop().create_task(self._open(account))
+            task.add_done_callback(lambda _: self._opening.pop(account, None))
+        # Shielded: a cancelled caller must not abort the handshake other tasks are waiting for
+        return await asyncio.shield(task)
+
+    async def _open(self, account):
+        if account not in self.credentials:
+            raise KeyError(f"No credentials for account {account!r}")
+        api_key, api_secret = self.credentials[account]
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        session = SessionManager(api_key, api_secret, url=self.url, rate_limiter=RateLimiter(),
+                                 connect=(lambda: self._connect(account)) if self._connect is not None else None,
+                                 max_attempts=self.max_attempts)
+        try:
+            client = await session.start()
+        except ConnectionError as e:
+            raise ConnectionError(f"Authentication of account {account!r} failed: {e}") from e
+        telemetry.record("executor.connect_seconds", loop.time() - started_at)
+        self._clients[account] = client
+        self._sessions[account] = session
+        return client
+
+    async def close_all(self):
+        """
+        Close every connection of the pool, and abort the ones still opening.
+        """
+        for task in list(self._opening.values()):
+            task.cancel()
+        for account in list(self._clients):
+            del self._clients[account]
+            session = self._sessions.pop(account)
+            try:
+                await session.close()
+            except Exception as e:
+                logging.warning(f"Error closing the connection of account {account!r}: {e}")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_all()
+
+
+async def _run_task(pool, df, account, instrument_name):
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    error = None
+    journal_context.set({"account": account})  # Each task runs in its own copy of the context
+    try:
+        client = await pool.get(account)
+        await deribit_utils.execute_trade_logic(client, df, instrument_name, raise_errors=True)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        telemetry.increment("executor.task_errors")
+        logging.error(f"Trading {instrument_name} on account {account!r} failed: {error}")
+    seconds = loop.time() - started_at
+    telemetry.record("executor.task_seconds", seconds)
+    return {"account": account, "instrument_name": instrument_name, "ok": error is None,
+            "error": error, "seconds": seconds}
+
+
+@traced()
+async def execute_parallel(pool, df, accounts, instruments):
+    """
+    Run execute_trade_logic for every (account, instrument) pair concurrently.
+
+    The tasks are independent: an account that cannot authenticate, or an instrument whose
+    orders fail, is reported without stopping the others.
+
+    Args:
+    - pool: ConnectionPool holding the credentials of the accounts.
+    - df: Signal DataFrame passed to execute_trade_logic.
+    - accounts: Names of the accounts to trade.
+    - instruments: Names of the instruments to trade on each account, e.g. ["BTC-PERPETUAL", "ETH-PERPETUAL"].
+
+    Returns:
+    - Dict with the result of each task (account, instrument_name, ok, error, seconds), the number
+      of tasks that succeeded and failed, and the duration of the whole fan-out in seconds.
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    results = await asyncio.gather(*(
+        _run_task(pool, df, account, instrument_name)
+        for account, instrument_name in itertools.product(accounts, instruments)
+    ))
+    seconds = loop.time() - started_at
+    telemetry.record("executor.fan_out_seconds", seconds)
+
+    failed = sum(not result["ok"] for result in results)
+    print(f"Fan-out of {len(results)} trade tasks finished in {seconds:.3f}s, {failed} failed")
+    for result in results:
+        status = "ok" if result["ok"] else f"failed ({result['error']})"
+        print(f"  {result['account']} {result['instrument_name']}: {status} in {result['seconds']:.3f}s")
+    return {"results": results, "succeeded": len(results) - failed, "failed": failed, "seconds": seconds}
+
+
+@traced()
+async def call_api_parallel(df, credentials, instruments, accounts=None, connect=None):
+    """
+    Parallel counterpart of call_api: trade the signal of df on several accounts and instruments
+    over one pooled connection per account.
+
+    Args:
+    - df: Signal DataFrame passed to execute_trade_logic.
+    - credentials: Dict of account name -> (api_key, api_secret).
+    - instruments: Names of the instruments to trade on each account.
+    - accounts: Accounts to trade, every account of credentials by default.
+    - connect: Optional WebSocket factory, see ConnectionPool.
+
+    Returns:
+    - The report of execute_parallel.
+    """
+    accounts = list(credentials) if accounts is None else accounts
+    try:
+        async with ConnectionPool(credentials, connect=connect) as pool:
+            return await execute_parallel(pool, df, accounts, instruments)
+    finally:
+        await journal.close()
+        telemetry.export()
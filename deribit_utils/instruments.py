@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+
+INSTRUMENT_TTL_SECONDS = 3600  # Tick and contract sizes rarely change, refresh hourly
+
+
+class InstrumentCache:
+    """
+    TTL cache of instrument metadata (tick_size, contract_size, min_trade_amount, ...) keyed by
+    instrument name.
+
+    One cache lives on each DeribitClient, so an instrument is fetched with public/get_instrument
+    at most once per TTL on a connection, or bulk-loaded with public/get_instruments. Concurrent
+    lookups of the same missing instrument share a single request.
+    """
+
+    def __init__(self, ttl_seconds=INSTRUMENT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._inflight = {}
+
+    def put(self, details):
+        """
+        Store the details returned by public/get_instrument(s) for one instrument.
+        """
+        self._entries[details["instrument_name"]] = (time.monotonic() + self.ttl_seconds, details)
+
+    def peek(self, instrument_name):
+        """
+        Return the cached details for instrument_name without any request, or None if missing or expired.
+        """
+        entry = self._entries.get(instrument_name)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def get(self, client, instrument_name):
+        """
+        Return the details for instrument_name, fetching them if missing or expired.
+
+        Returns:
+        - The instrument details dict, or {} if the exchange returned an error.
+        """
+        details = self.peek(instrument_name)
+        if details is not None:
+            return details
+
+        inflight = self._inflight.get(instrument_name)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch(client, instrument_name))
+            self._inflight[instrument_name] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(instrument_name, None))
+        return await asyncio.shield(inflight)
+
+    async def load_all(self, client, currency="BTC", kind="future"):
+        """
+        Bulk-load every active instrument of a currency and kind with public/get_instruments.
+
+        Returns:
+        - The number of instruments cached.
+        """
+        response = await client.request("public/get_instruments", {
+            "currency": currency,
+            "kind": kind,
+            "expired": False
+        })
+        if "result" not in response:
+            logging.error(f"Error loading instruments for {currency} {kind}: {response}")
+            return 0
+        for details in response["result"]:
+            self.put(details)
+        return len(response["result"])
+
+    async def _fetch(self, client, instrument_name):
+        response = await client.request("public/get_instrument", {
+            "instrument_name": instrument_name
+        })
+        if "result" not in response:
+            print("Error retrieving instrument details:", response)
+            return {}
+        self.put(response["result"])
+        return response["result"]
@@ -0,0 +1,257 @@
+import asyncio
+import bisect
+import logging
+from array import array
+
+from deribit_utils.records import BookTop
+
+BOOK_INTERVAL = "100ms"  # book.{instrument}.raw needs an authorized connection, 100ms batches do not
+BOOK_SNAPSHOT_TIMEOUT_SECONDS = 5
+
+
+class _Levels:
+    """
+    Price levels of one side of the book in two parallel, contiguous arrays of doubles.
+
+    Keys are sorted ascending with the best price last (asks are stored negated), so the best
+    level is read in O(1) and any price is found by binary search in O(log n). Inserting or
+    removing a level is a single memmove of the arrays.
+    """
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self._keys = array("d")
+        self._amounts = array("d")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _key(self, price):
+        return price if self.is_bid else -price
+
+    def _price(self, key):
+        return key if self.is_bid else -key
+
+    def clear(self):
+        del self._keys[:]
+        del self._amounts[:]
+
+    def set(self, price, amount):
+        """
+        Set the amount resting at price, removing the level if amount is 0.
+        """
+        key = self._key(price)
+        index = bisect.bisect_left(self._keys, key)
+        found = index < len(self._keys) and self._keys[index] == key
+        if amount <= 0:
+            if found:
+                del self._keys[index]
+                del self._amounts[index]
+        elif found:
+            self._amounts[index] = amount
+        else:
+            self._keys.insert(index, key)
+            self._amounts.insert(index, amount)
+
+    def best(self):
+        if not self._keys:
+            return None, 0.0
+        return self._price(self._keys[-1]), self._amounts[-1]
+
+    def amount_at(self, price):
+        key = self._key(price)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return self._amounts[index]
+        return 0.0
+
+    def amount_through(self, price):
+        # Total amount at price and at every better price
+        index = bisect.bisect_left(self._keys, self._key(price))
+        return sum(self._amounts[index:])
+
+    def top(self, depth=None):
+        start = len(self._keys) - depth if depth else 0
+        return [
+            [self._price(self._keys[index]), self._amounts[index]]
+            for index in range(len(self._keys) - 1, max(start, 0) - 1, -1)
+        ]
+
+    def fill(self, size):
+        """
+        Walk the levels from the best price and return (notional, filled) for up to size contracts.
+        """
+        notional = filled = 0.0
+        for index in range(len(self._keys) - 1, -1, -1):
+            take = min(self._amounts[index], size - filled)
+            notional += take * self._price(self._keys[index])
+            filled += take
+            if filled >= size:
+                break
+        return notional, filled
+
+
+class LocalOrderBook:
+    """
+    Local copy of an instrument's order book, kept up to date from the incremental `book` channel.
+
+    Deribit sends a full snapshot after subscribing, then change messages whose prev_change_id
+    must equal the change_id of the previous message. On a gap the book is marked not ready and
+    the channel is resubscribed, which makes Deribit send a fresh snapshot.
+
+    Usage:
+        book = LocalOrderBook("BTC-PERPETUAL")
+        await book.start(client)
+        best_bid, best_ask = book.best_bid(), book.best_ask()
+        price = book.vwap_to_size("buy", 5000)
+        await book.stop()
+    """
+
+    def __init__(self, instrument_name, interval=BOOK_INTERVAL):
+        self.instrument_name = instrument_name
+        self.channel = f"book.{instrument_name}.{interval}"
+        self.bids = _Levels(is_bid=True)
+        self.asks = _Levels(is_bid=False)
+        self.change_id = None
+        self.timestamp = None
+        self.updates = 0
+        self.resyncs = 0
+        self.client = None
+        self._ready = asyncio.Event()
+        self._resync_task = None
+
+    @property
+    def ready(self):
+        """
+        True while the book holds a snapshot and every change applied since, without gaps.
+        """
+        return self._ready.is_set()
+
+    async def start(self, client, timeout=BOOK_SNAPSHOT_TIMEOUT_SECONDS):
+        """
+        Subscribe to the book channel and wait for the first snapshot.
+        The book is registered in client.order_books, where get_order_book looks for it.
+        """
+        self.client = client
+        client.order_books[self.instrument_name] = self
+        await client.subscribe([self.channel], self.on_message)
+        await self.wait_ready(timeout)
+
+    async def wait_ready(self, timeout=BOOK_SNAPSHOT_TIMEOUT_SECONDS):
+        await asyncio.wait_for(self._ready.wait(), timeout)
+
+    async def stop(self):
+        if self.client is None:
+            return
+        if self._resync_task is not None:
+            self._resync_task.cancel()
+            self._resync_task = None
+        if self.client.order_books.get(self.instrument_name) is self:
+            del self.client.order_books[self.instrument_name]
+        await self.client.unsubscribe([self.channel], self.on_message)
+        self._ready.clear()
+        self.client = None
+
+    def on_message(self, channel, data):
+        """
+        Apply a snapshot or change notification of the book channel.
+        """
+        if data.get("type") == "snapshot":
+            self.bids.clear()
+            self.asks.clear()
+            self._apply(data)
+            self._ready.set()
+            return
+        if not self.ready:
+            return  # Waiting for the snapshot of a resync
+        if data.get("prev_change_id") != self.change_id:
+            logging.warning(f"Gap in {self.channel}: expected prev_change_id {self.change_id}, "
+                            f"got {data.get('prev_change_id')}. Resyncing.")
+            self.resync()
+            return
+        self._apply(data)
+
+    def _apply(self, data):
+        for action, price, amount in data.get("bids", ()):
+            self.bids.set(price, 0 if action == "delete" else amount)
+        for action, price, amount in data.get("asks", ()):
+            self.asks.set(price, 0 if action == "delete" else amount)
+        self.change_id = data.get("change_id")
+        self.timestamp = data.get("timestamp")
+        self.updates += 1
+
+    def invalidate(self):
+        """
+        Mark the book not ready until the snapshot sent when the channel is subscribed again,
+        e.g. while the connection is being reopened.
+        """
+        self._ready.clear()
+
+    def resync(self):
+        """
+        Drop the book and resubscribe to the channel to receive a new snapshot.
+        """
+        self._ready.clear()
+        self.resyncs += 1
+        if self.client is not None and (self._resync_task is None or self._resync_task.done()):
+            self._resync_task = asyncio.get_running_loop().create_task(self._resubscribe())
+
+    async def _resubscribe(self):
+        # Bypass the client's handler registry: the handler stays registered, only the exchange side is renewed
+        try:
+            await self.client.request("public/unsubscribe", {"channels": [self.channel]})
+            await self.client.request("public/subscribe", {"channels": [self.channel]})
+        except Exception as e:
+            logging.warning(f"Could not resubscribe to {self.channel}: {e}")
+
+    # Queries
+
+    def best_bid(self):
+        return self.bids.best()[0]
+
+    def best_ask(self):
+        return self.asks.best()[0]
+
+    def top_of_book(self):
+        bid, bid_amount = self.bids.best()
+        ask, ask_amount = self.asks.best()
+        return BookTop(self.instrument_name, self.timestamp, bid, bid_amount, ask, ask_amount)
+
+    def spread(self):
+        bid, ask = self.best_bid(), self.best_ask()
+        if bid is None or ask is None:
+            return None
+        return ask - bid
+
+    def depth_at_price(self, price):
+        """
+        Amount resting at exactly price, on whichever side of the book holds it.
+        """
+        return self.bids.amount_at(price) or self.asks.amount_at(price)
+
+    def depth_to_price(self, side, price):
+        """
+        Amount a taker order on side could fill with a limit at price.
+        """
+        return (self.asks if side == "buy" else self.bids).amount_through(price)
+
+    def vwap_to_size(self, side, size):
+        """
+        Average price of filling size contracts with a taker order on side ("buy" walks the asks),
+        or None if the book is not deep enough.
+        """
+        notional, filled = (self.asks if side == "buy" else self.bids).fill(size)
+        if size <= 0 or filled < size:
+            return None
+        return notional / filled
+
+    def summary(self, depth=20):
+        """
+        The book in the shape returned by get_order_book.
+        """
+        return {
+            "best_bid_price": self.best_bid(),
+            "best_ask_price": self.best_ask(),
+            "bids": self.bids.top(depth),
+            "asks": self.asks.top(depth)
+        }
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import math
+
+# Deribit credit limits of the default account tier. Every request costs credits, which refill
+# continuously up to a maximum, and matching engine requests (order entry, edits and cancels)
+# draw from their own pool. Requests over the limit fail with error 10028 "too_many_requests".
+NON_MATCHING_ENGINE_CREDITS = 50_000
+NON_MATCHING_ENGINE_REFILL_PER_SECOND = 10_000
+NON_MATCHING_ENGINE_COST = 500  # 20 requests per second sustained, bursts of 100
+MATCHING_ENGINE_CREDITS = 20
+MATCHING_ENGINE_REFILL_PER_SECOND = 5
+MATCHING_ENGINE_COST = 1  # 5 requests per second sustained, bursts of 20
+
+TOO_MANY_REQUESTS_ERROR = 10028
+
+MATCHING_ENGINE_METHODS = {
+    "private/buy",
+    "private/sell",
+    "private/edit",
+    "private/edit_by_label",
+    "private/cancel",
+    "private/cancel_all",
+    "private/cancel_all_by_currency",
+    "private/cancel_all_by_instrument",
+    "private/cancel_by_label",
+    "private/close_position",
+}
+
+# Informational calls give way to the order path when credits run short
+INFORMATIONAL_METHODS = {
+    "private/get_account_summary",
+    "public/ticker",
+    "public/get_instrument",
+    "public/get_instruments",
+    "public/get_time",
+    "public/test",
+}
+
+PRIORITY_ORDER_PATH = 0
+PRIORITY_INFORMATIONAL = 1
+
+_CREDIT_TOLERANCE = 1e-6  # Absorbs float rounding in the refill arithmetic
+
+
+class CreditPool:
+    """
+    Token bucket of request credits with a priority queue of waiting requests.
+
+    A request takes its credits at once if enough are available and nobody is queued. Otherwise
+    it waits in the queue, ordered by priority then arrival, and a single drain task hands out
+    credits as they refill. Time is read from the event loop clock.
+    """
+
+    def __init__(self, name, capacity, refill_per_second, cost):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.cost = cost
+        self.credits = capacity
+        self._updated_at = None
+        self._queue = []
+        self._sequence = itertools.count()
+        self._drain_task = None
+
+        self.requests = 0
+        self.throttled = 0
+        self.rate_limit_errors = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    def _refill(self, now):
+        if self._updated_at is not None and now <= self._updated_at:
+            return
+        if self._updated_at is not None:
+            self.credits = min(self.capacity, self.credits + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def _available(self):
+        return self.credits + _CREDIT_TOLERANCE >= self.cost
+
+    async def acquire(self, priority=PRIORITY_ORDER_PATH):
+        """
+        Wait until the credits of one request are available and take them.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._refill(now)
+        self.requests += 1
+        if not self._queue and self._available():
+            self.credits -= self.cost
+            return
+
+        self.throttled += 1
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = loop.create_task(self._drain())
+        await future
+        delay = loop.time() - now
+        self.total_queue_delay += delay
+        self.max_queue_delay = max(self.max_queue_delay, delay)
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            self._refill(loop.time())
+            if not self._available():
+                # Timers may fire slightly early: credit the whole wait, and always move forward in time
+                now = loop.time()
+                wake_at = max(now + (self.cost - self.credits) / self.refill_per_second, math.nextafter(now, math.inf))
+                await asyncio.sleep(wake_at - now)
+                self._refill(max(loop.time(), wake_at))
+                continue
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # The waiting request was cancelled
+            self.credits -= self.cost
+            future.set_result(None)
+
+    def penalize(self):
+        """
+        The exchange rejected a request for exceeding the limit: our view of the credits was
+        optimistic, so start over from an empty bucket.
+        """
+        self.rate_limit_errors += 1
+        self._refill(asyncio.get_running_loop().time())
+        self.credits = 0
+
+    def metrics(self):
+        waited = self.throttled or 1
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "rate_limit_errors": self.rate_limit_errors,
+            "queued": len(self._queue),
+            "credits": self.credits,
+            "mean_queue_delay_seconds": self.total_queue_delay / waited,
+            "max_queue_delay_seconds": self.max_queue_delay,
+        }
+
+
+class RateLimiter:
+    """
+    Client-side scheduler for the Deribit credit limits.
+
+    Each request is routed to the matching engine or the non-matching engine credit pool by its
+    method, and waits there for credits. Order path calls are served before informational calls
+    such as get_account_summary or ticker. Share one RateLimiter between the connections of an
+    account, since the exchange counts credits per account.
+    """
+
+    def __init__(self, matching_engine=None, non_matching_engine=None):
+        self.matching_engine = matching_engine or CreditPool(
+            "matching_engine", MATCHING_ENGINE_CREDITS, MATCHING_ENGINE_REFILL_PER_SECOND, MATCHING_ENGINE_COST
+        )
+        self.non_matching_engine = non_matching_engine or CreditPool(
+            "non_matching_engine", NON_MATCHING_ENGINE_CREDITS, NON_MATCHING_ENGINE_REFILL_PER_SECOND,
+            NON_MATCHING_ENGINE_COST
+        )
+
+    def pool(self, method):
+        return self.matching_engine if method in MATCHING_ENGINE_METHODS else self.non_matching_engine
+
+    async def acquire(self, method, priority=None):
+        if priority is None:
+            priority = PRIORITY_INFORMATIONAL if method in INFORMATIONAL_METHODS else PRIORITY_ORDER_PATH
+        await self.pool(method).acquire(priority)
+
+    def penalize(self, method):
+        self.pool(method).penalize()
+
+    def metrics(self):
+        return {pool.name: pool.metrics() for pool in (self.matching_engine, self.non_matching_engine)}
+
+
+def is_rate_limited(response):
+    return response.get("error", {}).get("code") == TOO_MANY_REQUESTS_ERROR
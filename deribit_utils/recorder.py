@@ -0,0 +1,584 @@
+"""
+Market-data recorder: the book, trades and ticker channels of Deribit instruments captured to
+compressed, append-only Arrow segments, and a memory-mapped reader that replays them.
+
+Each channel is recorded to its own directory, one segment per MARKET_DATA_ROTATION_SECONDS of
+receive time. A segment is an Arrow IPC stream of zstd-compressed record batches with typed
+columns. Book and trades notifications are flattened to one row per level or trade, and a
+message column groups the rows of each notification again on replay. Every row also keeps the
+local receive time next to the exchange timestamp.
+
+The subscription handler only appends the notification to an in-memory list, so the client's
+reader task is never held up and no message is dropped. A background task swaps the lists out
+every MARKET_DATA_FLUSH_SECONDS and builds and compresses the batches in a worker thread. The
+segment in progress is named *.arrows.part. Batches written before a crash can still be read,
+and the next recorder in the directory renames the segment to *.arrows.
+
+Gaps in the book change_id chain and in the trade_seq of each instrument are counted. A book
+snapshot, as sent again on every (re)subscription, restarts the chain.
+
+Configuration, read once at import:
+    MARKET_DATA_DIR=/data/market_data  root directory of the recordings
+
+Usage:
+    python -m deribit_utils.recorder --instruments BTC-PERPETUAL --interval 100ms
+
+    reader = MarketDataReader()
+    for receive_time, channel, data in reader.messages(["book.BTC-PERPETUAL.100ms"], start, end):
+        book.on_message(channel, data)
+    book_df, trades_df = reader.execution_frames("BTC-PERPETUAL", start, end)  # For backtest_utils.execution
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import heapq
+import logging
+import os
+import signal
+import time
+
+from telemetry_utils.telemetry import telemetry
+
+MARKET_DATA_DIR = os.environ.get("MARKET_DATA_DIR", "/tmp/deribit_trading/market_data")
+MARKET_DATA_ROTATION_SECONDS = 3600  # One segment per channel and hour
+MARKET_DATA_FLUSH_SECONDS = 5  # Longest a received message stays in memory, and what a crash can lose
+MARKET_DATA_COMPRESSION = "zstd"
+MARKET_DATA_INTERVAL = "100ms"  # raw needs an authorized connection
+
+SEGMENT_SUFFIX = ".arrows"
+PART_SUFFIX = ".part"
+
+BOOK_ACTIONS = ["new", "change", "delete"]
+_BOOK_ACTION_CODES = {action: code for code, action in enumerate(BOOK_ACTIONS)}
+_DIRECTIONS = {"buy": 1, "sell": -1}
+
+TICKER_FIELDS = [
+    "best_bid_price", "best_bid_amount", "best_ask_price", "best_ask_amount", "last_price",
+    "mark_price", "index_price", "open_interest", "funding_8h", "current_funding",
+]
+
+
+def _channel_kind(channel):
+    # book.{instrument}.{interval}, trades.{instrument}.{interval} or ticker.{instrument}.{interval}
+    parts = channel.split(".")
+    if len(parts) != 3 or parts[0] not in ("book", "trades", "ticker"):
+        raise ValueError(f"Unsupported channel {channel!r}, expected book, trades or ticker.<instrument>.<interval>")
+    return parts[0]
+
+
+def _schema(kind):
+    import pyarrow as pa
+
+    common = [("receive_time", pa.float64()), ("message", pa.int64()), ("timestamp", pa.int64())]
+    if kind == "book":
+        fields = common + [
+            ("change_id", pa.int64()), ("prev_change_id", pa.int64()), ("snapshot", pa.bool_()),
+            ("side", pa.int8()),  # 1 bid, -1 ask, 0 for a notification without levels
+            ("action", pa.int8()),  # Index in BOOK_ACTIONS
+            ("price", pa.float64()), ("amount", pa.float64()),
+        ]
+    elif kind == "trades":
+        fields = common + [
+            ("trade_seq", pa.int64()), ("trade_id", pa.string()), ("price", pa.float64()),
+            ("amount", pa.float64()), ("direction", pa.int8()), ("tick_direction", pa.int8()),
+            ("mark_price", pa.float64()), ("index_price", pa.float64()),
+        ]
+    else:
+        fields = common + [(name, pa.float64()) for name in TICKER_FIELDS]
+    return pa.schema(fields)
+
+
+def _rows(kind, messages, first_message):
+    """
+    Columns of a record batch of kind, as a dict of lists, from (receive_time, data) notifications.
+    """
+    numbers = range(first_message, first_message + len(messages))
+    if kind == "ticker":
+        columns = {
+            "receive_time": [receive_time for receive_time, _ in messages],
+            "message": list(numbers),
+            "timestamp": [data["timestamp"] for _, data in messages],
+        }
+        for name in TICKER_FIELDS:
+            columns[name] = [data.get(name) for _, data in messages]
+        return columns
+
+    if kind == "trades":
+        rows = [
+            (receive_time, number, trade["timestamp"], trade.get("trade_seq"), trade.get("trade_id"),
+             trade["price"], trade["amount"], _DIRECTIONS[trade["direction"]], trade.get("tick_direction"),
+             trade.get("mark_price"), trade.get("index_price"))
+            for (receive_time, trades), number in zip(messages, numbers) for trade in trades
+        ]
+    else:
+        rows = []
+        append = rows.append
+        for (receive_time, data), number in zip(messages, numbers):
+            head = (receive_time, number, data["timestamp"], data["change_id"], data.get("prev_change_id"),
+                    data.get("type") == "snapshot")
+            start = len(rows)
+            for side, levels in ((1, data.get("bids") or ()), (-1, data.get("asks") or ())):
+                for action, price, amount in levels:
+                    append(head + (side, _BOOK_ACTION_CODES[action], price, amount))
+            if len(rows) == start:
+                append(head + (0, -1, None, None))  # Kept so the change_id chain stays whole
+    names = _schema(kind).names
+    return dict(zip(names, map(list, zip(*rows)))) if rows else {name: [] for name in names}
+
+
+class _Segment:
+    """
+    Open Arrow IPC stream of one channel, written to a .part file until it is closed.
+    """
+
+    def __init__(self, path, schema, compression):
+        import pyarrow as pa
+
+        self.path = path
+        self.sink = pa.OSFile(path + PART_SUFFIX, "wb")
+        self.writer = pa.ipc.new_stream(self.sink, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    def write(self, batch):
+        """
+        Append batch and return the number of bytes it took in the file.
+        """
+        position = self.sink.tell()
+        self.writer.write_batch(batch)
+        self.sink.flush()
+        return self.sink.tell() - position
+
+    def close(self):
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.path + PART_SUFFIX, self.path)
+
+
+def _segment_start(receive_time, rotation_seconds):
+    return int(receive_time // rotation_seconds * rotation_seconds)
+
+
+def _segment_name(start):
+    return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ") + SEGMENT_SUFFIX
+
+
+def _parse_segment_name(name):
+    stamp = name.split(".", 1)[0].split("-", 1)[0]
+    return datetime.datetime.strptime(stamp, "%Y%m%dT%H%M%SZ").replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class MarketDataRecorder:
+    """
+    Records Deribit channels to segments under directory, see the module docstring.
+    """
+
+    def __init__(self, channels, directory=MARKET_DATA_DIR, rotation_seconds=MARKET_DATA_ROTATION_SECONDS,
+                 flush_interval=MARKET_DATA_FLUSH_SECONDS, compression=MARKET_DATA_COMPRESSION):
+        """
+        Args:
+        - channels: Channel names, e.g. ["book.BTC-PERPETUAL.100ms", "trades.BTC-PERPETUAL.100ms"].
+        - directory: Root directory of the recordings, one subdirectory per channel.
+        - rotation_seconds: Receive time covered by a segment. Segments start on multiples of it.
+        - flush_interval: Seconds between two writes of the received messages.
+        - compression: Arrow IPC buffer compression, "zstd", "lz4" or None.
+        """
+        self.kinds = {channel: _channel_kind(channel) for channel in channels}
+        self.channels = list(self.kinds)
+        self.directory = directory
+        self.rotation_seconds = rotation_seconds
+        self.flush_interval = flush_interval
+        self.compression = compression
+        self.client = None
+        self._buffers = {channel: [] for channel in self.channels}
+        self._segments = {}  # Open segment of each channel: (start, _Segment)
+        self._message_numbers = dict.fromkeys(self.channels, 0)
+        self._last_change_ids = {}
+        self._last_trade_seqs = {}
+        self._task = None
+        self._flush_lock = None
+        self._stopping = None
+
+        self.received = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.book_gaps = 0
+        self.trade_gaps = 0
+
+    async def start(self, client):
+        """
+        Subscribe to the channels and write what they send until stop().
+        """
+        for channel in self.channels:
+            os.makedirs(os.path.join(self.directory, channel), exist_ok=True)
+        self._finish_parts()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self.client = client
+        await client.subscribe(self.channels, self.on_message)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Unsubscribe, write the messages still in memory and close the segments.
+        """
+        if self.client is not None and not self.client.closed:
+            await self.client.unsubscribe(self.channels, self.on_message)
+        self.client = None
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close_segments)
+
+    def on_message(self, channel, data):
+        """
+        Keep a notification for the next flush. Runs in the client's reader task, so it does no
+        more than the gap checks and an append.
+        """
+        receive_time = time.time()
+        kind = self.kinds[channel]
+        if kind == "book":
+            if data.get("type") != "snapshot" and data.get("prev_change_id") != self._last_change_ids.get(channel):
+                self.book_gaps += 1
+                telemetry.increment("recorder.book_gaps")
+            self._last_change_ids[channel] = data["change_id"]
+        elif kind == "trades":
+            for trade in data:
+                instrument_name = trade.get("instrument_name")
+                last_seq = self._last_trade_seqs.get(instrument_name)
+                trade_seq = trade.get("trade_seq")
+                if last_seq is not None and trade_seq is not None and trade_seq > last_seq + 1:
+                    self.trade_gaps += 1
+                    telemetry.increment("recorder.trade_gaps")
+                if trade_seq is not None:
+                    self._last_trade_seqs[instrument_name] = trade_seq
+        self._buffers[channel].append((receive_time, data))
+        self.received += 1
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                # The messages stay in memory for the next flush
+                logging.warning(f"Market data flush failed: {e}")
+
+    async def flush(self):
+        """
+        Write the messages received since the last flush, in a worker thread.
+        """
+        async with self._flush_lock:
+            batches = {}
+            for channel, messages in self._buffers.items():
+                if messages:
+                    batches[channel] = messages
+                    self._buffers[channel] = []
+            if not batches:
+                return 0
+            start = time.perf_counter()
+            try:
+                written = await asyncio.to_thread(self._write, batches)
+            except BaseException:
+                # _write removed what it wrote from batches, only the rest is written again
+                for channel, messages in batches.items():
+                    self._buffers[channel][:0] = messages
+                raise
+            telemetry.record("recorder.flush_seconds", time.perf_counter() - start)
+            return written
+
+    def _write(self, batches):
+        """
+        Write batches, a dict of the messages of each channel, and return the number of messages
+        written. Each chunk of messages is removed from batches once written, so that after an
+        error batches holds only the messages still to write.
+        """
+        import pyarrow as pa
+
+        written = 0
+        for channel in list(batches):
+            messages = batches[channel]
+            kind = self.kinds[channel]
+            schema = _schema(kind)
+            # Split at the segment boundaries, messages arrive in receive time order
+            while messages:
+                segment_start = _segment_start(messages[0][0], self.rotation_seconds)
+                segment_end = segment_start + self.rotation_seconds
+                count = next((i for i, (receive_time, _) in enumerate(messages) if receive_time >= segment_end),
+                             len(messages))
+                chunk, messages = messages[:count], messages[count:]
+                segment = self._segment(channel, segment_start, schema)
+                columns = _rows(kind, chunk, self._message_numbers[channel])
+                batch = pa.RecordBatch.from_pydict(columns, schema=schema)
+                self.bytes_written += segment.write(batch)
+                # Message numbers only move on once the batch is written, so a retried flush reuses them
+                self._message_numbers[channel] += len(chunk)
+                self.written += len(chunk)
+                written += len(chunk)
+                batches[channel] = messages
+            del batches[channel]
+        return written
+
+    def _segment(self, channel, start, schema):
+        current = self._segments.get(channel)
+        if current is not None and current[0] == start:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        directory = os.path.join(self.directory, channel)
+        path = os.path.join(directory, _segment_name(start))
+        suffix = 1
+        while os.path.exists(path) or os.path.exists(path + PART_SUFFIX):
+            # Restarted within the period, or a clock step: the new segment sorts after the old one
+            path = os.path.join(directory, _segment_name(start)[:-len(SEGMENT_SUFFIX)] + f"-{suffix}{SEGMENT_SUFFIX}")
+            suffix += 1
+        segment = _Segment(path, schema, self.compression)
+        self._segments[channel] = (start, segment)
+        logging.info(f"Recording {channel} to {path}")
+        return segment
+
+    def _close_segments(self):
+        for _, segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+
+    def _finish_parts(self):
+        # Segments left open by a recorder that did not stop cleanly, readable up to their last batch
+        for channel in self.channels:
+            for part in glob.glob(os.path.join(self.directory, channel, f"*{SEGMENT_SUFFIX}{PART_SUFFIX}")):
+                os.replace(part, part[:-len(PART_SUFFIX)])
+                logging.info(f"Closed the interrupted segment {part}")
+
+    def metrics(self):
+        return {
+            "received": self.received,
+            "written": self.written,
+            "buffered": sum(len(messages) for messages in self._buffers.values()),
+            "bytes_written": self.bytes_written,
+            "book_gaps": self.book_gaps,
+            "trade_gaps": self.trade_gaps,
+        }
+
+
+class MarketDataReader:
+    """
+    Reads the segments of a MarketDataRecorder directory through memory maps.
+    """
+
+    def __init__(self, directory=MARKET_DATA_DIR):
+        self.directory = directory
+
+    def channels(self):
+        return sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+
+    def segments(self, channel, start=None, end=None):
+        """
+        Paths of the closed segments of channel that may hold messages received in [start, end),
+        times in seconds since the epoch, oldest first.
+        """
+        paths = sorted(glob.glob(os.path.join(self.directory, channel, f"*{SEGMENT_SUFFIX}")))
+        starts = [_parse_segment_name(os.path.basename(path)) for path in paths]
+        selected = []
+        for i, (path, segment_start) in enumerate(zip(paths, starts)):
+            next_start = next((later for later in starts[i + 1:] if later > segment_start), None)
+            if end is not None and segment_start >= end:
+                continue
+            if start is not None and next_start is not None and next_start <= start:
+                continue
+            selected.append(path)
+        return selected
+
+    def batches(self, channel, start=None, end=None):
+        """
+        Yield the record batches of channel received in [start, end). The batches are read from
+        memory-mapped files, one at a time.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        for path in self.segments(channel, start, end):
+            # Not closed here: uncompressed batches point into the map, which lives as long as they do
+            reader = pa.ipc.open_stream(pa.memory_map(path, "r"))
+            while True:
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    break
+                except (pa.ArrowInvalid, OSError) as e:
+                    logging.warning(f"Market data segment {path} is truncated, read up to its last batch: {e}")
+                    break
+                if start is not None or end is not None:
+                    receive_time = batch.column("receive_time")
+                    mask = None
+                    if start is not None:
+                        mask = pc.greater_equal(receive_time, start)
+                    if end is not None:
+                        below = pc.less(receive_time, end)
+                        mask = below if mask is None else pc.and_(mask, below)
+                    batch = batch.filter(mask)
+                if batch.num_rows:
+                    yield batch
+
+    def read(self, channel, start=None, end=None):
+        """
+        Return the rows of channel received in [start, end) as a pyarrow.Table.
+        """
+        import pyarrow as pa
+        return pa.Table.from_batches(list(self.batches(channel, start, end)), schema=_schema(_channel_kind(channel)))
+
+    def _channel_messages(self, channel, start, end):
+        kind = _channel_kind(channel)
+        instrument_name = channel.split(".")[1]
+        for batch in self.batches(channel, start, end):
+            for receive_time, data in _messages(kind, instrument_name, batch.to_pydict()):
+                yield receive_time, channel, data
+
+    def messages(self, channels=None, start=None, end=None):
+        """
+        Yield (receive_time, channel, data) for the messages of channels (every recorded channel
+        by default) received in [start, end), in receive time order across channels. data has the
+        shape of the Deribit notification, so it can be passed to the subscription handlers.
+        """
+        channels = self.channels() if channels is None else channels
+        streams = [self._channel_messages(channel, start, end) for channel in channels]
+        # Messages received at the same time come in the order of channels
+        yield from heapq.merge(*streams, key=lambda message: message[0])
+
+    async def replay(self, handler, channels=None, start=None, end=None, speed=None):
+        """
+        Call handler(channel, data) with the recorded messages, see messages().
+
+        Args:
+        - speed: None to replay as fast as possible, otherwise the replay speed relative to the
+          recording, e.g. 1 for the original pace or 10 for ten times faster.
+
+        Returns:
+        - The number of messages replayed.
+        """
+        loop = asyncio.get_running_loop()
+        first_time = replay_start = None
+        count = 0
+        for receive_time, channel, data in self.messages(channels, start, end):
+            if speed is not None:
+                if first_time is None:
+                    first_time, replay_start = receive_time, loop.time()
+                delay = replay_start + (receive_time - first_time) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif count % 1000 == 0:
+                await asyncio.sleep(0)  # Let the other tasks run between chunks of messages
+            handler(channel, data)
+            count += 1
+        return count
+
+    def execution_frames(self, instrument_name, start=None, end=None, interval=MARKET_DATA_INTERVAL):
+        """
+        Return the (book, trades) DataFrames of backtest_utils.execution.prepare_market_data: the
+        best bid/ask of the recorded ticker, and the recorded trades.
+        """
+        book = self.read(f"ticker.{instrument_name}.{interval}", start, end).to_pandas()
+        book = book[["timestamp", "best_bid_price", "best_bid_amount", "best_ask_price", "best_ask_amount"]]
+        trades = self.read(f"trades.{instrument_name}.{interval}", start, end).to_pandas()
+        trades = trades[["timestamp", "price", "amount"]].assign(
+            direction=trades["direction"].map({1: "buy", -1: "sell"}))
+        return book, trades
+
+
+def _messages(kind, instrument_name, columns):
+    """
+    Rebuild the (receive_time, data) notifications of a batch, given as a dict of lists.
+    """
+    receive_times, numbers, timestamps = columns["receive_time"], columns["message"], columns["timestamp"]
+    if kind == "ticker":
+        fields = [columns[name] for name in TICKER_FIELDS]
+        for i, receive_time in enumerate(receive_times):
+            data = {"instrument_name": instrument_name, "timestamp": timestamps[i]}
+            for name, values in zip(TICKER_FIELDS, fields):
+                if values[i] is not None:
+                    data[name] = values[i]
+            yield receive_time, data
+        return
+
+    start = 0
+    count = len(numbers)
+    while start < count:
+        end = start + 1
+        while end < count and numbers[end] == numbers[start]:
+            end += 1
+        if kind == "trades":
+            data = [
+                {"instrument_name": instrument_name, "timestamp": timestamps[i], "trade_seq": columns["trade_seq"][i],
+                 "trade_id": columns["trade_id"][i], "price": columns["price"][i], "amount": columns["amount"][i],
+                 "direction": "buy" if columns["direction"][i] > 0 else "sell",
+                 "tick_direction": columns["tick_direction"][i], "mark_price": columns["mark_price"][i],
+                 "index_price": columns["index_price"][i]}
+                for i in range(start, end)
+            ]
+        else:
+            data = {
+                "type": "snapshot" if columns["snapshot"][start] else "change",
+                "instrument_name": instrument_name,
+                "timestamp": timestamps[start],
+                "change_id": columns["change_id"][start],
+                "bids": [],
+                "asks": [],
+            }
+            if columns["prev_change_id"][start] is not None:
+                data["prev_change_id"] = columns["prev_change_id"][start]
+            for i in range(start, end):
+                side = columns["side"][i]
+                if side:
+                    level = [BOOK_ACTIONS[columns["action"][i]], columns["price"][i], columns["amount"][i]]
+                    (data["bids"] if side > 0 else data["asks"]).append(level)
+        yield receive_times[start], data
+        start = end
+
+
+def market_data_channels(instrument_names, interval=MARKET_DATA_INTERVAL):
+    return [f"{kind}.{instrument_name}.{interval}" for instrument_name in instrument_names
+            for kind in ("book", "trades", "ticker")]
+
+
+async def record(channels, directory=MARKET_DATA_DIR, url=None):
+    """
+    Record channels until SIGINT or SIGTERM, over a session that reconnects and resubscribes when
+    the connection drops. Public channels need no credentials.
+    """
+    from deribit_utils.session import SessionManager
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+    async with SessionManager(None, None, url=url, max_attempts=None) as session:
+        client = await session.start()
+        recorder = MarketDataRecorder(channels, directory)
+        await recorder.start(client)
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), 60)
+                except asyncio.TimeoutError:
+                    logging.info(f"Market data recorder: {recorder.metrics()}")
+        finally:
+            await recorder.stop()
+    logging.info(f"Market data recorder stopped: {recorder.metrics()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record Deribit book, trades and ticker channels to Arrow segments.")
+    parser.add_argument("--instruments", default="BTC-PERPETUAL", help="Comma-separated instrument names")
+    parser.add_argument("--interval", default=MARKET_DATA_INTERVAL, help="Channel interval, e.g. 100ms or agg2")
+    parser.add_argument("--directory", default=MARKET_DATA_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(record(market_data_channels(args.instruments.split(","), args.interval), args.directory))
+
+
+if __name__ == "__main__":
+    main()
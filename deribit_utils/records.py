@@ -0,0 +1,134 @@
+"""
+Typed records of the Deribit results the trading logic reads: orders, positions, tickers, the
+top of the order book and candles, and the pre-trade snapshot of a run.
+
+Records hold only the fields the trading logic uses, in __slots__, instead of the full response
+dict. They also answer record["field"] and record.get("field", default), so code written for the
+raw dicts keeps working.
+"""
+
+
+class _Record:
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a record from a decoded result. Missing fields are None.
+        """
+        record = cls.__new__(cls)
+        get = data.get
+        for field in cls.__slots__:
+            setattr(record, field, get(field))
+        return record
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in self.__slots__ else None
+        return default if value is None else value
+
+    def __contains__(self, field):
+        return field in self.__slots__ and getattr(self, field) is not None
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __hash__(self):
+        # Consistent with __eq__: records holding unhashable values, like a dict, are unhashable
+        return hash((type(self),) + tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={value!r}" for field, value in self.to_dict().items())
+        return f"{type(self).__name__}({fields})"
+
+
+class Order(_Record):
+    __slots__ = (
+        "order_id", "instrument_name", "direction", "order_type", "order_state", "price", "amount",
+        "filled_amount", "average_price", "trigger_price", "post_only", "reduce_only", "label",
+        "creation_timestamp", "last_update_timestamp",
+    )
+
+
+class Position(_Record):
+    __slots__ = (
+        "instrument_name", "kind", "size", "direction", "average_price", "mark_price", "floating_profit_loss",
+    )
+
+
+class Ticker(_Record):
+    __slots__ = (
+        "instrument_name", "timestamp", "best_bid_price", "best_bid_amount", "best_ask_price",
+        "best_ask_amount", "last_price", "mark_price", "index_price",
+    )
+
+
+class BookTop(_Record):
+    __slots__ = (
+        "instrument_name", "timestamp", "best_bid_price", "best_bid_amount", "best_ask_price", "best_ask_amount",
+    )
+
+    def __init__(self, instrument_name, timestamp, best_bid_price, best_bid_amount, best_ask_price, best_ask_amount):
+        self.instrument_name = instrument_name
+        self.timestamp = timestamp
+        self.best_bid_price = best_bid_price
+        self.best_bid_amount = best_bid_amount
+        self.best_ask_price = best_ask_price
+        self.best_ask_amount = best_ask_amount
+
+    @property
+    def spread(self):
+        if self.best_bid_price is None or self.best_ask_price is None:
+            return None
+        return self.best_ask_price - self.best_bid_price
+
+    @property
+    def mid_price(self):
+        if self.best_bid_price is None or self.best_ask_price is None:
+            return None
+        return (self.best_bid_price + self.best_ask_price) / 2
+
+
+class Candle(_Record):
+    __slots__ = (
+        "tick", "open", "high", "low", "close", "volume", "cost",
+    )
+
+
+class PreTradeSnapshot(_Record):
+    """
+    State of the account and the instrument when a signal is acted on, gathered in one concurrent
+    round by deribit_utils.get_pre_trade_snapshot and passed down the order path. Read-only.
+    taken_at is the event loop time at which the round completed.
+    """
+    __slots__ = (
+        "instrument_name", "taken_at", "available_balance", "ticker", "position", "instrument_details", "sent_orders",
+    )
+
+    def __init__(self, instrument_name, taken_at, available_balance, ticker, position, instrument_details, sent_orders=()):
+        values = (instrument_name, taken_at, available_balance, ticker, position, instrument_details, tuple(sent_orders))
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data.get(field) for field in cls.__slots__ if field in data})
+
+    def __setattr__(self, field, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    @property
+    def price(self):
+        """
+        Last price of the instrument, 0 if the ticker could not be read.
+        """
+        return self.ticker.get("last_price", 0) if self.ticker is not None else 0
@@ -0,0 +1,292 @@
+"""
+Authenticated Deribit session: one DeribitClient whose connection is reopened, re-authenticated
+and resubscribed when it drops, with the access token refreshed in the background.
+
+Tokens are kept per API key for the life of the process, so the sessions of later runs (warm
+Cloud Function invocations, reconnections of the service) authenticate with the refresh token
+instead of the client credentials. While the connection is up, a background task renews the
+token with grant_type=refresh_token TOKEN_REFRESH_MARGIN_SECONDS before it expires, alongside
+the order flow rather than in front of it.
+
+When the connection drops, requests wait for the reconnection instead of failing. The socket is
+reopened with exponential backoff, then the auth and the public resubscriptions are sent
+together. The private (user.*) channels follow once authenticated, and the order books and state
+trackers of the connection are resynced. The reconnect-to-ready time is logged and recorded as
+the session.reconnect_seconds telemetry metric.
+
+A session without credentials (api_key None) is never authenticated, for recorders and other
+readers of public channels that only need the reconnections.
+
+Usage:
+    async with SessionManager(api_key, api_secret) as session:
+        client = await session.start()
+        await execute_trade_logic(client, df)
+"""
+import asyncio
+import inspect
+import logging
+import random
+import time
+
+from deribit_utils.client import DeribitClient
+from telemetry_utils.telemetry import telemetry
+
+TOKEN_REFRESH_MARGIN_SECONDS = 120  # Refresh this long before the access token expires
+TOKEN_REFRESH_RETRY_SECONDS = 10
+RECONNECT_BACKOFF_SECONDS = 0.5  # First delay between connection attempts, doubled after each failure
+RECONNECT_MAX_BACKOFF_SECONDS = 30
+RECONNECT_MAX_ATTEMPTS = 5  # Connection attempts before start() gives up, None to retry forever
+
+_tokens = {}  # Latest token of each API key, reused by the next session of the process
+
+
+class _Token:
+    __slots__ = ("access_token", "refresh_token", "expires_at", "scope")
+
+    def __init__(self, result):
+        self.access_token = result["access_token"]
+        self.refresh_token = result.get("refresh_token")
+        self.expires_at = time.time() + result.get("expires_in", 0)
+        self.scope = result.get("scope")
+
+    def expires_in(self):
+        return self.expires_at - time.time()
+
+    def __repr__(self):
+        # Never print the tokens themselves
+        return f"_Token(scope={self.scope!r}, expires_in={self.expires_in():.0f}s)"
+
+
+class SessionManager:
+    """
+    Keeps an authenticated DeribitClient connected, see the module docstring.
+    """
+
+    def __init__(self, api_key, api_secret, url=None, connect=None, rate_limiter=None, request_timeout=10,
+                 refresh_margin=TOKEN_REFRESH_MARGIN_SECONDS, backoff=RECONNECT_BACKOFF_SECONDS,
+                 max_backoff=RECONNECT_MAX_BACKOFF_SECONDS, max_attempts=RECONNECT_MAX_ATTEMPTS):
+        """
+        Args:
+        - api_key, api_secret: Client credentials of the account, None for public channels only.
+        - url: WebSocket URL, the Deribit production API if not given.
+        - connect: Optional callable returning an open WebSocket, or an awaitable of one.
+          Defaults to websockets.connect(url).
+        - rate_limiter: RateLimiter of the client, kept across reconnections.
+        - request_timeout: Request timeout of the client, also the longest a request waits for a reconnection.
+        - refresh_margin: Seconds before expiry at which the access token is refreshed.
+        - backoff, max_backoff: First and longest delay between two connection attempts.
+        - max_attempts: Attempts to open a socket before start() gives up, None to retry forever.
+          A lost connection is retried until the session is closed.
+        """
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.url = url
+        self._connect = connect
+        self.rate_limiter = rate_limiter
+        self.request_timeout = request_timeout
+        self.refresh_margin = refresh_margin
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.client = None
+        self.websocket = None
+        self._supervisor_task = None
+        self._refresh_task = None
+        self._closing = False
+
+        self.authentications = 0
+        self.refreshes = 0
+        self.reconnects = 0
+        self.connect_seconds = None
+        self.last_reconnect_seconds = None
+
+    @property
+    def token(self):
+        return _tokens.get(self.api_key)
+
+    async def start(self):
+        """
+        Return the authenticated client, connecting it on first use.
+        Raises ConnectionError if the account cannot authenticate.
+        """
+        if self.client is not None:
+            return self.client
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        self._closing = False
+        self.websocket = await self._open_websocket()
+        client = DeribitClient(self.websocket, request_timeout=self.request_timeout, rate_limiter=self.rate_limiter)
+        client.start()
+        try:
+            await self._authenticate(client)
+        except BaseException:
+            await client.close()
+            await self.websocket.close()
+            self.websocket = None
+            raise
+        self.client = client
+        self.connect_seconds = loop.time() - started_at
+        telemetry.record("session.connect_seconds", self.connect_seconds)
+        logging.info(f"Deribit session ready in {self.connect_seconds:.3f}s")
+        self._supervisor_task = loop.create_task(self._supervise())
+        if self.api_key is not None:
+            self._refresh_task = loop.create_task(self._refresh_loop())
+        return client
+
+    async def close(self):
+        self._closing = True
+        for task in (self._supervisor_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._supervisor_task = self._refresh_task = None
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self.websocket is not None:
+            try:
+                await self.websocket.close()
+            except Exception as e:
+                logging.debug(f"Error closing the Deribit socket: {e}")
+            self.websocket = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # Authentication
+
+    async def _authenticate(self, client):
+        if self.api_key is None:
+            return
+        token = self.token
+        if token is not None and token.refresh_token:
+            response = await self._auth_request(client, {"grant_type": "refresh_token",
+                                                         "refresh_token": token.refresh_token})
+            if response is not None:
+                return
+            logging.info("Deribit refresh token rejected, authenticating with the client credentials")
+        response = await self._auth_request(client, {"grant_type": "client_credentials",
+                                                     "client_id": self.api_key, "client_secret": self.api_secret})
+        if response is None:
+            raise ConnectionError("Deribit authentication failed")
+
+    async def _auth_request(self, client, params):
+        response = await client.request("public/auth", params, wait_connected=False)
+        result = response.get("result") or {}
+        if "access_token" not in result:
+            logging.warning(f"Deribit {params['grant_type']} authentication failed: {response.get('error')}")
+            if params["grant_type"] == "refresh_token":
+                _tokens.pop(self.api_key, None)
+            return None
+        token = _tokens[self.api_key] = _Token(result)
+        self.authentications += 1
+        logging.info(f"Deribit session authenticated with {params['grant_type']}, {token}")
+        return token
+
+    async def _refresh_loop(self):
+        while True:
+            token = self.token
+            await asyncio.sleep(max(token.expires_in() - self.refresh_margin, 0) if token is not None else 0)
+            client = self.client
+            if client is None or client.closed or client.reconnecting is not None:
+                await asyncio.sleep(TOKEN_REFRESH_RETRY_SECONDS)  # The reconnection authenticates
+                continue
+            try:
+                await self._authenticate(client)  # With the refresh token, the credentials if it is rejected
+                self.refreshes += 1
+                telemetry.increment("session.token_refreshes")
+            except Exception as e:
+                logging.warning(f"Deribit token refresh failed: {e}")
+                await asyncio.sleep(TOKEN_REFRESH_RETRY_SECONDS)
+
+    # Connection
+
+    async def _open_websocket(self):
+        for attempt in range(self.max_attempts or 1 << 62):
+            try:
+                if self._connect is not None:
+                    websocket = self._connect()
+                    if inspect.isawaitable(websocket):
+                        websocket = await websocket
+                    return websocket
+                import websockets
+                from deribit_utils.deribit_utils import websocket_url
+                return await websockets.connect(self.url or websocket_url)
+            except Exception as e:
+                if self.max_attempts is not None and attempt + 1 >= self.max_attempts:
+                    raise ConnectionError(f"Could not connect to Deribit after {attempt + 1} attempts: {e}") from e
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1)
+                logging.warning(f"Deribit connection attempt {attempt + 1} failed: {e}. Retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _supervise(self):
+        while True:
+            await self.client.wait_closed()
+            if self._closing:
+                return
+            await self._reconnect()
+
+    async def _reconnect(self):
+        client = self.client
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        client.reconnecting = loop.create_future()
+        for book in client.order_books.values():
+            book.invalidate()
+        logging.warning("Deribit connection lost, reconnecting")
+        try:
+            for attempt in range(1 << 62):
+                try:
+                    await self.websocket.close()
+                except Exception as e:
+                    logging.debug(f"Error closing the lost Deribit socket: {e}")
+                try:
+                    self.websocket = await self._open_websocket()
+                    client.attach(self.websocket)
+                    await self._restore(client)
+                    break
+                except Exception as e:
+                    delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1)
+                    logging.warning(f"Deribit reconnection failed: {e}. Retrying in {delay:.1f}s")
+                    await client.close()
+                    await asyncio.sleep(delay)
+        finally:
+            client.reconnecting.set_result(None)
+            client.reconnecting = None
+        self.reconnects += 1
+        self.last_reconnect_seconds = loop.time() - started_at
+        telemetry.record("session.reconnect_seconds", self.last_reconnect_seconds)
+        logging.info(f"Deribit connection ready again in {self.last_reconnect_seconds:.3f}s")
+
+        # Orders and positions may have changed while the connection was down
+        results = await asyncio.gather(*(tracker.resync() for tracker in list(client.state_trackers.values())),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.warning(f"Could not resync an order state tracker: {result}")
+
+    async def _restore(self, client):
+        channels = client.subscribed_channels()
+        public = [channel for channel in channels if not channel.startswith("user.")]
+        private = [channel for channel in channels if channel.startswith("user.")]
+        # The auth and the public channels do not depend on each other, send them together
+        await asyncio.gather(self._authenticate(client), *([client.resubscribe(public)] if public else []))
+        if private:
+            await client.resubscribe(private)
+
+    def metrics(self):
+        token = self.token
+        return {
+            "authentications": self.authentications,
+            "refreshes": self.refreshes,
+            "reconnects": self.reconnects,
+            "connect_seconds": self.connect_seconds,
+            "last_reconnect_seconds": self.last_reconnect_seconds,
+            "token_expires_in": token.expires_in() if token is not None else None,
+        }
@@ -0,0 +1,302 @@
+"""
+Awesome Oscillator signals computed in process, bar by bar, from Deribit `chart.trades` candles,
+instead of read from the signals table written by the ETL.
+
+The rules of the signals table:
+- AO = SMA(median price, AO_FAST_PERIOD) - SMA(median price, AO_SLOW_PERIOD), where the median
+  price of a bar is (high + low) / 2.
+- Long_Entry when AO crosses above zero on a closed bar (previous AO <= 0 < AO), Short_Entry
+  when it crosses below zero (previous AO >= 0 > AO).
+
+SignalEngine keeps the two moving averages as rolling sums over ring buffers, so each closed bar
+costs O(1) whatever the length of the history. ao_signals applies the same rules to a whole
+DataFrame at once, for backfills and for checking parity with the table
+(python -m benchmarks.signal_parity).
+
+The signals table is computed from Binance BTCUSDT bars, and the engine is fed Deribit candles:
+the rules are the same, the prices are not, so a bar with an AO close to zero can cross on one
+venue and not on the other. Parity is checked on the table's own bars.
+
+Usage:
+    engine = SignalEngine()
+    stream = CandleStream("BTC-PERPETUAL", engine)
+    await stream.start(client)
+    bar = await stream.next_bar()  # The signal row of the last closed candle
+    await execute_trade_logic(client, signal_frame(bar))
+"""
+import asyncio
+import datetime
+import logging
+import time
+from array import array
+
+from deribit_utils.records import Candle
+
+AO_FAST_PERIOD = 5
+AO_SLOW_PERIOD = 34
+CANDLE_RESOLUTION = "60"  # Minutes, the hourly bars of the signals table
+CANDLE_WARM_UP_BARS = 3 * AO_SLOW_PERIOD  # Closed bars fetched on start to fill the moving averages
+CANDLE_CLOSE_GRACE_SECONDS = 2  # Delay after the end of a bar before closing it when no newer candle arrived
+
+SIGNAL_COLUMNS = ["open_time", "open", "high", "low", "close", "AO", "Long_Entry", "Short_Entry"]
+
+
+class RollingMean:
+    """
+    Mean of the last window values, updated in O(1) per value.
+
+    The running sum is compensated (Neumaier), so adding and removing values over years of
+    bars does not drift away from the mean of the window computed from scratch.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._values = array("d", bytes(8 * window))
+        self._index = 0
+        self._count = 0
+        self._sum = 0.0
+        self._compensation = 0.0
+
+    def _add(self, value):
+        total = self._sum + value
+        if abs(self._sum) >= abs(value):
+            self._compensation += (self._sum - total) + value
+        else:
+            self._compensation += (value - total) + self._sum
+        self._sum = total
+
+    def update(self, value):
+        """
+        Add value and return the mean of the window, or None until window values were added.
+        """
+        if self._count == self.window:
+            self._add(-self._values[self._index])
+        else:
+            self._count += 1
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self.window
+        self._add(value)
+        if self._count < self.window:
+            return None
+        return (self._sum + self._compensation) / self.window
+
+
+class SignalEngine:
+    """
+    Incremental AO and entry signals of a series of closed bars.
+    """
+
+    def __init__(self, fast_period=AO_FAST_PERIOD, slow_period=AO_SLOW_PERIOD):
+        self.fast = RollingMean(fast_period)
+        self.slow = RollingMean(slow_period)
+        self.ao = None
+        self.last_open_time = None
+        self.last_bar = None
+        self.bars = 0
+
+    @property
+    def ready(self):
+        """
+        True once enough bars were seen for the signals to match the table.
+        """
+        return self.ao is not None
+
+    def update(self, open_time, open, high, low, close):
+        """
+        Add a closed bar and return its signal row: a dict with the columns of SIGNAL_COLUMNS.
+        AO is None and both signals are False until the slow moving average is filled.
+        """
+        median = (high + low) / 2
+        fast, slow = self.fast.update(median), self.slow.update(median)
+        ao = fast - slow if fast is not None and slow is not None else None
+        previous = self.ao
+        crossed = ao is not None and previous is not None
+        bar = {
+            "open_time": open_time, "open": open, "high": high, "low": low, "close": close, "AO": ao,
+            "Long_Entry": crossed and previous <= 0 < ao,
+            "Short_Entry": crossed and previous >= 0 > ao,
+        }
+        self.ao = ao
+        self.last_open_time = open_time
+        self.last_bar = bar
+        self.bars += 1
+        return bar
+
+    def run(self, df):
+        """
+        Feed the bars of df (open_time, open, high, low, close columns) one by one and return
+        the signal rows as a DataFrame.
+        """
+        import pandas as pd
+
+        rows = [
+            self.update(*bar)
+            for bar in zip(df["open_time"], df["open"], df["high"], df["low"], df["close"])
+        ]
+        return pd.DataFrame(rows, columns=SIGNAL_COLUMNS)
+
+
+def ao_signals(df, fast_period=AO_FAST_PERIOD, slow_period=AO_SLOW_PERIOD):
+    """
+    Vectorized SignalEngine: the AO, Long_Entry and Short_Entry columns of the bars of df.
+    """
+    median = (df["high"] + df["low"]) / 2
+    ao = median.rolling(fast_period).mean() - median.rolling(slow_period).mean()
+    previous = ao.shift(1)
+    result = df[["open_time", "open", "high", "low", "close"]].copy()
+    result["AO"] = ao
+    result["Long_Entry"] = ((previous <= 0) & (ao > 0)).to_numpy()
+    result["Short_Entry"] = ((previous >= 0) & (ao < 0)).to_numpy()
+    return result
+
+
+def signal_frame(bar):
+    """
+    One-row DataFrame of a signal row, the shape execute_trade_logic reads.
+    """
+    import pandas as pd
+    return pd.DataFrame([bar], columns=SIGNAL_COLUMNS)
+
+
+def _resolution_seconds(resolution):
+    if not str(resolution).isdigit():
+        raise ValueError(f"Unsupported candle resolution {resolution!r}, expected a number of minutes")
+    return int(resolution) * 60
+
+
+class CandleStream:
+    """
+    Closed candles of an instrument, from the `chart.trades` channel, fed to a SignalEngine.
+
+    Deribit sends the candle in progress on every trade. A candle is closed when a newer one
+    arrives, or CANDLE_CLOSE_GRACE_SECONDS after its end if no trade started the next one. On
+    start, the last closed candles are fetched with public/get_tradingview_chart_data to fill
+    the moving averages, so the first live bar already has a signal. Restarting a stream with
+    the same engine after a reconnection only feeds the candles the engine has not seen.
+    """
+
+    def __init__(self, instrument_name, engine=None, resolution=CANDLE_RESOLUTION, on_bar=None):
+        """
+        Args:
+        - instrument_name: Instrument whose trades make the candles, e.g. "BTC-PERPETUAL".
+        - engine: SignalEngine fed with the closed candles, a new one by default.
+        - resolution: Candle length in minutes, as a string.
+        - on_bar: Optional callable invoked with each live signal row. It must not block.
+        """
+        self.instrument_name = instrument_name
+        self.engine = engine or SignalEngine()
+        self.resolution = resolution
+        self.bar_seconds = _resolution_seconds(resolution)
+        self.channel = f"chart.trades.{instrument_name}.{resolution}"
+        self.on_bar = on_bar
+        self.client = None
+        self.bars = asyncio.Queue()
+        self._current = None
+        self._warming_up = False
+        self._pending = []
+        self._close_timer = None
+
+    async def start(self, client, warm_up_bars=CANDLE_WARM_UP_BARS):
+        """
+        Subscribe to the candles of the instrument and feed the engine the last warm_up_bars closed ones.
+        """
+        self.client = client
+        self._warming_up = True
+        # Subscribed first, so no candle closes between the history and the first notification
+        await client.subscribe([self.channel], self.on_message)
+        try:
+            await self._warm_up(warm_up_bars)
+        finally:
+            self._warming_up = False
+            pending, self._pending = self._pending, []
+            for data in pending:
+                self.on_message(self.channel, data)
+
+    async def _warm_up(self, warm_up_bars):
+        bar_ms = self.bar_seconds * 1000
+        current_tick = int(time.time() * 1000) // bar_ms * bar_ms
+        response = await self.client.request("public/get_tradingview_chart_data", {
+            "instrument_name": self.instrument_name,
+            "resolution": self.resolution,
+            "start_timestamp": current_tick - warm_up_bars * bar_ms,
+            "end_timestamp": current_tick,
+        })
+        result = response.get("result") or {}
+        if "error" in response or result.get("status") == "no_data":
+            logging.warning(f"No candle history for {self.instrument_name}: {response.get('error', result)}")
+            return
+        columns = zip(result["ticks"], result["open"], result["high"], result["low"], result["close"])
+        fed = 0
+        for tick, open, high, low, close in columns:
+            if tick < current_tick and self._feed(tick, open, high, low, close) is not None:
+                fed += 1
+        logging.info(f"{self.instrument_name} signal engine warmed up with {fed} candles, ready: {self.engine.ready}")
+
+    async def stop(self):
+        if self._close_timer is not None:
+            self._close_timer.cancel()
+            self._close_timer = None
+        if self.client is None:
+            return
+        if not self.client.closed:
+            await self.client.unsubscribe([self.channel], self.on_message)
+        self.client = None
+
+    async def next_bar(self):
+        """
+        Wait for the next candle to close and return its signal row.
+        """
+        return await self.bars.get()
+
+    def on_message(self, channel, data):
+        """
+        Track the candle in progress and close it when the next one starts.
+        """
+        if self._warming_up:
+            self._pending.append(data)
+            return
+        candle = Candle.from_dict(data)
+        if self._current is not None:
+            if candle.tick == self._current.tick:
+                self._current = candle
+                return
+            if candle.tick < self._current.tick:
+                return
+            self._close(self._current)
+        if self._is_seen(candle.tick):
+            return  # A late update of a candle already closed by the timer
+        self._current = candle
+        self._schedule_close(candle.tick)
+
+    def _schedule_close(self, tick):
+        if self._close_timer is not None:
+            self._close_timer.cancel()
+        delay = (tick / 1000 + self.bar_seconds + CANDLE_CLOSE_GRACE_SECONDS) - time.time()
+        self._close_timer = asyncio.get_running_loop().call_later(max(delay, 0), self._close_on_timer, tick)
+
+    def _close_on_timer(self, tick):
+        self._close_timer = None
+        if self._current is not None and self._current.tick == tick:
+            self._close(self._current)
+
+    def _close(self, candle):
+        self._current = None
+        bar = self._feed(candle.tick, candle.open, candle.high, candle.low, candle.close)
+        if bar is None:
+            return
+        self.bars.put_nowait(bar)
+        if self.on_bar is not None:
+            self.on_bar(bar)
+
+    def _is_seen(self, tick):
+        last = self.engine.last_open_time
+        return last is not None and _open_time(tick) <= last
+
+    def _feed(self, tick, open, high, low, close):
+        if self._is_seen(tick):
+            return None
+        return self.engine.update(_open_time(tick), open, high, low, close)
+
+
+def _open_time(tick):
+    return datetime.datetime.fromtimestamp(tick / 1000, datetime.timezone.utc)
@@ -0,0 +1,1025 @@
+"""
+Local, in-process stand-in for the Deribit JSON-RPC WebSocket API.
+
+SimulatedExchange runs a price-time priority matching engine for one instrument, driven by a
+replayable price feed of (timestamp_seconds, price) ticks. A synthetic market maker quotes
+around each tick and each price move prints a trade that can fill resting client orders.
+SimulatedExchange.connect() returns an object with async send()/recv(), so the unchanged
+DeribitClient and deribit_utils helpers run against it.
+
+Simulations run on VirtualClockEventLoop: whenever every task is waiting, the loop jumps
+straight to the next timer instead of sleeping, so asyncio.sleep(), asyncio.wait_for()
+timeouts and loop.time() based time limits all follow the replayed feed time, and months of
+ticks replay in seconds.
+
+Usage:
+    exchange = SimulatedExchange(ticks)
+    stats = run_simulation(replay_signals(exchange, signals_df))
+"""
+import asyncio
+import bisect
+import collections
+import itertools
+import math
+import selectors
+import time
+
+from deribit_utils import codec
+
+SIM_ACCESS_TOKEN_TTL_SECONDS = 900
+MARKET_DATA_CHANNEL_PREFIXES = ("ticker.", "book.", "quote.", "trades.")
+
+
+class _VirtualClockSelector(selectors.BaseSelector):
+    # Never blocks while timers are pending: advances the virtual clock by the requested timeout instead
+    def __init__(self, loop_clock):
+        self._selector = selectors.DefaultSelector()
+        self._clock = loop_clock
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        if timeout is not None and timeout > 0:
+            # Always move forward: at epoch-sized times a tiny timeout can be below float resolution
+            self._clock[0] = max(self._clock[0] + timeout, math.nextafter(self._clock[0], math.inf))
+            timeout = 0
+        return self._selector.select(timeout)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose time() is virtual and jumps to the next scheduled timer when idle.
+    """
+
+    def __init__(self, start_time=0.0):
+        self._virtual_time = [start_time]
+        super().__init__(_VirtualClockSelector(self._virtual_time))
+        # Timers are due when within the clock resolution, which must stay above float precision at epoch times
+        self._clock_resolution = 1e-6
+
+    def time(self):
+        return self._virtual_time[0]
+
+
+def run_simulation(coro, start_time=None):
+    """
+    Run a coroutine to completion on a VirtualClockEventLoop.
+
+    Args:
+    - coro: The coroutine to run, typically replay_signals(...).
+    - start_time: Initial virtual time in seconds. Defaults to the current wall clock time.
+
+    Returns:
+    - The coroutine result.
+    """
+    loop = VirtualClockEventLoop(time.time() if start_time is None else start_time)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class _BookSide:
+    """
+    Price levels of one side of the book. Prices are kept sorted so the best price is last,
+    and each level is a FIFO queue of orders, giving price-time priority.
+    """
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        self._keys = []  # Sorted ascending; the best price is the last key
+        self.levels = {}
+
+    def _key(self, price):
+        return price if self.is_bid else -price
+
+    def best_price(self):
+        if not self._keys:
+            return None
+        key = self._keys[-1]
+        return key if self.is_bid else -key
+
+    def add(self, order):
+        price = order["price"]
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = collections.deque()
+            bisect.insort(self._keys, self._key(price))
+        level.append(order)
+
+    def remove(self, order):
+        level = self.levels.get(order["price"])
+        if level is None:
+            return False
+        for index, resting in enumerate(level):
+            if resting is order:
+                del level[index]
+                if not level:
+                    self._drop_level(order["price"])
+                return True
+        return False
+
+    def _drop_level(self, price):
+        del self.levels[price]
+        key = self._key(price)
+        index = bisect.bisect_left(self._keys, key)
+        del self._keys[index]
+
+    def crosses(self, limit_price):
+        # True if an incoming order with this limit price on the opposite side can trade
+        best = self.best_price()
+        if best is None:
+            return False
+        return best >= limit_price if self.is_bid else best <= limit_price
+
+    def depth(self, limit):
+        levels = []
+        for key in reversed(self._keys[-limit:] if limit else self._keys):
+            price = key if self.is_bid else -key
+            levels.append([price, sum(o["amount"] - o["filled_amount"] for o in self.levels[price])])
+        return levels
+
+
+class SimulatedExchange:
+    """
+    Price-time priority matching engine and account state for a single instrument.
+
+    Args:
+    - ticks: Sequence of (timestamp_seconds, price) pairs, sorted by time. It is only read, so
+      the same feed can be replayed into several exchanges.
+    - instrument_name: The simulated instrument.
+    - tick_size, contract_size, min_trade_amount: Instrument metadata returned by public/get_instrument.
+    - balance: Initial account balance in the settlement currency (BTC for BTC-PERPETUAL).
+    - half_spread: Distance of the synthetic market maker quotes from the tick price. Defaults to one tick.
+    - quote_depth: Size of each synthetic market maker quote, in USD contracts.
+    - trade_size: Volume of the trade printed by each price move. None means unlimited.
+    - maker_fee, taker_fee: Fee rates charged on the notional of client fills.
+    - latency: One-way network latency in seconds added to every response and notification.
+    """
+
+    def __init__(self, ticks, instrument_name="BTC-PERPETUAL", tick_size=0.5, contract_size=10,
+                 min_trade_amount=10, balance=1.0, half_spread=None, quote_depth=10_000_000,
+                 trade_size=None, maker_fee=0.0, taker_fee=0.0005, latency=0.0):
+        self._timestamps = [tick[0] for tick in ticks]
+        self._prices = [tick[1] for tick in ticks]
+        if not self._timestamps:
+            raise ValueError("The simulated exchange needs at least one price tick")
+        self.instrument_name = instrument_name
+        self.currency = instrument_name.split("-")[0]
+        self.instrument = {
+            "instrument_name": instrument_name,
+            "kind": "future",
+            "settlement_period": "perpetual",
+            "base_currency": self.currency,
+            "quote_currency": "USD",
+            "settlement_currency": self.currency,
+            "tick_size": tick_size,
+            "contract_size": contract_size,
+            "min_trade_amount": min_trade_amount,
+            "is_active": True
+        }
+        self.tick_size = tick_size
+        self.contract_size = contract_size
+        self.half_spread = half_spread if half_spread is not None else tick_size
+        self.quote_depth = quote_depth
+        self.trade_size = trade_size
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        self.latency = latency
+
+        self.index = 0
+        self.last_price = self._prices[0]
+        self.balance = balance
+        self.position_size = 0
+        self.position_price = 0.0
+        self.bids = _BookSide(is_bid=True)
+        self.asks = _BookSide(is_bid=False)
+        self.orders = {}
+        self.untriggered = []
+        self.resting = set()
+        self.request_counts = collections.Counter()
+        self.fills = []
+
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._quotes = []
+        self._quoted_index = None
+        self._sockets = []
+        self._feed_task = None
+        self._wakeup = None
+        self._changes = None
+        self._trigger_scan = None
+        self._book_channels = [f"book.{instrument_name}.{interval}" for interval in ("raw", "100ms")]
+        self._published_book = ({}, {})  # Bid and ask levels as of the last book notification
+        self._book_change_id = 0
+
+    # Feed
+
+    def start(self):
+        """
+        Start replaying the price feed on the running event loop.
+        """
+        if self._feed_task is None:
+            self._feed_task = asyncio.get_running_loop().create_task(self._run_feed())
+
+    async def stop(self):
+        if self._feed_task is not None:
+            self._feed_task.cancel()
+            try:
+                await self._feed_task
+            except asyncio.CancelledError:
+                pass
+            self._feed_task = None
+
+    def connect(self):
+        """
+        Open a new simulated WebSocket connection to the exchange.
+        """
+        socket = SimulatedWebSocket(self)
+        self._sockets.append(socket)
+        return socket
+
+    def drop_connections(self):
+        """
+        Drop every open connection, to exercise reconnections.
+        """
+        for socket in list(self._sockets):
+            socket.drop()
+
+    def time(self):
+        return asyncio.get_running_loop().time()
+
+    async def _run_feed(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._sync_to_now()
+            next_index = self._next_active_index()
+            if next_index is None:
+                return
+            self._wakeup = loop.create_future()
+            handle = loop.call_at(self._timestamps[next_index], _resolve, self._wakeup)
+            await self._wakeup
+            handle.cancel()
+            if loop.time() >= self._timestamps[next_index]:
+                self._apply_tick(next_index)
+
+    def _wake_feed(self):
+        # The set of resting orders or subscriptions changed, so the next tick that matters may have too
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _needs_every_tick(self):
+        # Resting client orders can be filled by any tick, and market data subscribers see every tick
+        return bool(self.resting) or any(socket.wants_market_data() for socket in self._sockets)
+
+    def _next_active_index(self):
+        if self.index + 1 >= len(self._timestamps):
+            return None
+        if self._needs_every_tick():
+            return self.index + 1
+        if not self.untriggered:
+            return len(self._timestamps) - 1
+
+        # Only trigger orders are working: scan ahead for the first tick that fires one of them
+        upper = min((o["trigger_price"] for o in self.untriggered if _triggers_above(o)), default=float("inf"))
+        lower = max((o["trigger_price"] for o in self.untriggered if not _triggers_above(o)), default=float("-inf"))
+        cached = self._trigger_scan
+        if cached and cached[:2] == (upper, lower) and cached[2] <= self.index < cached[3]:
+            return cached[3]
+        prices = self._prices
+        next_index = len(prices) - 1
+        for index in range(self.index + 1, len(prices)):
+            if prices[index] >= upper or prices[index] <= lower:
+                next_index = index
+                break
+        self._trigger_scan = (upper, lower, self.index, next_index)
+        return next_index
+
+    def _sync_to_now(self):
+        # Jump over ticks that cannot affect any order, keeping only the latest price
+        index = bisect.bisect_right(self._timestamps, self.time()) - 1
+        if index > self.index:
+            self.index = index
+            self.last_price = self._prices[index]
+
+    def _apply_tick(self, index):
+        previous_price = self.last_price
+        self.index = index
+        self.last_price = self._prices[index]
+        self._begin_changes()
+        self._requote()
+        if self.last_price < previous_price:
+            self._match("sell", self.last_price, self.trade_size, taker=None)
+        elif self.last_price > previous_price:
+            self._match("buy", self.last_price, self.trade_size, taker=None)
+        self._check_triggers()
+        self._flush_changes()
+        self._publish_market_data()
+
+    # Synthetic market maker
+
+    def _requote(self):
+        if self._quoted_index == self.index:
+            return
+        self._quoted_index = self.index
+        for quote in self._quotes:
+            (self.bids if quote["direction"] == "buy" else self.asks).remove(quote)
+        bid = self._round_to_tick(self.last_price - self.half_spread)
+        ask = self._round_to_tick(self.last_price + self.half_spread)
+        self._quotes = [
+            self._new_order("buy", self.quote_depth, bid, "limit", client=False),
+            self._new_order("sell", self.quote_depth, ask, "limit", client=False)
+        ]
+        for quote in self._quotes:
+            self._submit(quote)
+
+    def _round_to_tick(self, price):
+        return round(price / self.tick_size) * self.tick_size
+
+    # Matching engine
+
+    def _new_order(self, direction, amount, price, order_type, client=True, **fields):
+        now_ms = int(self.time() * 1000)
+        order = {
+            "order_id": f"SIM-{next(self._order_ids)}",
+            "instrument_name": self.instrument_name,
+            "direction": direction,
+            "amount": amount,
+            "filled_amount": 0,
+            "average_price": 0.0,
+            "price": price,
+            "order_type": order_type,
+            "order_state": "open",
+            "post_only": False,
+            "reduce_only": False,
+            "time_in_force": "good_til_cancelled",
+            "label": "",
+            "creation_timestamp": now_ms,
+            "last_update_timestamp": now_ms,
+            "_client": client
+        }
+        order.update(fields)
+        return order
+
+    def _submit(self, order):
+        """
+        Match an incoming limit or market order against the book and rest any remainder.
+        """
+        remaining = order["amount"] - order["filled_amount"]
+        limit = order["price"]
+        if order["order_type"] == "market":
+            limit = float("inf") if order["direction"] == "buy" else float("-inf")
+        self._match(order["direction"], limit, remaining, taker=order)
+        if order["order_state"] != "open":
+            return
+        if order["order_type"] == "market" or order["time_in_force"] in ("immediate_or_cancel", "fill_or_kill"):
+            self._close_order(order, "cancelled" if order["filled_amount"] else "rejected")
+            return
+        (self.bids if order["direction"] == "buy" else self.asks).add(order)
+        if order["_client"]:
+            self.resting.add(order["order_id"])
+
+    def _unrest(self, order):
+        if (self.bids if order["direction"] == "buy" else self.asks).remove(order):
+            self.resting.discard(order["order_id"])
+
+    def _match(self, direction, limit_price, amount, taker):
+        """
+        Fill resting orders on the opposite side in price-time priority up to amount and limit_price.
+        taker is the incoming order, or None for a trade printed by the price feed.
+        """
+        book = self.asks if direction == "buy" else self.bids
+        remaining = float("inf") if amount is None else amount
+        while remaining > 0 and book.crosses(limit_price):
+            price = book.best_price()
+            level = book.levels[price]
+            maker = level[0]
+            if taker is None and not maker["_client"]:
+                break  # Feed trades only interact with client orders
+            quantity = self._reduce_only_limit(maker, min(remaining, maker["amount"] - maker["filled_amount"]))
+            if quantity <= 0:
+                self._close_order(maker, "cancelled")
+            elif taker is not None:
+                quantity = self._reduce_only_limit(taker, quantity)
+                if quantity <= 0:
+                    self._close_order(taker, "cancelled")
+                    return
+            if quantity > 0:
+                self._fill(maker, quantity, price, is_taker=False)
+                if taker is not None:
+                    self._fill(taker, quantity, price, is_taker=True)
+                remaining -= quantity
+            if maker["order_state"] != "open":
+                level.popleft()
+                self.resting.discard(maker["order_id"])
+                if not level:
+                    book._drop_level(price)
+
+    def _reduce_only_limit(self, order, quantity):
+        if not order["reduce_only"] or not order["_client"]:
+            return quantity
+        if order["direction"] == "buy":
+            return min(quantity, max(-self.position_size, 0))
+        return min(quantity, max(self.position_size, 0))
+
+    def _fill(self, order, quantity, price, is_taker):
+        filled = order["filled_amount"]
+        order["average_price"] = (order["average_price"] * filled + price * quantity) / (filled + quantity)
+        order["filled_amount"] = filled + quantity
+        order["last_update_timestamp"] = int(self.time() * 1000)
+        if order["filled_amount"] >= order["amount"]:
+            order["order_state"] = "filled"
+        if not order["_client"]:
+            return
+
+        fee_rate = self.taker_fee if is_taker else self.maker_fee
+        fee = quantity / price * fee_rate
+        self._update_position(quantity if order["direction"] == "buy" else -quantity, price)
+        self.balance -= fee
+        trade = {
+            "trade_id": f"SIM-T{next(self._trade_ids)}",
+            "order_id": order["order_id"],
+            "instrument_name": self.instrument_name,
+            "direction": order["direction"],
+            "amount": quantity,
+            "price": price,
+            "fee": fee,
+            "liquidity": "T" if is_taker else "M",
+            "label": order["label"],
+            "timestamp": order["last_update_timestamp"]
+        }
+        self.fills.append(trade)
+        self._record_change(order, trade)
+
+    def _update_position(self, delta, price):
+        # Inverse perpetual: PnL is settled in the base currency
+        size = self.position_size
+        if size == 0 or (size > 0) == (delta > 0):
+            new_size = size + delta
+            self.position_price = abs(new_size) / (abs(size) / self.position_price + abs(delta) / price) \
+                if size else price
+            self.position_size = new_size
+            return
+        closed = min(abs(delta), abs(size))
+        sign = 1 if size > 0 else -1
+        self.balance += sign * closed * (1 / self.position_price - 1 / price)
+        new_size = size + delta
+        if new_size == 0:
+            self.position_price = 0.0
+        elif (new_size > 0) != (size > 0):
+            self.position_price = price
+        self.position_size = new_size
+
+    def _close_order(self, order, state):
+        order["order_state"] = state
+        order["last_update_timestamp"] = int(self.time() * 1000)
+        if order["_client"]:
+            self._record_change(order)
+
+    def _check_triggers(self):
+        fired = [order for order in self.untriggered if _is_triggered(order, self.last_price)]
+        for order in fired:
+            self.untriggered.remove(order)
+            order["triggered"] = True
+            order["order_state"] = "open"
+            order["order_type"] = "market" if order["order_type"].endswith("_market") else "limit"
+            if self._reduce_only_limit(order, order["amount"]) <= 0:
+                self._close_order(order, "cancelled")
+                continue
+            self._record_change(order)
+            self._submit(order)
+
+    # Notifications
+
+    def _begin_changes(self):
+        if self._changes is None:
+            self._changes = ({}, [])
+
+    def _record_change(self, order, trade=None):
+        if self._changes is None:
+            self._begin_changes()
+        orders, trades = self._changes
+        orders[order["order_id"]] = order
+        if trade is not None:
+            trades.append(trade)
+
+    def _flush_changes(self):
+        if self._changes is None:
+            return
+        orders, trades = self._changes
+        self._changes = None
+        if not orders and not trades:
+            return
+        public_orders = [_public_order(order) for order in orders.values()]
+        for order in public_orders:
+            self._publish(f"user.orders.{self.instrument_name}.raw", order)
+        if trades:
+            self._publish(f"user.trades.{self.instrument_name}.raw", trades)
+        self._publish(f"user.changes.{self.instrument_name}.raw", {
+            "instrument_name": self.instrument_name,
+            "orders": public_orders,
+            "trades": trades,
+            "positions": [self._position()]
+        })
+        self._wake_feed()
+
+    def _publish_market_data(self):
+        for interval in ("raw", "100ms"):
+            channel = f"ticker.{self.instrument_name}.{interval}"
+            if any(channel in socket.channels for socket in self._sockets):
+                self._publish(channel, self._ticker())
+        self._publish_book_changes()
+
+    def _publish_book_changes(self, force=False):
+        # Send the levels that changed since the last notification, chained by change_id
+        if not force and not any(channel in socket.channels for socket in self._sockets for channel in self._book_channels):
+            return
+        self._requote()
+        changes = []
+        for published, side in zip(self._published_book, (self.bids, self.asks)):
+            current = dict((price, amount) for price, amount in side.depth(0))
+            side_changes = [["delete", price, 0] for price in published if price not in current]
+            side_changes += [
+                ["new" if price not in published else "change", price, amount]
+                for price, amount in current.items() if published.get(price) != amount
+            ]
+            published.clear()
+            published.update(current)
+            changes.append(side_changes)
+        if not changes[0] and not changes[1]:
+            return
+        self._book_change_id += 1
+        for channel in self._book_channels:
+            self._publish(channel, {
+                "type": "change",
+                "instrument_name": self.instrument_name,
+                "timestamp": int(self.time() * 1000),
+                "prev_change_id": self._book_change_id - 1,
+                "change_id": self._book_change_id,
+                "bids": changes[0],
+                "asks": changes[1]
+            })
+
+    def _book_snapshot(self):
+        return {
+            "type": "snapshot",
+            "instrument_name": self.instrument_name,
+            "timestamp": int(self.time() * 1000),
+            "change_id": self._book_change_id,
+            "bids": [["new", price, amount] for price, amount in self._published_book[0].items()],
+            "asks": [["new", price, amount] for price, amount in self._published_book[1].items()]
+        }
+
+    def _publish(self, channel, data):
+        for socket in self._sockets:
+            if channel in socket.channels:
+                socket.deliver({"jsonrpc": "2.0", "method": "subscription", "params": {"channel": channel, "data": data}})
+
+    # Account views
+
+    def _position(self):
+        size = self.position_size
+        floating = 0.0
+        if size:
+            floating = size * (1 / self.position_price - 1 / self.last_price)
+        return {
+            "instrument_name": self.instrument_name,
+            "kind": "future",
+            "size": size,
+            "direction": "buy" if size > 0 else "sell" if size < 0 else "zero",
+            "average_price": self.position_price,
+            "mark_price": self.last_price,
+            "floating_profit_loss": floating
+        }
+
+    def _ticker(self):
+        self._requote()
+        return {
+            "instrument_name": self.instrument_name,
+            "timestamp": int(self.time() * 1000),
+            "last_price": self.last_price,
+            "mark_price": self.last_price,
+            "index_price": self.last_price,
+            "best_bid_price": self.bids.best_price() or 0,
+            "best_ask_price": self.asks.best_price() or 0,
+            "best_bid_amount": self.bids.depth(1)[0][1] if self.bids.levels else 0,
+            "best_ask_amount": self.asks.depth(1)[0][1] if self.asks.levels else 0
+        }
+
+    def _account_summary(self):
+        position = self._position()
+        equity = self.balance + position["floating_profit_loss"]
+        initial_margin = abs(self.position_size) / self.last_price * 0.02
+        return {
+            "currency": self.currency,
+            "balance": self.balance,
+            "equity": equity,
+            "initial_margin": initial_margin,
+            "available_funds": equity - initial_margin
+        }
+
+    # JSON-RPC
+
+    def handle(self, socket, message):
+        """
+        Execute one JSON-RPC request and return the response message.
+        """
+        method = message.get("method", "")
+        params = message.get("params") or {}
+        self.request_counts[method] += 1
+        self._sync_to_now()
+        self._requote()
+        self._begin_changes()
+        try:
+            handler = self._methods.get(method)
+            if handler is None and method in ("private/buy", "private/sell"):
+                result = self._place_order(method.split("/")[1], params)
+            elif handler is None:
+                raise SimulatedError(-32601, "Method not found")
+            else:
+                result = handler(self, socket, params)
+            response = {"jsonrpc": "2.0", "id": message.get("id"), "result": result}
+        except SimulatedError as e:
+            response = {"jsonrpc": "2.0", "id": message.get("id"), "error": {"code": e.code, "message": e.message}}
+        self._flush_changes()
+        self._publish_book_changes()
+        self._wake_feed()
+        return response
+
+    def _auth(self, socket, params):
+        if not params.get("client_id") and params.get("grant_type") != "refresh_token":
+            raise SimulatedError(13004, "invalid_credentials")
+        socket.authenticated = True
+        return {
+            "access_token": f"sim-access-{next(self._order_ids)}",
+            "refresh_token": f"sim-refresh-{next(self._order_ids)}",
+            "expires_in": SIM_ACCESS_TOKEN_TTL_SECONDS,
+            "token_type": "bearer",
+            "scope": "connection trade:read_write"
+        }
+
+    def _require_auth(self, socket):
+        if not socket.authenticated:
+            raise SimulatedError(13009, "unauthorized")
+
+    def _check_instrument(self, params):
+        if params.get("instrument_name", self.instrument_name) != self.instrument_name:
+            raise SimulatedError(10020, "invalid_instrument_name")
+
+    def _get_account_summary(self, socket, params):
+        self._require_auth(socket)
+        return self._account_summary()
+
+    def _get_ticker(self, socket, params):
+        self._check_instrument(params)
+        return self._ticker()
+
+    def _get_order_book(self, socket, params):
+        self._check_instrument(params)
+        depth = params.get("depth", 20)
+        result = self._ticker()
+        result.update({"bids": self.bids.depth(depth), "asks": self.asks.depth(depth)})
+        return result
+
+    def _get_instrument(self, socket, params):
+        self._check_instrument(params)
+        return dict(self.instrument)
+
+    def _get_instruments(self, socket, params):
+        if params.get("currency", self.currency) not in (self.currency, "any"):
+            return []
+        return [dict(self.instrument)]
+
+    def _place_order(self, direction, params):
+        self._check_instrument(params)
+        amount = params.get("amount", 0)
+        if amount <= 0 or amount % self.contract_size:
+            raise SimulatedError(-32602, f"amount must be a multiple of contract size {self.contract_size}")
+        order_type = params.get("type", "limit")
+        price = params.get("price")
+        fields = {
+            "post_only": params.get("post_only", False),
+            "reduce_only": params.get("reduce_only", False),
+            "time_in_force": params.get("time_in_force", "good_til_cancelled"),
+            "label": params.get("label", "")
+        }
+        if order_type in ("limit", "stop_limit", "take_limit"):
+            if price is None:
+                raise SimulatedError(-32602, "price is required")
+            price = self._round_to_tick(price)
+        if order_type in ("stop_limit", "take_limit", "stop_market", "take_market"):
+            order = self._new_order(direction, amount, price, order_type, trigger_price=params["trigger_price"],
+                                    trigger=params.get("trigger", "last_price"), triggered=False, **fields)
+            order["order_state"] = "untriggered"
+            self.orders[order["order_id"]] = order
+            self.untriggered.append(order)
+            self._record_change(order)
+            return {"order": _public_order(order), "trades": []}
+        if order_type not in ("limit", "market"):
+            raise SimulatedError(-32602, f"unsupported order type {order_type}")
+
+        order = self._new_order(direction, amount, price, order_type, **fields)
+        if order["post_only"]:
+            self._apply_post_only(order)
+        self.orders[order["order_id"]] = order
+        trades_before = len(self.fills)
+        self._record_change(order)
+        self._submit(order)
+        return {"order": _public_order(order), "trades": self.fills[trades_before:]}
+
+    def _apply_post_only(self, order):
+        # Deribit moves a crossing post-only order just inside the spread instead of taking liquidity
+        if order["direction"] == "buy":
+            best_ask = self.asks.best_price()
+            if best_ask is not None and order["price"] >= best_ask:
+                order["price"] = best_ask - self.tick_size
+        else:
+            best_bid = self.bids.best_price()
+            if best_bid is not None and order["price"] <= best_bid:
+                order["price"] = best_bid + self.tick_size
+
+    def _find_order(self, params):
+        order = self.orders.get(params.get("order_id"))
+        if order is None:
+            raise SimulatedError(11044, "order_not_found")
+        return order
+
+    def _get_order_state_by_label(self, socket, params):
+        self._require_auth(socket)
+        if params.get("currency", self.currency) != self.currency:
+            return []
+        label = params.get("label")
+        return [_public_order(order) for order in self.orders.values() if order["label"] == label]
+
+    def _edit(self, socket, params):
+        self._require_auth(socket)
+        order = self._find_order(params)
+        if order["order_state"] not in ("open", "untriggered"):
+            raise SimulatedError(11044, "not_open_order")
+        if order["order_state"] == "untriggered":
+            order.update({"amount": params.get("amount", order["amount"]), "price": params.get("price", order["price"])})
+            self._record_change(order)
+            return {"order": _public_order(order), "trades": []}
+
+        self._unrest(order)
+        order["amount"] = params.get("amount", order["amount"])
+        order["price"] = self._round_to_tick(params.get("price", order["price"]))
+        order["post_only"] = params.get("post_only", order["post_only"])
+        if order["post_only"]:
+            self._apply_post_only(order)
+        order["last_update_timestamp"] = int(self.time() * 1000)
+        trades_before = len(self.fills)
+        self._record_change(order)
+        if order["filled_amount"] >= order["amount"]:
+            self._close_order(order, "filled")
+        else:
+            self._submit(order)  # Loses time priority, as on the real exchange
+        return {"order": _public_order(order), "trades": self.fills[trades_before:]}
+
+    def _cancel_order(self, order):
+        if order["order_state"] == "untriggered":
+            self.untriggered.remove(order)
+        elif order["order_state"] == "open":
+            self._unrest(order)
+        else:
+            return False
+        self._close_order(order, "cancelled")
+        return True
+
+    def _cancel(self, socket, params):
+        self._require_auth(socket)
+        order = self._find_order(params)
+        if not self._cancel_order(order):
+            raise SimulatedError(11044, "not_open_order")
+        return _public_order(order)
+
+    def _cancel_all(self, socket, params):
+        self._require_auth(socket)
+        if params.get("instrument_name", self.instrument_name) != self.instrument_name:
+            return 0
+        open_orders = [self.orders[order_id] for order_id in self.resting] + self.untriggered
+        return sum(self._cancel_order(order) for order in open_orders)
+
+    def _get_open_orders_by_instrument(self, socket, params):
+        self._require_auth(socket)
+        self._check_instrument(params)
+        order_type = params.get("type", "all")
+        if order_type not in ("all", "limit", "trigger_all"):
+            raise SimulatedError(-32602, f"unsupported order type filter {order_type}")
+        open_orders = [] if order_type == "trigger_all" else [self.orders[order_id] for order_id in self.resting]
+        if order_type != "limit":
+            open_orders += self.untriggered
+        return [_public_order(order) for order in open_orders]
+
+    def _get_positions(self, socket, params):
+        self._require_auth(socket)
+        if params.get("currency", self.currency) not in (self.currency, "any"):
+            return []
+        return [self._position()]
+
+    def _get_position(self, socket, params):
+        self._require_auth(socket)
+        self._check_instrument(params)
+        return self._position()
+
+    def _get_order_state(self, socket, params):
+        self._require_auth(socket)
+        return _public_order(self._find_order(params))
+
+    def _subscribe(self, socket, params):
+        channels = params.get("channels", [])
+        if any(channel.startswith("user.") for channel in channels):
+            self._require_auth(socket)
+        new_book_channels = [c for c in channels if c in self._book_channels and c not in socket.channels]
+        if new_book_channels:
+            self._publish_book_changes(force=True)  # Bring the published book up to date before the snapshot
+        socket.channels.update(channels)
+        for channel in new_book_channels:
+            socket.deliver({"jsonrpc": "2.0", "method": "subscription",
+                            "params": {"channel": channel, "data": self._book_snapshot()}})
+        self._wake_feed()  # A market data subscriber sees every tick from now on
+        return channels
+
+    def _unsubscribe(self, socket, params):
+        channels = params.get("channels", [])
+        socket.channels.difference_update(channels)
+        return channels
+
+    def _test(self, socket, params):
+        return {"version": "simulated"}
+
+    _methods = {
+        "public/auth": _auth,
+        "private/get_account_summary": _get_account_summary,
+        "public/ticker": _get_ticker,
+        "public/get_order_book": _get_order_book,
+        "public/get_instrument": _get_instrument,
+        "public/get_instruments": _get_instruments,
+        "private/edit": _edit,
+        "private/cancel": _cancel,
+        "private/cancel_all": _cancel_all,
+        "private/cancel_all_by_instrument": _cancel_all,
+        "private/get_open_orders_by_instrument": _get_open_orders_by_instrument,
+        "private/get_positions": _get_positions,
+        "private/get_position": _get_position,
+        "private/get_order_state": _get_order_state,
+        "private/get_order_state_by_label": _get_order_state_by_label,
+        "public/subscribe": _subscribe,
+        "private/subscribe": _subscribe,
+        "public/unsubscribe": _unsubscribe,
+        "private/unsubscribe": _unsubscribe,
+        "public/test": _test
+    }
+
+
+class SimulatedError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class SimulatedWebSocket:
+    """
+    One client connection to a SimulatedExchange, exposing the send()/recv() pair used by DeribitClient.
+    """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.channels = set()
+        self.authenticated = False
+        self.closed = False
+        self._inbox = asyncio.Queue()
+
+    def wants_market_data(self):
+        return any(channel.startswith(MARKET_DATA_CHANNEL_PREFIXES) for channel in self.channels)
+
+    async def send(self, message):
+        if self.closed:
+            raise ConnectionError("Simulated connection is closed")
+        self.deliver(self.exchange.handle(self, codec.loads(message)))
+
+    def deliver(self, message):
+        raw = codec.dumps(message)
+        if self.exchange.latency:
+            asyncio.get_running_loop().call_later(self.exchange.latency, self._inbox.put_nowait, raw)
+        else:
+            self._inbox.put_nowait(raw)
+
+    async def recv(self):
+        if self.closed:
+            raise ConnectionError("Simulated connection is closed")
+        message = await self._inbox.get()
+        if message is None:
+            raise ConnectionError("Simulated connection dropped")
+        return message
+
+    def drop(self):
+        """
+        Cut the connection as a network failure would: the pending recv() fails.
+        """
+        self.closed = True
+        self.channels.clear()
+        if self in self.exchange._sockets:
+            self.exchange._sockets.remove(self)
+        self._inbox.put_nowait(None)
+
+    async def close(self):
+        self.closed = True
+        self.channels.clear()
+        if self in self.exchange._sockets:
+            self.exchange._sockets.remove(self)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _triggers_above(order):
+    # Stops to buy and take-profits to sell fire when the price rises to the trigger
+    is_stop = order["order_type"].startswith("stop")
+    return is_stop == (order["direction"] == "buy")
+
+
+def _is_triggered(order, last_price):
+    if _triggers_above(order):
+        return last_price >= order["trigger_price"]
+    return last_price <= order["trigger_price"]
+
+
+def _public_order(order):
+    return {key: value for key, value in order.items() if not key.startswith("_")}
+
+
+async def replay_signals(exchange, signals, streaming=True):
+    """
+    Replay a DataFrame of signals through execute_trade_logic against a simulated exchange.
+
+    Args:
+    - exchange: The SimulatedExchange, whose feed must cover the signal times.
+    - signals: DataFrame with open_time, Long_Entry and Short_Entry columns, one row per signal bar.
+      open_time may be epoch seconds or datetime-like values.
+    - streaming: Chase orders with the streaming (True) or the polling (False) order monitor.
+
+    Returns:
+    - Dict with the wall clock duration, simulated duration, number of signals, request counts per
+      method, number of reprices, number of fills, the client rate limiter metrics and the final
+      account state.
+    """
+    from deribit_utils import deribit_utils
+    from deribit_utils.client import DeribitClient
+
+    loop = asyncio.get_running_loop()
+    wall_start = time.perf_counter()
+    sim_start = loop.time()
+    exchange.start()
+    streaming_default = deribit_utils.STREAMING_ORDER_CHASE
+    deribit_utils.STREAMING_ORDER_CHASE = streaming
+    socket = exchange.connect()
+    try:
+        async with DeribitClient(socket) as client:
+            await deribit_utils.authenticate("simulator", "simulator", connection_type="websocket", client=client)
+            for row in range(len(signals)):
+                signal_time = _to_seconds(signals["open_time"].iloc[row])
+                if signal_time > loop.time():
+                    await asyncio.sleep(signal_time - loop.time())
+                await deribit_utils.execute_trade_logic(client, signals.iloc[[row]])
+            rate_limits = client.rate_limiter.metrics()
+    finally:
+        deribit_utils.STREAMING_ORDER_CHASE = streaming_default
+        await socket.close()
+        await exchange.stop()
+
+    return {
+        "wall_seconds": time.perf_counter() - wall_start,
+        "simulated_seconds": loop.time() - sim_start,
+        "signals": len(signals),
+        "requests": dict(exchange.request_counts),
+        "reprices": exchange.request_counts["private/edit"] + exchange.request_counts["private/cancel"],
+        "fills": len(exchange.fills),
+        "rate_limits": rate_limits,
+        "account": exchange._account_summary(),
+        "position": exchange._position()
+    }
+
+
+def _to_seconds(value):
+    if hasattr(value, "timestamp"):
+        return value.timestamp()
+    return float(value)
@@ -0,0 +1,185 @@
+import asyncio
+import collections
+import logging
+
+from deribit_utils.records import Order, Position
+
+FINAL_ORDER_STATES = ("filled", "cancelled", "rejected")
+STATE_WAIT_TIMEOUT_SECONDS = 30  # Market orders fill at once; a longer wait means something is wrong
+FINISHED_ORDERS_KEPT = 200  # Orders in a final state kept for late waiters, the oldest are evicted
+
+
+class StateTracker:
+    """
+    Order and position state of one instrument, kept up to date by the user.orders and
+    user.changes subscriptions of a connection instead of by polling.
+
+    Callers await conditions on the state, e.g. wait_until_filled(order_id) or wait_until_flat(),
+    and are woken by the notification that satisfies them, or time out.
+
+    Open orders are kept until they reach a final state, then only the last FINISHED_ORDERS_KEPT
+    finished orders: a tracker lives as long as its connection.
+
+    Usage:
+        tracker = await get_state_tracker(client, "BTC-PERPETUAL")
+        order = await tracker.wait_until_filled(order_id, timeout=30)
+    """
+
+    def __init__(self, instrument_name):
+        self.instrument_name = instrument_name
+        self.channels = [f"user.orders.{instrument_name}.raw", f"user.changes.{instrument_name}.raw"]
+        self.orders = {}
+        self._finished = collections.deque()
+        self.position = None
+        self.client = None
+        self._waiters = []
+
+    async def start(self, client):
+        """
+        Subscribe to the order and position updates of the instrument, then load the current position.
+        Updates arriving from then on are newer than the loaded position.
+        """
+        self.client = client
+        await client.subscribe(self.channels, self.on_message)
+        response = await client.request("private/get_position", {"instrument_name": self.instrument_name})
+        if "result" in response and self.position is None:
+            self.position = Position.from_dict(response["result"])
+        elif "result" not in response:
+            logging.warning(f"Could not load the {self.instrument_name} position: {response}")
+        self._notify()
+
+    async def resync(self):
+        """
+        Reload the position and the open orders, whose updates may have been missed while the
+        connection was down. Called once the channels are subscribed again.
+        """
+        open_orders = [order.order_id for order in self.orders.values() if order.order_state not in FINAL_ORDER_STATES]
+        responses = await asyncio.gather(
+            self.client.request("private/get_position", {"instrument_name": self.instrument_name}),
+            *(self.client.request("private/get_order_state", {"order_id": order_id}) for order_id in open_orders)
+        )
+        if "result" in responses[0]:
+            self.position = Position.from_dict(responses[0]["result"])
+        for response in responses[1:]:
+            if "result" in response:
+                self.track(response["result"])
+        self._notify()
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.unsubscribe(self.channels, self.on_message)
+            self.client = None
+        for future, _ in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters.clear()
+
+    @property
+    def position_size(self):
+        """
+        Signed position size in USD contracts: positive when long, negative when short.
+        """
+        return self.position.get("size", 0) if self.position is not None else 0
+
+    def on_message(self, channel, data):
+        """
+        Apply a user.orders or user.changes notification and wake the waiters it satisfies.
+        """
+        if channel.startswith("user.orders."):
+            for order in data if isinstance(data, list) else [data]:
+                self.track(order)
+        else:
+            for order in data.get("orders", ()):
+                self.track(order)
+            for position in data.get("positions", ()):
+                if position.get("instrument_name") == self.instrument_name:
+                    self.position = Position.from_dict(position)
+        self._notify()
+
+    def track(self, order):
+        """
+        Record an order state, e.g. from an order placement response.
+        A state older than the one already known is ignored: responses and notifications can cross.
+        """
+        if not isinstance(order, Order):
+            order = Order.from_dict(order)
+        known = self.orders.get(order.order_id)
+        if known is None or _order_progress(order) >= _order_progress(known):
+            self.orders[order.order_id] = order
+            finished = order.order_state in FINAL_ORDER_STATES
+            if finished and (known is None or known.order_state not in FINAL_ORDER_STATES):
+                self._finish(order.order_id)
+            self._notify()
+
+    def _finish(self, order_id):
+        self._finished.append(order_id)
+        while len(self._finished) > FINISHED_ORDERS_KEPT:
+            evicted = self.orders.get(self._finished.popleft())
+            if evicted is not None and evicted.order_state in FINAL_ORDER_STATES:
+                del self.orders[evicted.order_id]
+
+    async def wait_for(self, condition, timeout=STATE_WAIT_TIMEOUT_SECONDS):
+        """
+        Wait until condition() returns a truthy value and return it.
+        Raises asyncio.TimeoutError if that does not happen within timeout seconds.
+        """
+        value = condition()
+        if value:
+            return value
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, condition)
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    async def wait_until_filled(self, order_id, timeout=STATE_WAIT_TIMEOUT_SECONDS):
+        """
+        Wait until the order reaches a final state and return it. The order_state of the result
+        tells whether it was filled, or cancelled or rejected.
+        """
+        def final_order():
+            order = self.orders.get(order_id)
+            return order if order and order.order_state in FINAL_ORDER_STATES else None
+
+        return await self.wait_for(final_order, timeout)
+
+    async def wait_until_flat(self, timeout=STATE_WAIT_TIMEOUT_SECONDS):
+        """
+        Wait until the position of the instrument is closed.
+        """
+        await self.wait_for(lambda: self.position is not None and self.position_size == 0, timeout)
+
+    def _notify(self):
+        for future, condition in list(self._waiters):
+            if future.done():
+                continue
+            value = condition()
+            if value:
+                future.set_result(value)
+
+
+def _order_progress(order):
+    return (
+        order.get("last_update_timestamp", 0),
+        order.get("filled_amount", 0),
+        order.get("order_state") in FINAL_ORDER_STATES
+    )
+
+
+async def get_state_tracker(client, instrument_name):
+    """
+    Return the StateTracker of instrument_name on this connection, starting it on first use.
+    It stays subscribed for the lifetime of the connection.
+    """
+    tracker = client.state_trackers.get(instrument_name)
+    if tracker is None:
+        tracker = client.state_trackers[instrument_name] = StateTracker(instrument_name)
+        try:
+            await tracker.start(client)
+        except Exception:
+            del client.state_trackers[instrument_name]
+            raise
+    return tracker
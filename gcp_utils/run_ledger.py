@@ -0,0 +1,285 @@
+"""
+Ledger of trading runs, so that a signal bar, or a Pub/Sub trigger, is acted on once.
+
+Pub/Sub delivers triggers at least once, and a run lasts longer than the ack deadline of the
+subscription, so the same trigger can start a second, overlapping run. Before trading, a run
+claims its key: the message id of its trigger, then the run key of its signal bar
+(deribit_utils.signal_run_key). A claim is a small record created only if it does not exist yet.
+A duplicate finds the record and exits, in well under a millisecond with the local store.
+
+A claim holds a lease of RUN_LEASE_SECONDS. A run that crashed without completing or releasing
+its claim is taken over once the lease has expired, and the claim reports it as "recovered". A
+run that failed releases its claim, so the next trigger runs the bar again.
+The orders of a run carry labels derived from its run key, so a recovered run can see on the
+exchange whether its orders were already sent.
+
+The records are kept in a local directory by default, a stand-in for a shared store that only
+deduplicates the runs of one machine (a warm Cloud Function instance, the service). Set
+RUN_LEDGER to a gs://bucket/prefix location to share them across instances. The claims then
+rely on GCS generation preconditions, which need google-cloud-storage.
+
+Configuration, read once at import:
+    RUN_LEDGER=gs://bucket/runs  where the claims are kept, a local directory or a GCS prefix
+
+Usage:
+    from gcp_utils.run_ledger import ledger
+
+    claim = ledger.claim(run_key)
+    if not claim:
+        return f"Run {run_key} already {claim.state}"
+    with ledger.running(claim):  # Completed on success, released on an exception
+        ...
+"""
+import contextlib
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+
+from gcp_utils.versioning import VersionConflict
+
+RUN_LEDGER = os.environ.get("RUN_LEDGER", "/tmp/deribit_trading/runs")
+# A run holding a claim longer than this is considered dead: well above the two 200s chases,
+# the market order fallbacks and the bracket of a position reversal
+RUN_LEASE_SECONDS = 900
+
+# Claim states: acquired ("claimed", "recovered" from a dead run) or not ("running" elsewhere, "done")
+CLAIMED = "claimed"
+RECOVERED = "recovered"
+RUNNING = "running"
+DONE = "done"
+RELEASED = "released"
+
+
+def _file_name(key):
+    return re.sub(r"[^A-Za-z0-9._-]", "_", key) + ".json"
+
+
+class LocalRunStore:
+    """
+    Run records as JSON files of a local directory, changed under an exclusive file lock.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        import fcntl
+
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self, key):
+        try:
+            with open(os.path.join(self.directory, _file_name(key))) as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        return record, record.get("version", 0)
+
+    def read(self, key):
+        """
+        Return the (record, version) of key, (None, None) if it has no record.
+        """
+        return self._read(key)
+
+    def write(self, key, record, version=None):
+        """
+        Write the record of key if its version is still version, or if it has no record when
+        version is None. Raises VersionConflict otherwise. Returns the new version.
+        """
+        path = os.path.join(self.directory, _file_name(key))
+        with self._locked():
+            _, current = self._read(key)
+            if current != version:
+                raise VersionConflict(key)
+            record = dict(record, version=(version or 0) + 1)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        return record["version"]
+
+
+class GcsRunStore:
+    """
+    Run records as objects of a GCS bucket, written with generation preconditions.
+    """
+
+    def __init__(self, bucket, prefix=""):
+        self.bucket_name = bucket
+        self.prefix = prefix.strip("/")
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        # Created on first use: importing and building the client is slow and needs credentials
+        if self._bucket is None:
+            from google.cloud import storage
+            self._bucket = storage.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def _blob(self, key):
+        return self.bucket.blob(f"{self.prefix}/{_file_name(key)}" if self.prefix else _file_name(key))
+
+    def read(self, key):
+        from google.api_core.exceptions import NotFound
+
+        blob = self._blob(key)
+        try:
+            data = blob.download_as_bytes()
+        except NotFound:
+            return None, None
+        return json.loads(data), blob.generation
+
+    def write(self, key, record, version=None):
+        from google.api_core.exceptions import PreconditionFailed
+
+        blob = self._blob(key)
+        try:
+            # Generation 0 means the object must not exist yet
+            blob.upload_from_string(json.dumps(record), content_type="application/json",
+                                    if_generation_match=version or 0)
+        except PreconditionFailed as e:
+            raise VersionConflict(key) from e
+        return blob.generation
+
+
+def open_store(location):
+    """
+    Return the store of a RUN_LEDGER location: gs://bucket/prefix or a local directory.
+    """
+    if location.startswith("gs://"):
+        bucket, _, prefix = location[len("gs://"):].partition("/")
+        return GcsRunStore(bucket, prefix)
+    return LocalRunStore(location)
+
+
+class RunClaim:
+    """
+    Outcome of RunLedger.claim. True if the run may go ahead.
+    """
+
+    __slots__ = ("key", "state", "owner", "version", "record")
+
+    def __init__(self, key, state, owner, version=None, record=None):
+        self.key = key
+        self.state = state
+        self.owner = owner
+        self.version = version
+        self.record = record
+
+    def __bool__(self):
+        return self.state in (CLAIMED, RECOVERED)
+
+    @property
+    def recovered(self):
+        return self.state == RECOVERED
+
+    def __repr__(self):
+        return f"RunClaim(key={self.key!r}, state={self.state!r})"
+
+
+class RunLedger:
+    """
+    Claims, completions and releases of run keys, see the module docstring.
+    """
+
+    def __init__(self, store, lease_seconds=RUN_LEASE_SECONDS):
+        """
+        Args:
+        - store: LocalRunStore, GcsRunStore, or any object with the same read and write methods.
+          Opened from RUN_LEDGER on first use if None.
+        - lease_seconds: Time after which the claim of a run that neither completed nor released
+          it may be taken over.
+        """
+        self._store = store
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = open_store(RUN_LEDGER)
+        return self._store
+
+    def claim(self, key, **details):
+        """
+        Claim key for this process. details are kept in the record, e.g. the trigger of the run.
+        Returns a RunClaim, false if the key is done or held by a live run.
+        """
+        start = time.perf_counter()
+        record, version = self.store.read(key)
+        now = time.time()
+        if record is not None:
+            if record["state"] == DONE:
+                return RunClaim(key, DONE, record.get("owner"), version, record)
+            if record["state"] == RUNNING and record["lease_until"] > now:
+                return RunClaim(key, RUNNING, record.get("owner"), version, record)
+        # A dead run left its claim running, a failed one released it
+        state = RECOVERED if record is not None and record["state"] == RUNNING else CLAIMED
+        claimed = {
+            "key": key,
+            "state": RUNNING,
+            "owner": self.owner,
+            "claimed_at": now,
+            "lease_until": now + self.lease_seconds,
+            "attempts": (record or {}).get("attempts", 0) + 1,
+            "details": details,
+        }
+        try:
+            new_version = self.store.write(key, claimed, version)
+        except VersionConflict:
+            # Another process claimed or completed it between the read and the write
+            record, version = self.store.read(key)
+            return RunClaim(key, (record or {}).get("state", RUNNING), (record or {}).get("owner"), version, record)
+        if state == RECOVERED:
+            logging.warning(f"Run {key} taken over from {record.get('owner')}, whose lease expired")
+        logging.debug(f"Run {key} claimed in {(time.perf_counter() - start) * 1000:.2f}ms")
+        return RunClaim(key, state, self.owner, new_version, claimed)
+
+    def _finish(self, claim, state, result):
+        if not claim:
+            return
+        record = dict(claim.record, state=state, finished_at=time.time(), result=result)
+        try:
+            claim.version = self.store.write(claim.key, record, claim.version)
+            claim.record = record
+        except VersionConflict:
+            logging.warning(f"Run {claim.key} was taken over before it finished, its record is left as is")
+
+    def complete(self, claim, **result):
+        """
+        Mark the run of claim as done, so later claims of its key are refused.
+        """
+        self._finish(claim, DONE, result)
+
+    def release(self, claim, **result):
+        """
+        Give the key of claim up without completing it, so the next trigger can run it again.
+        """
+        self._finish(claim, RELEASED, result)
+
+    @contextlib.contextmanager
+    def running(self, claim):
+        """
+        Complete claim when the block succeeds, release it if the block raises.
+        """
+        try:
+            yield claim
+        except BaseException as e:
+            self.release(claim, error=repr(e))
+            raise
+        self.complete(claim)
+
+
+ledger = RunLedger(None)
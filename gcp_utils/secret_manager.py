@@ -1,10 +1,20 @@
 # gcp_utils/secret_manager.py
-from google.cloud import secretmanager
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 project_id = "abracadata-316418"  # Replace with the actual project ID for secrets
 class GCPManager:
     def __init__(self, project_id):
-        self.client = secretmanager.SecretManagerServiceClient()
         self.project_id = project_id
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use: importing and building the client is slow and needs credentials
+        if self._client is None:
+            from google.cloud import secretmanager
+            self._client = secretmanager.SecretManagerServiceClient()
+        return self._client
 
     def access_secret_version(self, secret_id, version_id="latest"):
         # Build the resource name of the secret version.
@@ -16,3 +26,47 @@ class GCPManager:
         # Return the decoded payload.
         return response.payload.data.decode('UTF-8')
 
+
+class SecretProvider:
+    """
+    Lazy, in-process cache of Secret Manager values.
+
+    Nothing is fetched at construction. The first lookup fetches every secret registered with
+    the provider concurrently, so a cold start pays one round trip instead of one per secret,
+    and later lookups are served from memory.
+
+    Usage:
+        secrets = SecretProvider("my-project", ["api-key", "api-secret"])
+        api_key, api_secret = secrets.get_many(["api-key", "api-secret"])
+    """
+
+    def __init__(self, project_id, secret_ids=(), max_workers=4):
+        self.project_id = project_id
+        self.secret_ids = list(secret_ids)
+        self.max_workers = max_workers
+        self._manager = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @property
+    def manager(self):
+        if self._manager is None:
+            self._manager = GCPManager(project_id=self.project_id)
+        return self._manager
+
+    def get(self, secret_id):
+        return self.get_many([secret_id])[0]
+
+    def get_many(self, secret_ids):
+        """
+        Return the values of secret_ids, fetching any missing secret (and the registered ones) concurrently.
+        """
+        with self._lock:
+            missing = [s for s in dict.fromkeys(list(secret_ids) + self.secret_ids) if s not in self._values]
+            if len(missing) == 1:
+                self._values[missing[0]] = self.manager.access_secret_version(missing[0])
+            elif missing:
+                self.manager.client  # Build the shared client once, before the worker threads use it
+                with ThreadPoolExecutor(max_workers=min(len(missing), self.max_workers)) as pool:
+                    self._values.update(zip(missing, pool.map(self.manager.access_secret_version, missing)))
+        return [self._values[secret_id] for secret_id in secret_ids]
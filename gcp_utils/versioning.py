@@ -0,0 +1,10 @@
+"""
+Errors of the versioned records written with a compare-and-set, the claims of the run ledger and
+the watermarks of bigquery_utils. Has no dependencies, so either side can import it.
+"""
+
+
+class VersionConflict(Exception):
+    """
+    The record was created or changed by another process since it was read.
+    """
@@ -0,0 +1,16 @@
+resource "google_storage_bucket" "trading-runs" {
+  name     = "${var.project}-${var.env}-trading-deribit-btc-perpetual-runs"
+  project  = var.project
+  location = var.region
+
+  uniform_bucket_level_access = true
+
+  labels = {
+    env       = var.env
+    component = "trading-deribit-btc-perpetual-hourly"
+  }
+
+  depends_on = [
+    google_project_service.gcp_services,
+  ]
+}
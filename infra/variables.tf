@@ -18,5 +18,5 @@ variable "gcp_service_list" {
   description = "List of GCP service to be enabled for a project."
   type        = list
   default     = ["cloudresourcemanager.googleapis.com", "notebooks.googleapis.com", "bigquery.googleapis.com", "pubsub.googleapis.com",
-                 "cloudscheduler.googleapis.com", "appengine.googleapis.com", "cloudfunctions.googleapis.com", "secretmanager.googleapis.com"]
+                 "cloudscheduler.googleapis.com", "appengine.googleapis.com", "cloudfunctions.googleapis.com", "secretmanager.googleapis.com", "storage.googleapis.com"]
 }
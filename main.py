@@ -1,9 +1,6 @@
-import pandas as pd
-import requests
 import asyncio
 import nest_asyncio
-from bigquery_utils.bq_utils import read_data
-from gcp_utils.secret_manager import GCPManager
+from gcp_utils.run_ledger import ledger
 from deribit_utils.deribit_utils import (authenticate,get_available_balance_btc
     ,get_btc_usd_price,calculate_usd_quantity_from_btc
     ,get_current_position,cancel_order,place_limit_order
@@ -13,41 +10,48 @@ from deribit_utils.deribit_utils import (authenticate,get_available_balance_btc
     ,get_order_details,get_current_position_quantity,cancel_all_orders
     ,execute_trade_logic,call_api
 )
+from deribit_utils.executor import ExecutionFailed, call_api_parallel
+from pipeline import (TRADING_INSTRUMENTS, claim_signal_run, get_account_credentials, mark_signal_processed,
+                      read_new_signal)
 
 # Apply nest_asyncio to allow nested event loops
 nest_asyncio.apply()
 
-# Create an instance of the GCPManager with the project ID where secrets are located
-project_id_secret = "abracadata-316418"  # Replace with the actual project ID for secrets
-gcp_manager = GCPManager(project_id=project_id_secret)
-
-# Access the secrets
-api_key = gcp_manager.access_secret_version(secret_id="BtcRider-api-key")
-api_secret = gcp_manager.access_secret_version(secret_id="BtcRider-api-secret")
-
 # Others trading parameters
-cl_ord_id = "b14"
 instrument_name = "BTC-PERPETUAL"
 
+
 def deribit_trading_btc_perpetual_ao_signal(event, context):
     """
     Main GCP Functions entrypoint.
     """
     print("Starting Deribit Strategy Execution...")
 
-    # Construct the BigQuery query
-    query_string = """
-        SELECT DISTINCT
-            *
-        FROM `signals-etl.btc_perpetual_binance.master_signals_ao_1h` kline
-        ORDER BY open_time ASC
-        LIMIT 1
-    """
-
-    # Retrieve and process data
-    df = read_data(query_string)
-
-    # Run the WebSocket event loop and execute the trading logic
-    asyncio.run(call_api(df, api_key, api_secret))
+    # Pub/Sub redelivers a trigger still running after the ack deadline: act on each one once
+    trigger_id = getattr(context, "event_id", None)
+    trigger = ledger.claim(f"trigger-{trigger_id}") if trigger_id else None
+    if trigger is not None and not trigger:
+        print(f"Trigger {trigger_id} already {trigger.state}. Nothing to do.")
+        return "Duplicate trigger", 200
+
+    with ledger.running(trigger):
+        # Retrieve the signal bars added since the last run
+        df, stats = read_new_signal()
+        print(f"Signal read in {stats['latency_seconds']:.3f}s, {stats['bytes_billed']} bytes billed")
+        if df.empty:
+            print("No new signal since the last run. Nothing to do.")
+            return "No new signal", 200
+
+        run = claim_signal_run(df, stats, trigger_id)
+        if not run:
+            return "Duplicate run", 200
+        with ledger.running(run):
+            # Run the WebSocket event loop and execute the trading logic on every account and instrument
+            report = asyncio.run(call_api_parallel(df, get_account_credentials(), TRADING_INSTRUMENTS))
+            if report["failed"]:
+                # Released instead of completed, and the watermark stays: a retry trades the bar
+                # again, and the accounts that already traded it skip it by the labels of their orders
+                raise ExecutionFailed(report)
+            mark_signal_processed(df, stats)
 
     return "Function executed successfully", 200
@@ -0,0 +1,98 @@
+"""
+Pieces of the trading pipeline shared by the Cloud Function (main.py) and the long-running
+service (service.py): the accounts and instruments traded, their credentials, and the reading,
+claiming and committing of the signal bars.
+
+Importing this module has no side effects: secrets are fetched on first use, and nothing patches
+the event loop. service.py must not import main.py, whose nest_asyncio.apply() would patch the
+service's own loop.
+
+Configuration, read once at import:
+    TRADING_ACCOUNTS=BtcRider,btcridermulti        accounts traded on each signal, names of ACCOUNTS
+    TRADING_INSTRUMENTS=BTC-PERPETUAL,ETH-PERPETUAL  instruments traded on each account
+    SIGNAL_WATERMARK_PATH=/tmp/.../signal_watermark.json  local copy of the signal watermark
+"""
+import os
+
+from bigquery_utils.bq_utils import Watermark, commit_incremental, read_incremental
+from deribit_utils.deribit_utils import signal_run_key
+from gcp_utils.run_ledger import DONE, ledger
+from gcp_utils.secret_manager import SecretProvider
+
+# Secrets are fetched concurrently on first use and cached for warm invocations
+project_id_secret = "abracadata-316418"  # Replace with the actual project ID for secrets
+API_KEY_SECRET_ID = "BtcRider-api-key"
+API_SECRET_SECRET_ID = "BtcRider-api-secret"
+secrets = SecretProvider(project_id_secret, [API_KEY_SECRET_ID, API_SECRET_SECRET_ID])
+
+
+def get_api_credentials():
+    """
+    Returns the (api_key, api_secret) pair of the trading account.
+    """
+    api_key, api_secret = secrets.get_many([API_KEY_SECRET_ID, API_SECRET_SECRET_ID])
+    return api_key, api_secret
+
+# Accounts the signal can be traded on: name -> (secrets project, API key secret id, API secret secret id)
+ACCOUNTS = {
+    "BtcRider": (project_id_secret, API_KEY_SECRET_ID, API_SECRET_SECRET_ID),
+    "btcridermulti": ("trading-etl", "btcridermulti-api-key", "btcridermulti-api-secret"),
+}
+# Comma-separated accounts and instruments traded on each signal, every pair runs in parallel
+TRADING_ACCOUNTS = os.environ.get("TRADING_ACCOUNTS", "BtcRider").split(",")
+TRADING_INSTRUMENTS = os.environ.get("TRADING_INSTRUMENTS", "BTC-PERPETUAL").split(",")
+_account_secrets = {project_id_secret: secrets}
+
+
+def get_account_credentials(accounts=None):
+    """
+    Returns {account: (api_key, api_secret)} for accounts (TRADING_ACCOUNTS by default).
+    """
+    credentials = {}
+    for account in accounts or TRADING_ACCOUNTS:
+        project, key_id, secret_id = ACCOUNTS[account]
+        if project not in _account_secrets:
+            _account_secrets[project] = SecretProvider(project)
+        provider = _account_secrets[project]
+        credentials[account] = tuple(provider.get_many([key_id, secret_id]))
+    return credentials
+
+# AO signal bars, read incrementally from the last processed open_time
+SIGNAL_TABLE = "signals-etl.btc_perpetual_binance.master_signals_ao_1h"
+SIGNAL_COLUMN = "open_time"
+# Kept in the store of the run ledger (RUN_LEDGER), shared by every instance and cold start,
+# and cached in a local file between warm invocations of the function and runs of the service
+signal_watermark = Watermark(os.environ.get("SIGNAL_WATERMARK_PATH", "/tmp/deribit_trading/signal_watermark.json"),
+                             store=ledger.store, store_key="signal-watermark")
+
+
+def read_new_signal():
+    """
+    Returns the newest signal bar not processed yet (an empty DataFrame if there is none)
+    and the read statistics. The bars before it are skipped, and are committed with it by
+    mark_signal_processed: after a gap, or without a watermark, only the current signal is traded.
+    """
+    df, stats = read_incremental(SIGNAL_TABLE, SIGNAL_COLUMN, signal_watermark, start_at_latest=True)
+    if len(df) > 1:
+        print(f"{len(df) - 1} signal bars older than the newest one skipped")
+        df = df.iloc[[-1]].reset_index(drop=True)
+    return df, stats
+
+
+def mark_signal_processed(df, stats):
+    commit_incremental(signal_watermark, SIGNAL_COLUMN, df, stats)
+
+
+def claim_signal_run(df, stats, trigger=None):
+    """
+    Claim the run of the signal bar of df in the run ledger. Returns the RunClaim, false if the
+    bar is traded by another run or was already traded, in which case the watermark moves past it.
+    A run is only done once it traded on every account and instrument: a failed one releases its
+    claim, and the bar is claimed again.
+    """
+    run = ledger.claim(signal_run_key(df), trigger=trigger)
+    if not run:
+        print(f"Signal bar {run.key} already {run.state}. Nothing to do.")
+        if run.state == DONE:
+            mark_signal_processed(df, stats)
+    return run
@@ -0,0 +1,232 @@
+"""
+Long-running alternative to the deribit_trading_btc_perpetual_ao_signal Cloud Function.
+
+The service pays the start-up costs once: imports, Secret Manager lookups, the BigQuery client,
+the WebSocket connections and authentication. It then runs the signal-to-order pipeline on every
+trigger over the warm connections, on every account of TRADING_ACCOUNTS and instrument of
+TRADING_INSTRUMENTS like the Cloud Function. The SessionManager of each account refreshes its token
+in the background and reconnects it if the socket drops.
+
+Usage:
+    python service.py --schedule                           # run every hour, shortly after the bar closes
+    python service.py --subscription projects/P/subscriptions/S  # run on each Pub/Sub message
+    python service.py --candles                            # run on each closed Deribit candle, signal computed locally
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from bigquery_utils.journal import journal
+from deribit_utils.deribit_utils import signal_run_key, websocket_url
+from deribit_utils.executor import ConnectionPool, ExecutionFailed, execute_parallel
+from deribit_utils.signal_engine import CandleStream, SignalEngine, signal_frame
+from gcp_utils.run_ledger import ledger
+from pipeline import (TRADING_INSTRUMENTS, claim_signal_run, get_account_credentials, mark_signal_processed,
+                      read_new_signal)
+from telemetry_utils.telemetry import telemetry
+
+
+class TradingService:
+    """
+    Keeps an authenticated DeribitClient per account open between runs of the trading pipeline.
+    """
+
+    def __init__(self, credentials, instruments, url=websocket_url, connect=None):
+        """
+        Args:
+        - credentials: Dict of account name -> (api_key, api_secret) of the accounts to trade.
+        - instruments: Names of the instruments to trade on each account.
+        - url, connect: WebSocket URL or factory of the connections, see ConnectionPool.
+        """
+        self.accounts = list(credentials)
+        self.instruments = list(instruments)
+        self.pool = ConnectionPool(credentials, connect=connect, url=url, max_attempts=None)
+        self._run_lock = asyncio.Lock()
+
+    async def connect(self):
+        """
+        Open the connections of every account that is not connected, and return the client of the
+        first account, which carries the market data subscriptions.
+        """
+        clients = await asyncio.gather(*(self.pool.get(account) for account in self.accounts))
+        return clients[0]
+
+    async def close(self):
+        await self.pool.close_all()
+
+    async def _execute(self, df):
+        """
+        Trade the signal of df on every account and instrument. Raises ExecutionFailed if any of them failed.
+        """
+        report = await execute_parallel(self.pool, df, self.accounts, self.instruments)
+        if report["failed"]:
+            raise ExecutionFailed(report)
+
+    async def run_once(self):
+        """
+        Read the latest signal and execute the trading logic on the warm connection.
+        Runs never overlap: a trigger arriving during a run waits for it to finish.
+        """
+        async with self._run_lock:
+            start = time.perf_counter()
+            # The signal query and the connection check are independent, run them together
+            (df, stats), _ = await asyncio.gather(
+                asyncio.to_thread(read_new_signal),
+                self.connect()
+            )
+            signal_ready = time.perf_counter()
+            logging.info(f"Signal read in {stats['latency_seconds']:.3f}s, {stats['bytes_billed']} bytes billed")
+            if df.empty:
+                logging.info("No new signal since the last run. Nothing to do.")
+                return
+            run = claim_signal_run(df, stats)
+            if not run:
+                return
+            # A failed run raises, so its claim is released and the watermark stays
+            with ledger.running(run):
+                await self._execute(df)
+                mark_signal_processed(df, stats)
+            logging.info(f"Run finished in {time.perf_counter() - start:.3f}s "
+                         f"(signal and connection ready after {signal_ready - start:.3f}s)")
+
+    async def run_signal(self, bar):
+        """
+        Execute the trading logic on a signal row computed from the candles, without reading the table.
+        """
+        async with self._run_lock:
+            start = time.perf_counter()
+            df = signal_frame(bar)
+            run = ledger.claim(signal_run_key(df))
+            if not run:
+                logging.info(f"Signal bar {run.key} already {run.state}. Nothing to do.")
+                return
+            await self.connect()
+            with ledger.running(run):
+                await self._execute(df)
+            logging.info(f"Run on the {bar['open_time']} bar finished in {time.perf_counter() - start:.3f}s")
+
+    async def run_on_candles(self, instrument_name=None):
+        """
+        Run the pipeline on every closed candle of instrument_name (the first traded instrument by
+        default), with the AO signal computed by a SignalEngine instead of waiting for the ETL to
+        write the signals table.
+
+        The engine outlives the connections: after a reconnection the stream only feeds it the
+        candles closed in between, and runs resume on the next live candle.
+        """
+        instrument_name = instrument_name or self.instruments[0]
+        engine = SignalEngine()
+        stream = None
+        while True:
+            client = await self.connect()
+            if stream is None or stream.client is not client:
+                if stream is not None:
+                    await stream.stop()
+                stream = CandleStream(instrument_name, engine)
+                await stream.start(client)
+            try:
+                bar = await asyncio.wait_for(stream.next_bar(), 2 * stream.bar_seconds)
+            except asyncio.TimeoutError:
+                logging.warning(f"No {instrument_name} candle closed for two bars, reconnecting")
+                await self.close()
+                continue
+            if not engine.ready:
+                logging.info(f"Signal engine not warmed up on the {bar['open_time']} bar, nothing to do")
+                continue
+            await self._run_safely(bar)
+
+    async def run_on_schedule(self, interval_seconds=3600, offset_seconds=60):
+        """
+        Run the pipeline every interval_seconds, offset_seconds after each interval boundary.
+        """
+        await self.connect()
+        while True:
+            now = time.time()
+            next_run = ((now - offset_seconds) // interval_seconds + 1) * interval_seconds + offset_seconds
+            await asyncio.sleep(next_run - now)
+            await self._run_safely()
+
+    async def run_on_pubsub(self, subscription_path):
+        """
+        Run the pipeline for each message pulled from a Pub/Sub subscription.
+
+        Messages are acknowledged on receipt: a run lasts longer than the subscription ack
+        deadline, and a late ack would only cause the trigger to be redelivered. A trigger
+        delivered again anyway is skipped by its message id.
+        """
+        from google.cloud import pubsub_v1
+
+        await self.connect()
+        loop = asyncio.get_running_loop()
+        triggers = asyncio.Queue()
+
+        def on_message(message):
+            message.ack()
+            loop.call_soon_threadsafe(triggers.put_nowait, message.message_id)
+
+        subscriber = pubsub_v1.SubscriberClient()
+        streaming_pull = subscriber.subscribe(
+            subscription_path,
+            callback=on_message,
+            flow_control=pubsub_v1.types.FlowControl(max_messages=1)
+        )
+        logging.info(f"Listening for triggers on {subscription_path}")
+        try:
+            while True:
+                message_id = await triggers.get()
+                trigger = ledger.claim(f"trigger-{message_id}")
+                if not trigger:
+                    logging.info(f"Trigger {message_id} already {trigger.state}, skipped")
+                    continue
+                logging.info(f"Trigger {message_id} received")
+                # Like the runs, a trigger is only done once its run succeeded
+                if await self._run_safely():
+                    ledger.complete(trigger)
+                else:
+                    ledger.release(trigger, error="run failed")
+        finally:
+            streaming_pull.cancel()
+            subscriber.close()
+
+    async def _run_safely(self, bar=None):
+        """
+        Run the pipeline, logging instead of raising its errors. Returns whether it succeeded.
+        """
+        try:
+            if bar is None:
+                await self.run_once()
+            else:
+                await self.run_signal(bar)
+            return True
+        except Exception as e:
+            logging.exception(f"Run failed: {e}")
+            await self.close()  # Start the next run from a fresh connection
+            return False
+        finally:
+            await journal.flush()  # The trades of the run reach BigQuery even if the next trigger is an hour away
+            telemetry.export()  # One export per run, whatever its outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Deribit AO signal strategy as a long-running service.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--schedule", action="store_true", help="Run every hour")
+    mode.add_argument("--subscription", help="Pub/Sub subscription path to pull triggers from")
+    mode.add_argument("--candles", action="store_true",
+                      help="Run on each closed Deribit candle, with the signal computed from the candles")
+    parser.add_argument("--offset-seconds", type=int, default=60, help="Delay after each hour before running")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    service = TradingService(get_account_credentials(), TRADING_INSTRUMENTS)
+    if args.schedule:
+        asyncio.run(service.run_on_schedule(offset_seconds=args.offset_seconds))
+    elif args.candles:
+        asyncio.run(service.run_on_candles())
+    else:
+        asyncio.run(service.run_on_pubsub(args.subscription))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+In-process latency and execution metrics, exported to a JSONL file or an OpenTelemetry meter.
+
+Measurements are aggregated in memory into log-bucketed histograms and counters, so recording
+costs a couple of dict operations and nothing is written until export(). Execution events
+(fills with their slippage) are kept in a bounded buffer.
+
+Configuration, read once at import:
+    TELEMETRY_ENABLED=0                 turn recording off
+    TELEMETRY_EXPORT=jsonl:/tmp/t.jsonl append exports to a JSONL file
+    TELEMETRY_EXPORT=otel               record exports on the global OpenTelemetry meter provider
+
+Usage:
+    from telemetry_utils.telemetry import telemetry, traced
+
+    @traced()
+    async def get_btc_usd_price(client): ...
+
+    telemetry.record("order.time_to_fill", seconds)
+    telemetry.export()
+"""
+import collections
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import time
+
+BUCKETS_PER_OCTAVE = 16  # Relative bucket width of about 4.4%
+MAX_EVENTS = 10_000
+
+
+class Histogram:
+    """
+    Histogram of signed values in logarithmic buckets, giving percentiles within a few percent
+    in constant memory.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = {}
+
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value > 0:
+            key = math.floor(math.log2(value) * BUCKETS_PER_OCTAVE) * 2 + 1
+        elif value < 0:
+            key = math.floor(math.log2(-value) * BUCKETS_PER_OCTAVE) * 2
+        else:
+            key = None
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def _bucket_values(self):
+        # Representative value of each bucket, in ascending order of value
+        values = []
+        for key, count in self.buckets.items():
+            if key is None:
+                value = 0.0
+            else:
+                magnitude = 2 ** ((key // 2 + 0.5) / BUCKETS_PER_OCTAVE)
+                value = magnitude if key % 2 else -magnitude
+            values.append((value, count))
+        return sorted(values)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for value, count in self._bucket_values():
+            seen += count
+            if seen >= rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class _Timer:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.telemetry.record(self.name, time.perf_counter() - self.start)
+
+
+class Telemetry:
+    """
+    Registry of the histograms, counters and events of the process.
+    """
+
+    def __init__(self, enabled=True, sink=None):
+        self.enabled = enabled
+        self.sink = sink
+        self.histograms = collections.defaultdict(Histogram)
+        self.counters = collections.Counter()
+        self.events = collections.deque(maxlen=MAX_EVENTS)
+
+    def record(self, name, value):
+        if self.enabled:
+            self.histograms[name].record(value)
+
+    def increment(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] += amount
+
+    def event(self, name, **fields):
+        if self.enabled:
+            fields.update(name=name, timestamp=time.time())
+            self.events.append(fields)
+
+    def timer(self, name):
+        """
+        Context manager recording the duration of its block, in seconds, under name.
+        """
+        return _Timer(self, name)
+
+    def traced(self, name=None):
+        """
+        Decorator recording the duration of each call of a function or coroutine function,
+        in seconds, under name (by default "<module>.<function>").
+        """
+        def decorator(function):
+            metric = name or f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.histograms[metric].record(time.perf_counter() - start)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.histograms[metric].record(time.perf_counter() - start)
+            return wrapper
+
+        return decorator
+
+    def snapshot(self):
+        return {
+            "histograms": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            "counters": dict(self.counters),
+            "events": list(self.events),
+        }
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
+        self.events.clear()
+
+    def export(self, sink=None, reset=True):
+        """
+        Send the current metrics to sink (the configured sink by default), then start over.
+        Export failures are logged, never raised: telemetry must not break trading.
+        """
+        sink = sink or self.sink
+        snapshot = self.snapshot()
+        if sink is not None and self.enabled:
+            try:
+                sink.export(self, snapshot)
+            except Exception as e:
+                logging.warning(f"Telemetry export failed: {e}")
+        if reset:
+            self.reset()
+        return snapshot
+
+
+class JsonlSink:
+    """
+    Appends one JSON line per histogram, counter and event of each export to a local file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, telemetry, snapshot):
+        exported_at = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a") as f:
+            for name, summary in snapshot["histograms"].items():
+                f.write(json.dumps({"type": "histogram", "name": name, "exported_at": exported_at, **summary}) + "\n")
+            for name, value in snapshot["counters"].items():
+                f.write(json.dumps({"type": "counter", "name": name, "exported_at": exported_at, "value": value}) + "\n")
+            for event in snapshot["events"]:
+                f.write(json.dumps({"type": "event", **event}, default=str) + "\n")
+
+
+class OpenTelemetrySink:
+    """
+    Records each export on an OpenTelemetry meter, for any exporter configured on the global
+    meter provider. Needs the opentelemetry-api package, imported on first export.
+    """
+
+    def __init__(self, meter_name="deribit_trading"):
+        self.meter_name = meter_name
+        self._meter = None
+        self._instruments = {}
+
+    def _instrument(self, kind, name):
+        if self._meter is None:
+            from opentelemetry import metrics
+            self._meter = metrics.get_meter(self.meter_name)
+        key = (kind, name)
+        if key not in self._instruments:
+            create = self._meter.create_histogram if kind == "histogram" else self._meter.create_counter
+            self._instruments[key] = create(name)
+        return self._instruments[key]
+
+    def export(self, telemetry, snapshot):
+        for name, histogram in telemetry.histograms.items():
+            instrument = self._instrument("histogram", name)
+            for value, count in histogram._bucket_values():
+                for _ in range(count):
+                    instrument.record(value)
+        for name, value in telemetry.counters.items():
+            self._instrument("counter", name).add(value)
+        for event in telemetry.events:
+            self._instrument("counter", f"events.{event['name']}").add(1)
+
+
+def sink_from_env(value=None):
+    """
+    Build the sink described by TELEMETRY_EXPORT, or None if it is not set.
+    """
+    value = value if value is not None else os.environ.get("TELEMETRY_EXPORT", "")
+    if value.startswith("jsonl:"):
+        return JsonlSink(value[len("jsonl:"):])
+    if value == "otel":
+        return OpenTelemetrySink()
+    if value:
+        logging.warning(f"Unknown TELEMETRY_EXPORT value {value!r}, telemetry will not be exported")
+    return None
+
+
+telemetry = Telemetry(enabled=os.environ.get("TELEMETRY_ENABLED", "1") != "0", sink=sink_from_env())
+traced = telemetry.traced
@@ -0,0 +1,35 @@
+"""
+The multipliers of a (stop loss, take profit) pair evaluated at once, by
+walk_forward.evaluate_multipliers, against one simulate and summarize per combination.
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from backtest_utils.backtest import SUMMARY_COLUMNS, prepare_arrays, simulate, summarize
+from backtest_utils.walk_forward import evaluate_multipliers, trade_path
+from benchmarks.bench_backtest import random_hourly_bars
+
+MULTIPLIERS = (1, 2, 3, 4, 5)
+
+
+@pytest.fixture(scope="module")
+def arrays():
+    return prepare_arrays(random_hourly_bars(0.1))  # 876 hourly bars, a few dozen signals
+
+
+@pytest.mark.parametrize("stop_loss, take_profit", [(0.03, 0.05), (0.09, 0.09), (0.2, 0.01)])
+def test_evaluate_multipliers_matches_simulate(arrays, stop_loss, take_profit):
+    multipliers = list(itertools.product(MULTIPLIERS, MULTIPLIERS)) + [(20, 20)]  # Leverage that ruins the account
+    longs, shorts = zip(*multipliers)
+    trades = trade_path(arrays, stop_loss, take_profit)
+    assert len(trades) > 5
+
+    evaluated = evaluate_multipliers(trades, arrays["close"], longs, shorts)
+
+    for row, (long_multiplier, short_multiplier) in zip(evaluated, multipliers):
+        expected = summarize(*simulate(arrays, stop_loss, take_profit, long_multiplier, short_multiplier)[:2])
+        for value, column in zip(row, SUMMARY_COLUMNS):
+            assert np.isclose(value, expected[column], rtol=1e-9, atol=1e-12), \
+                f"{column} differs for {long_multiplier, short_multiplier}: {value} != {expected[column]}"
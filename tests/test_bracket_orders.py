@@ -0,0 +1,157 @@
+"""
+Stop loss and take profit brackets against the simulated exchange: retrying and rolling back
+their legs, and completing the bracket of a position when the run of a bar is repeated.
+"""
+import pandas as pd
+import pytest
+
+from deribit_utils import deribit_utils
+from deribit_utils.client import DeribitClient
+from deribit_utils.simulator import SimulatedExchange, run_simulation
+
+START_TIME = 1_700_000_000
+# Flat at 30000, then a drop through the resting buy of the entry chase, which fills at 29998.5
+TICKS = [(START_TIME + i, 30000.0 if i < 15 else 29990.0) for i in range(600)]
+ENTRY_PRICE = 29998.5
+LONG_SIGNAL = pd.DataFrame({"open_time": [pd.Timestamp(START_TIME, unit="s", tz="UTC")],
+                            "Long_Entry": [True], "Short_Entry": [False]})
+
+
+def run_on_exchange(steps, ticks=TICKS):
+    """
+    Run steps(client, exchange) against a new simulated exchange and return its result and the exchange.
+    """
+    exchange = SimulatedExchange(ticks)
+
+    async def run():
+        exchange.start()
+        try:
+            async with DeribitClient(exchange.connect()) as client:
+                await deribit_utils.authenticate("simulator", "simulator", client=client)
+                return await steps(client, exchange)
+        finally:
+            await exchange.stop()
+
+    return run_simulation(run(), start_time=START_TIME), exchange
+
+
+def reject_trigger_orders(monkeypatch, order_types=("stop_limit", "take_limit"), count=None):
+    """
+    Make the exchange reject the trigger orders of order_types, the first count of them or all.
+    Returns the list of the rejected order types.
+    """
+    handle = SimulatedExchange.handle
+    rejected = []
+
+    def rejecting(exchange, socket, message):
+        params = message.get("params") or {}
+        if message.get("method") in ("private/buy", "private/sell") and params.get("type") in order_types \
+                and (count is None or len(rejected) < count):
+            rejected.append(params["type"])
+            return {"jsonrpc": "2.0", "id": message.get("id"), "error": {"code": 10041, "message": "settlement_in_progress"}}
+        return handle(exchange, socket, message)
+
+    monkeypatch.setattr(SimulatedExchange, "handle", rejecting)
+    return rejected
+
+
+def open_legs(exchange):
+    return {order["order_type"]: order for order in exchange.untriggered}
+
+
+def expected_prices(average_price):
+    _, stop_loss_price, take_profit_price = deribit_utils.bracket_prices(average_price, "buy")
+    return round(stop_loss_price * 2) / 2, round(take_profit_price * 2) / 2
+
+
+def test_rejected_leg_is_retried(monkeypatch):
+    rejected = reject_trigger_orders(monkeypatch, order_types=("take_limit",), count=1)
+
+    bracket, exchange = run_on_exchange(
+        lambda client, exchange: deribit_utils.place_bracket_orders(client, "sell", 100, 29000.0, 31000.0))
+
+    assert rejected == ["take_limit"]
+    assert bracket["attempts"] == 2
+    legs = open_legs(exchange)
+    assert legs["stop_limit"]["order_id"] == bracket["stop_loss"]["order_id"]
+    assert legs["take_limit"]["order_id"] == bracket["take_profit"]["order_id"]
+    assert legs["take_limit"]["trigger_price"] == 31000.0
+
+
+def test_leg_rejected_on_every_attempt_rolls_back_the_other(monkeypatch):
+    rejected = reject_trigger_orders(monkeypatch, order_types=("take_limit",))
+
+    bracket, exchange = run_on_exchange(
+        lambda client, exchange: deribit_utils.place_bracket_orders(client, "sell", 100, 29000.0, 31000.0))
+
+    assert bracket is None
+    assert rejected == ["take_limit"] * (deribit_utils.BRACKET_LEG_RETRIES + 1)
+    assert exchange.untriggered == []
+    stop_losses = [order for order in exchange.orders.values() if order["order_type"] == "stop_limit"]
+    assert [order["order_state"] for order in stop_losses] == ["cancelled"]
+
+
+def test_repeated_run_completes_a_missing_bracket(monkeypatch):
+    async def steps(client, exchange):
+        with monkeypatch.context() as patch:
+            reject_trigger_orders(patch)
+            await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+        assert exchange.position_size > 0 and open_legs(exchange) == {}
+        entries = exchange.request_counts["private/buy"]
+
+        await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+        assert exchange.request_counts["private/buy"] == entries  # No second entry
+        return exchange.position_size
+
+    size, exchange = run_on_exchange(steps)
+
+    legs = open_legs(exchange)
+    stop_loss_price, take_profit_price = expected_prices(exchange.position_price)
+    assert exchange.position_price == ENTRY_PRICE
+    assert legs["stop_limit"]["trigger_price"] == pytest.approx(stop_loss_price, abs=0.5)
+    assert legs["take_limit"]["trigger_price"] == pytest.approx(take_profit_price, abs=0.5)
+    assert {leg["direction"] for leg in legs.values()} == {"sell"}
+    assert {leg["amount"] for leg in legs.values()} == {size}
+    assert all(leg["reduce_only"] for leg in legs.values())
+    assert all(leg["label"].startswith("b14-202311142213-repair-") for leg in legs.values())
+
+
+def test_repeated_run_places_only_the_missing_leg(monkeypatch):
+    async def steps(client, exchange):
+        with monkeypatch.context() as patch:
+            reject_trigger_orders(patch)
+            await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+        stop_loss_price, _ = expected_prices(exchange.position_price)
+        await deribit_utils.place_trigger_order(client, "sell", exchange.position_size, stop_loss_price,
+                                                stop_loss_price, "stop_limit")
+
+        await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+
+    _, exchange = run_on_exchange(steps)
+
+    assert sorted(order["order_type"] for order in exchange.untriggered) == ["stop_limit", "take_limit"]
+
+
+def test_repeated_run_leaves_a_complete_bracket(monkeypatch):
+    async def steps(client, exchange):
+        await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+        assert set(open_legs(exchange)) == {"stop_limit", "take_limit"}
+        sells = exchange.request_counts["private/sell"]
+
+        await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+        return exchange.request_counts["private/sell"] - sells
+
+    new_sells, exchange = run_on_exchange(steps)
+
+    assert new_sells == 0
+    assert len(exchange.untriggered) == 2
+
+
+def test_run_resets_its_signal_price():
+    async def steps(client, exchange):
+        await deribit_utils.execute_trade_logic(client, LONG_SIGNAL)
+        return deribit_utils.signal_price.get()
+
+    price, _ = run_on_exchange(steps)
+
+    assert price is None
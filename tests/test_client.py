@@ -0,0 +1,97 @@
+"""
+DeribitClient subscriptions: rollback of failed subscribe requests and isolation of the handlers.
+"""
+import asyncio
+
+import pytest
+
+from deribit_utils import codec
+from deribit_utils.client import DeribitClient
+
+
+class ScriptedWebSocket:
+    """
+    Socket answering each request with respond(request): a response dict, or None for no answer.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.incoming = asyncio.Queue()
+
+    async def send(self, message):
+        request = codec.loads(message)
+        self.requests.append(request)
+        response = self.respond(request)
+        if response is not None:
+            self.incoming.put_nowait(codec.dumps({"jsonrpc": "2.0", "id": request["id"], **response}))
+
+    async def recv(self):
+        return await self.incoming.get()
+
+    def notify(self, channel, data):
+        self.incoming.put_nowait(codec.dumps({"jsonrpc": "2.0", "method": "subscription",
+                                              "params": {"channel": channel, "data": data}}))
+
+
+def subscribe_requests(websocket):
+    return [request for request in websocket.requests if request["method"].endswith("/subscribe")]
+
+
+def run(test):
+    return asyncio.run(asyncio.wait_for(test(), 5))
+
+
+@pytest.mark.parametrize("failure", ["error", "timeout"])
+def test_failed_subscribe_is_rolled_back_and_sent_again(failure):
+    failures = [failure]
+
+    def respond(request):
+        if failures:
+            failures.pop()
+            return {"error": {"code": 11050, "message": "bad_request"}} if failure == "error" else None
+        return {"result": request["params"]["channels"]}
+
+    async def test():
+        websocket = ScriptedWebSocket(respond)
+        async with DeribitClient(websocket, request_timeout=0.05) as client:
+            received = []
+            handler = lambda channel, data: received.append(data)
+            if failure == "error":
+                assert "error" in await client.subscribe(["ticker.BTC-PERPETUAL.raw"], handler)
+            else:
+                with pytest.raises(asyncio.TimeoutError):
+                    await client.subscribe(["ticker.BTC-PERPETUAL.raw"], handler)
+            assert client.subscribed_channels() == []
+
+            response = await client.subscribe(["ticker.BTC-PERPETUAL.raw"], handler)
+            assert response["result"] == ["ticker.BTC-PERPETUAL.raw"]
+            assert len(subscribe_requests(websocket)) == 2
+
+            websocket.notify("ticker.BTC-PERPETUAL.raw", {"last_price": 30000})
+            await asyncio.sleep(0.01)
+            assert received == [{"last_price": 30000}]  # Routed once, to the one registered handler
+
+    run(test)
+
+
+def test_failing_handler_does_not_stop_the_connection():
+    async def test():
+        websocket = ScriptedWebSocket(lambda request: {"result": request["params"].get("channels", "ok")})
+        async with DeribitClient(websocket) as client:
+            received = []
+
+            def failing(channel, data):
+                raise ValueError("bad notification")
+
+            await client.subscribe(["ticker.BTC-PERPETUAL.raw"], failing)
+            await client.subscribe(["ticker.BTC-PERPETUAL.raw"], lambda channel, data: received.append(data))
+            websocket.notify("ticker.BTC-PERPETUAL.raw", {"last_price": 30000})
+            await asyncio.sleep(0.01)
+
+            assert received == [{"last_price": 30000}]
+            assert not client.closed
+            response = await client.request("public/test")
+            assert response["result"] == "ok"
+
+    run(test)
@@ -0,0 +1,32 @@
+"""
+Cold import times of the modules loaded on a cold start, against IMPORT_TIME_BUDGETS_MS.
+"""
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.import_time import IMPORT_TIME_BUDGETS_MS, REPO_ROOT, is_missing_dependency, measure_import_time_ms
+
+REPEAT = 3  # The best of a few runs filters out noise
+
+
+@pytest.mark.parametrize("module", IMPORT_TIME_BUDGETS_MS)
+def test_import_time_within_budget(module):
+    budget_ms = IMPORT_TIME_BUDGETS_MS[module]
+    try:
+        total_ms, slowest = min(measure_import_time_ms(module) for _ in range(REPEAT))
+    except ModuleNotFoundError as e:
+        if not is_missing_dependency(e):
+            raise
+        pytest.skip(f"{e.name} is not installed")
+
+    details = ", ".join(f"{name} {ms:.1f}ms" for ms, name in slowest)
+    assert total_ms <= budget_ms, f"{module} imports in {total_ms:.1f}ms, over its {budget_ms}ms budget ({details})"
+
+
+def test_service_does_not_import_main():
+    # main applies nest_asyncio on import, which would patch the event loop of the service
+    code = "import sys, service; print(sorted({'main', 'nest_asyncio'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, cwd=REPO_ROOT)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,55 @@
+"""
+TradeJournal: events that cannot be written are spilled to disk, and loaded again, in order and
+unchanged, by the journal of the next process.
+"""
+import asyncio
+import json
+import os
+
+from bigquery_utils.journal import TradeJournal, journal_context
+
+TABLE_ID = "project.dataset.trade_journal"
+
+
+def failing_writer(table_id, rows):
+    raise ConnectionError("BigQuery unavailable")
+
+
+def test_spilled_events_are_loaded_after_a_restart(tmp_path):
+    spill_dir = str(tmp_path / "journal")
+
+    async def first_run():
+        journal = TradeJournal(TABLE_ID, batch_size=2, spill_dir=spill_dir, writer=failing_writer)
+        journal_context.set({"account": "BtcRider"})
+        journal.append("order", order_id=1, side="buy", price=29998.5, amount=100, label="b14-202311142213-0")
+        journal.append("reprice", order_id=1, price=29999.0)
+        journal.append("fill", order_id=1, order_state="filled", amount=100)
+        assert not await journal.close()
+        return journal.metrics()
+
+    metrics = asyncio.run(first_run())
+    assert metrics["written"] == 0 and metrics["spilled"] == 3 and metrics["buffered"] == 0
+    assert len(os.listdir(spill_dir)) == 2  # One file per batch
+
+    written = []
+
+    def writer(table_id, rows):
+        written.append((table_id, rows))
+        return True
+
+    async def after_restart():
+        journal = TradeJournal(TABLE_ID, batch_size=2, spill_dir=spill_dir, writer=writer)
+        journal.append("position", instrument_name="BTC-PERPETUAL", amount=100)
+        assert await journal.close()
+        return journal.metrics()
+
+    metrics = asyncio.run(after_restart())
+
+    rows = [row for table_id, batch in written for row in batch]
+    assert {table_id for table_id, _ in written} == {TABLE_ID}
+    assert [row["event_type"] for row in rows] == ["order", "reprice", "fill", "position"]
+    assert rows[0]["account"] == "BtcRider" and rows[0]["order_id"] == "1" and rows[0]["price"] == 29998.5
+    assert json.loads(rows[0]["details"]) == {"label": "b14-202311142213-0"}
+    assert rows[2]["order_state"] == "filled"
+    assert metrics["written"] == 4
+    assert os.listdir(spill_dir) == []
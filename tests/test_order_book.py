@@ -0,0 +1,78 @@
+"""
+LocalOrderBook: a gap in the change_id sequence resyncs the book from a new snapshot, and the
+changes following that snapshot are applied to it.
+"""
+import asyncio
+
+from deribit_utils import codec
+from deribit_utils.client import DeribitClient
+from deribit_utils.order_book import LocalOrderBook
+
+CHANNEL = "book.BTC-PERPETUAL.100ms"
+
+
+class BookWebSocket:
+    """
+    Socket answering the subscribe and unsubscribe requests, and sending the next of snapshots
+    after each subscription, as Deribit does.
+    """
+
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+        self.methods = []
+        self.incoming = asyncio.Queue()
+
+    async def send(self, message):
+        request = codec.loads(message)
+        self.methods.append(request["method"])
+        self.incoming.put_nowait(codec.dumps({"jsonrpc": "2.0", "id": request["id"],
+                                              "result": request["params"]["channels"]}))
+        if request["method"] == "public/subscribe":
+            self.notify(dict(self.snapshots.pop(0), type="snapshot"))
+
+    async def recv(self):
+        return await self.incoming.get()
+
+    def notify(self, data):
+        self.incoming.put_nowait(codec.dumps({"jsonrpc": "2.0", "method": "subscription",
+                                              "params": {"channel": CHANNEL, "data": data}}))
+
+
+def change(prev_change_id, change_id, bids=(), asks=()):
+    return {"type": "change", "prev_change_id": prev_change_id, "change_id": change_id,
+            "bids": [list(level) for level in bids], "asks": [list(level) for level in asks]}
+
+
+def test_gap_resyncs_the_book_and_later_changes_apply():
+    websocket = BookWebSocket([
+        {"change_id": 10, "bids": [["new", 29999.5, 10]], "asks": [["new", 30000.0, 5]]},
+        {"change_id": 20, "bids": [["new", 29998.0, 7]], "asks": [["new", 30001.0, 3]]},
+    ])
+
+    async def test():
+        async with DeribitClient(websocket) as client:
+            book = LocalOrderBook("BTC-PERPETUAL")
+            await book.start(client, timeout=1)
+            websocket.notify(change(10, 11, bids=[("change", 29999.5, 12)]))
+            await asyncio.sleep(0.01)
+            assert book.summary()["bids"] == [[29999.5, 12]] and book.change_id == 11
+
+            # Change 12 is lost: 13 does not follow 11
+            websocket.notify(change(12, 13, bids=[("new", 29999.0, 1)]))
+            await asyncio.sleep(0.01)
+            await book.wait_ready(1)
+            assert book.resyncs == 1
+            assert websocket.methods[-2:] == ["public/unsubscribe", "public/subscribe"]
+            assert book.summary()["bids"] == [[29998.0, 7]] and book.change_id == 20
+
+            websocket.notify(change(20, 21, bids=[("delete", 29998.0, 0), ("new", 29997.5, 4)],
+                                    asks=[("new", 30000.5, 2)]))
+            await asyncio.sleep(0.01)
+            await book.stop()
+            return book
+
+    book = asyncio.run(asyncio.wait_for(test(), 5))
+
+    assert book.change_id == 21 and book.resyncs == 1
+    assert book.summary()["bids"] == [[29997.5, 4]]
+    assert book.summary()["asks"] == [[30000.5, 2], [30001.0, 3]]
@@ -0,0 +1,131 @@
+"""
+The order chase, streaming and polling, against the simulated exchange on a virtual clock.
+
+The synthetic market maker quotes one tick (0.5) around the feed price, so with a flat feed at
+30000 the best bid is 29999.5 and a buy is chased at 29998.5, CHASE_OFFSET_TICKS behind it.
+A feed price falling through the order fills it at its price.
+"""
+import pytest
+
+from deribit_utils import deribit_utils
+from deribit_utils.client import DeribitClient
+from deribit_utils.simulator import SimulatedExchange, SimulatedWebSocket, run_simulation
+
+START_TIME = 1_700_000_000
+QUANTITY = 1000
+
+CHASES = {
+    "streaming": deribit_utils.monitor_and_update_order_streaming,
+    "polling": deribit_utils.monitor_and_update_order_polling,
+}
+
+
+def flat_then(prices, seconds=5, flat=30000.0, flat_ticks=3, tail_seconds=400):
+    """
+    A feed at `flat` for flat_ticks ticks, then `prices`, one tick every `seconds`, then the last
+    price for tail_seconds.
+    """
+    feed = [flat] * flat_ticks + list(prices)
+    ticks = [(START_TIME + i * seconds, price) for i, price in enumerate(feed)]
+    last_time, last_price = ticks[-1]
+    ticks += [(last_time + i, last_price) for i in range(1, tail_seconds)]
+    return ticks
+
+
+def run_chase(chase, ticks, side="buy", quantity=QUANTITY):
+    exchange = SimulatedExchange(ticks)
+
+    async def run():
+        exchange.start()
+        try:
+            async with DeribitClient(exchange.connect()) as client:
+                await deribit_utils.authenticate("simulator", "simulator", client=client)
+                return await chase(client, side, quantity)
+        finally:
+            await exchange.stop()
+
+    return run_simulation(run(), start_time=START_TIME), exchange
+
+
+def client_orders(exchange, order_type):
+    return [order for order in exchange.orders.values() if order["_client"] and order["order_type"] == order_type]
+
+
+@pytest.mark.parametrize("mode", CHASES)
+def test_order_rests_behind_the_best_bid_and_fills_at_its_price(mode):
+    price, exchange = run_chase(CHASES[mode], flat_then([29990.0]))
+
+    assert price == 29998.5
+    assert exchange.position_size == QUANTITY
+    assert exchange.request_counts["private/edit"] == 0
+    assert exchange.request_counts["private/cancel"] == 0
+    assert client_orders(exchange, "market") == []
+
+
+@pytest.mark.parametrize("mode", CHASES)
+def test_order_follows_a_rising_bid(mode):
+    # Each 2 USD step moves the target 4 ticks, beyond CHASE_TOLERANCE_TICKS
+    price, exchange = run_chase(CHASES[mode], flat_then([30002.0, 30004.0, 29990.0]))
+
+    assert price == 30002.5
+    assert exchange.position_size == QUANTITY
+    if mode == "streaming":
+        # Repriced in place
+        assert exchange.request_counts["private/edit"] == 2
+        assert exchange.request_counts["private/buy"] == 1
+    else:
+        # Repriced by cancelling and placing a new order
+        assert exchange.request_counts["private/cancel"] == 2
+        assert exchange.request_counts["private/buy"] == 3
+
+
+def test_small_moves_within_the_tolerance_are_not_chased():
+    price, exchange = run_chase(CHASES["streaming"], flat_then([30000.5, 30000.0, 29990.0]))
+
+    assert price == 29998.5
+    assert exchange.request_counts["private/edit"] == 0
+
+
+@pytest.mark.parametrize("mode", CHASES)
+def test_market_order_after_the_time_limit(mode):
+    price, exchange = run_chase(CHASES[mode], flat_then([]))
+
+    # Filled at the best ask once the limit order has rested for TIME_LIMIT_SECONDS
+    assert price == 30000.5
+    assert exchange.position_size == QUANTITY
+    assert len(client_orders(exchange, "limit")) == 1
+    assert client_orders(exchange, "limit")[0]["order_state"] == "cancelled"
+    assert len(client_orders(exchange, "market")) == 1
+
+
+def test_sell_is_chased_above_the_best_ask():
+    price, exchange = run_chase(CHASES["streaming"], flat_then([30010.0]), side="sell")
+
+    assert price == 30001.5
+    assert exchange.position_size == -QUANTITY
+
+
+def test_lost_market_order_update_falls_back_to_the_order_state(monkeypatch):
+    # The market order is acknowledged as open, and its fill notification never arrives
+    handle, deliver = SimulatedExchange.handle, SimulatedWebSocket.deliver
+
+    def open_market_orders(exchange, socket, message):
+        response = handle(exchange, socket, message)
+        order = (response.get("result") or {}).get("order") if isinstance(response.get("result"), dict) else None
+        if order and order.get("order_type") == "market":
+            response["result"]["order"] = dict(order, order_state="open", filled_amount=0)
+        return response
+
+    def drop_market_order_updates(socket, message):
+        params = message.get("params") or {}
+        if params.get("channel", "").startswith("user.orders.") and params["data"].get("order_type") == "market":
+            return
+        deliver(socket, message)
+
+    monkeypatch.setattr(SimulatedExchange, "handle", open_market_orders)
+    monkeypatch.setattr(SimulatedWebSocket, "deliver", drop_market_order_updates)
+    ticks = flat_then([], tail_seconds=deribit_utils.TIME_LIMIT_SECONDS + 100)
+    price, exchange = run_chase(CHASES["streaming"], ticks)
+
+    assert price == 30000.5
+    assert exchange.request_counts["private/get_order_state"] == 1
@@ -0,0 +1,42 @@
+"""
+parallel_map, in process and across worker processes, with and without shared memory.
+"""
+import functools
+
+import numpy as np
+import pytest
+
+from backtest_utils.backtest import BARS_PER_YEAR, FEE_RATE, prepare_arrays
+from backtest_utils.parallel import parallel_map
+from backtest_utils.walk_forward import _run_pairs
+from benchmarks.bench_backtest import random_hourly_bars
+
+
+def scaled_sums(shared, chunk, scale):
+    return [float(shared["values"][start:end].sum()) * shared["factor"] * scale for start, end in chunk]
+
+
+@pytest.mark.parametrize("processes, share_memory", [(1, False), (3, False), (3, True)])
+def test_results_in_the_order_of_items(processes, share_memory):
+    shared = {"values": np.arange(100, dtype=np.float64), "flags": np.ones(100, dtype=bool), "factor": 2}
+    items = [(start, start + 10) for start in range(0, 90, 3)]
+
+    results = parallel_map(functools.partial(scaled_sums, scale=0.5), items, shared, processes, share_memory)
+
+    assert results == [float(np.arange(start, end).sum()) for start, end in items]
+
+
+def test_shared_memory_gives_the_results_of_the_default():
+    # The tasks of walk_forward, which maps the bars from shared memory
+    arrays = prepare_arrays(random_hourly_bars(0.1))
+    tasks = [((start, start + 300), pair) for start in (0, 150, 300)
+             for pair in [(0.03, 0.05), (0.09, 0.09), (0.2, 0.01)]]
+    run_pairs = functools.partial(_run_pairs, multipliers=[(1, 2), (2, 4), (5, 5)], fee_rate=FEE_RATE,
+                                  bars_per_year=BARS_PER_YEAR)
+
+    pickled = parallel_map(run_pairs, tasks, arrays, processes=2)
+    shared = parallel_map(run_pairs, tasks, arrays, processes=2, share_memory=True)
+
+    assert len(shared) == len(tasks)
+    for expected, result in zip(pickled, shared):
+        assert np.array_equal(expected, result)
@@ -0,0 +1,66 @@
+"""
+CreditPool on the virtual clock of the simulator: the order in which queued requests get their
+credits, and the empty bucket after a rate limit error.
+"""
+import asyncio
+
+import pytest
+
+from deribit_utils.rate_limiter import PRIORITY_INFORMATIONAL, PRIORITY_ORDER_PATH, CreditPool
+from deribit_utils.simulator import run_simulation
+
+START_TIME = 1_700_000_000
+
+
+def served_at(pool, requests):
+    """
+    Queue requests, (name, priority) pairs in arrival order, on pool at the same instant.
+    Returns [(name, seconds after the start)] in the order their credits were handed out.
+    """
+    async def run():
+        loop = asyncio.get_running_loop()
+        served = []
+
+        async def request(name, priority):
+            await pool.acquire(priority)
+            served.append((name, loop.time() - START_TIME))
+
+        await asyncio.gather(*(request(name, priority) for name, priority in requests))
+        return served
+
+    return run_simulation(run(), start_time=START_TIME)
+
+
+def test_order_path_is_served_before_informational_requests():
+    pool = CreditPool("test", capacity=1, refill_per_second=1, cost=1)
+
+    served = served_at(pool, [("first", PRIORITY_INFORMATIONAL), ("ticker", PRIORITY_INFORMATIONAL),
+                              ("summary", PRIORITY_INFORMATIONAL), ("buy", PRIORITY_ORDER_PATH),
+                              ("cancel", PRIORITY_ORDER_PATH)])
+
+    # first takes the only credit at once; the queue is then served by priority, then arrival
+    assert [name for name, _ in served] == ["first", "buy", "cancel", "ticker", "summary"]
+    assert [seconds for _, seconds in served] == pytest.approx([0, 1, 2, 3, 4])
+    assert pool.metrics()["throttled"] == 4
+    assert pool.metrics()["max_queue_delay_seconds"] == pytest.approx(4)
+
+
+def test_penalize_empties_the_bucket():
+    pool = CreditPool("test", capacity=5, refill_per_second=2, cost=1)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        await pool.acquire()
+        assert pool.credits == 4
+        pool.penalize()
+        await pool.acquire()
+        first = loop.time() - START_TIME
+        await pool.acquire()
+        return first, loop.time() - START_TIME
+
+    first, second = run_simulation(run(), start_time=START_TIME)
+
+    # Credits refill from zero at 2 per second, one request costs 1
+    assert (first, second) == pytest.approx((0.5, 1.0))
+    assert pool.metrics()["rate_limit_errors"] == 1
+    assert pool.metrics()["throttled"] == 2
@@ -0,0 +1,57 @@
+"""
+MarketDataRecorder flushes: a failed write is retried without writing any message twice.
+"""
+import asyncio
+
+import pytest
+
+from deribit_utils import recorder as recorder_module
+from deribit_utils.recorder import MarketDataReader, MarketDataRecorder
+
+CHANNELS = ["ticker.BTC-PERPETUAL.100ms", "ticker.ETH-PERPETUAL.100ms"]
+
+
+class IdleClient:
+    closed = False
+
+    async def subscribe(self, channels, handler):
+        return None
+
+    async def unsubscribe(self, channels, handler):
+        return None
+
+
+def test_failed_flush_rewrites_only_the_unwritten_channels(tmp_path, monkeypatch):
+    write = recorder_module._Segment.write
+    failures = []
+
+    def failing_write(segment, batch):
+        if "ETH-PERPETUAL" in segment.path and not failures:
+            failures.append(segment.path)
+            raise OSError("disk full")
+        return write(segment, batch)
+
+    monkeypatch.setattr(recorder_module._Segment, "write", failing_write)
+
+    async def run():
+        recorder = MarketDataRecorder(CHANNELS, directory=str(tmp_path), flush_interval=3600)
+        await recorder.start(IdleClient())
+        for i in range(3):
+            for channel in CHANNELS:
+                recorder.on_message(channel, {"timestamp": 1_700_000_000_000 + i, "last_price": 30000.0 + i})
+
+        with pytest.raises(OSError):
+            await recorder.flush()
+        assert recorder.metrics()["buffered"] == 3  # Only the ETH messages are kept for the next flush
+        assert await recorder.flush() == 3
+        await recorder.stop()
+        return recorder
+
+    recorder = asyncio.run(run())
+
+    assert failures and recorder.written == 6
+    reader = MarketDataReader(str(tmp_path))
+    for channel in CHANNELS:
+        table = reader.read(channel)
+        assert table.column("message").to_pylist() == [0, 1, 2]
+        assert table.column("last_price").to_pylist() == [30000.0, 30001.0, 30002.0]
@@ -0,0 +1,20 @@
+"""
+Records compare and hash by type and field values.
+"""
+from deribit_utils.records import BookTop, Order, Ticker
+
+
+def test_equal_records_hash_alike():
+    first = Order.from_dict({"order_id": "ETH-1", "order_state": "open", "price": 2000.0})
+    second = Order.from_dict({"order_id": "ETH-1", "order_state": "open", "price": 2000.0, "extra": 1})
+
+    assert first == second and hash(first) == hash(second)
+    assert len({first, second, Order.from_dict({"order_id": "ETH-2"})}) == 2
+
+
+def test_records_of_other_types_differ():
+    fields = {"instrument_name": "BTC-PERPETUAL", "timestamp": 1, "best_bid_price": 29999.5,
+              "best_bid_amount": 10, "best_ask_price": 30000.0, "best_ask_amount": 20}
+
+    assert BookTop(**fields) != Ticker.from_dict(fields)
+    assert len({BookTop(**fields), Ticker.from_dict(fields)}) == 2
@@ -0,0 +1,113 @@
+"""
+RunLedger on the local store: claims, lease expiry, completion and release, and two processes
+racing for the same key.
+"""
+import pytest
+
+from gcp_utils import run_ledger
+from gcp_utils.run_ledger import CLAIMED, DONE, RECOVERED, RELEASED, RUNNING, LocalRunStore, RunLedger
+
+KEY = "b14-202311142213"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalRunStore(str(tmp_path / "runs"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(run_ledger.time, "time", lambda: now[0])
+    return now
+
+
+class RacingStore:
+    """
+    Store running race() once, right after the first read: another process writing between the
+    read and the write of a claim.
+    """
+
+    def __init__(self, store, race):
+        self.store = store
+        self.race = race
+
+    def read(self, key):
+        result = self.store.read(key)
+        race, self.race = self.race, None
+        if race is not None:
+            race()
+        return result
+
+    def write(self, key, record, version=None):
+        return self.store.write(key, record, version)
+
+
+def test_claimed_key_is_refused_while_running_and_once_done(store):
+    first, second = RunLedger(store), RunLedger(store)
+
+    claim = first.claim(KEY, trigger="message-1")
+    duplicate = second.claim(KEY)
+
+    assert claim and claim.state == CLAIMED and claim.record["details"] == {"trigger": "message-1"}
+    assert not duplicate and duplicate.state == RUNNING and duplicate.owner == first.owner
+
+    first.complete(claim, orders=2)
+    done = second.claim(KEY)
+
+    assert not done and done.state == DONE
+    assert store.read(KEY)[0]["result"] == {"orders": 2}
+
+
+def test_released_key_is_claimed_again(store):
+    first, second = RunLedger(store), RunLedger(store)
+    claim = first.claim(KEY)
+
+    with pytest.raises(RuntimeError):
+        with first.running(claim):
+            raise RuntimeError("order rejected")
+    retry = second.claim(KEY)
+
+    assert store.read(KEY)[0]["attempts"] == 2
+    assert retry.state == CLAIMED and retry.owner == second.owner
+    with second.running(retry):
+        pass
+    assert store.read(KEY)[0]["state"] == DONE
+
+
+def test_release_keeps_the_error(store):
+    ledger = RunLedger(store)
+    claim = ledger.claim(KEY)
+
+    ledger.release(claim, error="run failed")
+
+    record, _ = store.read(KEY)
+    assert record["state"] == RELEASED and record["result"] == {"error": "run failed"}
+
+
+def test_expired_lease_is_taken_over(store, clock):
+    dead, alive = RunLedger(store, lease_seconds=60), RunLedger(store, lease_seconds=60)
+    claim = dead.claim(KEY)
+
+    clock[0] += 59
+    assert not alive.claim(KEY)
+    clock[0] += 2
+    recovered = alive.claim(KEY)
+
+    assert recovered and recovered.recovered and recovered.state == RECOVERED
+    assert recovered.record["lease_until"] == clock[0] + 60 and recovered.record["attempts"] == 2
+
+    # The run taken over finishing late does not overwrite the record of the one that took it over
+    dead.complete(claim)
+    record, _ = store.read(KEY)
+    assert record["state"] == RUNNING and record["owner"] == alive.owner
+
+
+def test_concurrent_claim_loses_on_the_version_conflict(store):
+    winner = RunLedger(store)
+    loser = RunLedger(RacingStore(store, lambda: winner.claim(KEY)))
+
+    lost = loser.claim(KEY)
+
+    assert not lost and lost.state == RUNNING and lost.owner == winner.owner
+    assert store.read(KEY)[0]["owner"] == winner.owner
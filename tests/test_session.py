@@ -0,0 +1,153 @@
+"""
+SessionManager against the simulated exchange, on its virtual clock: connection attempts with
+backoff, the background token refresh, and the resubscription and resync after a dropped
+connection.
+"""
+import asyncio
+import random
+
+import pytest
+
+from deribit_utils import session as session_module
+from deribit_utils.order_book import LocalOrderBook
+from deribit_utils.session import SessionManager
+from deribit_utils.simulator import SIM_ACCESS_TOKEN_TTL_SECONDS, SimulatedExchange, run_simulation
+from deribit_utils.state_tracker import get_state_tracker
+
+START_TIME = 1_700_000_000
+TICKS = [(START_TIME + i, 30000.0 + i % 5) for i in range(4000)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_tokens(monkeypatch):
+    # Tokens are cached per API key for the life of the process
+    monkeypatch.setattr(session_module, "_tokens", {})
+    monkeypatch.setattr(random, "uniform", lambda low, high: high)  # The longest backoff, exactly
+
+
+def failing_connect(exchange, failures):
+    """
+    Connection factory failing while failures (a list) is not empty, popping one per attempt.
+    """
+    def connect():
+        if failures:
+            failures.pop()
+            raise ConnectionError("connection refused")
+        return exchange.connect()
+
+    return connect
+
+
+def auth_grants(monkeypatch):
+    """
+    Record the grant_type of every public/auth request the exchange receives.
+    """
+    handle = SimulatedExchange.handle
+    grants = []
+
+    def recording(exchange, socket, message):
+        if message.get("method") == "public/auth":
+            grants.append(message["params"]["grant_type"])
+        return handle(exchange, socket, message)
+
+    monkeypatch.setattr(SimulatedExchange, "handle", recording)
+    return grants
+
+
+def run_on_exchange(steps):
+    exchange = SimulatedExchange(TICKS)
+
+    async def run():
+        exchange.start()
+        try:
+            return await steps(exchange)
+        finally:
+            await exchange.stop()
+
+    return run_simulation(run(), start_time=START_TIME), exchange
+
+
+def test_start_retries_with_exponential_backoff():
+    async def steps(exchange):
+        loop = asyncio.get_running_loop()
+        session = SessionManager("simulator", "simulator", connect=failing_connect(exchange, [1, 2, 3]),
+                                 backoff=1, max_backoff=3, max_attempts=5)
+        client = await session.start()
+        connected_after = loop.time() - START_TIME
+        assert (await client.request("public/test"))["result"]
+        await session.close()
+        return connected_after
+
+    connected_after, _ = run_on_exchange(steps)
+
+    assert connected_after == pytest.approx(1 + 2 + 3)  # Delays of 1, 2 and 4 capped at 3
+
+
+def test_start_gives_up_after_max_attempts():
+    async def steps(exchange):
+        session = SessionManager("simulator", "simulator", connect=failing_connect(exchange, [1, 2, 3]),
+                                 backoff=1, max_attempts=3)
+        with pytest.raises(ConnectionError, match="after 3 attempts"):
+            await session.start()
+        return session.client
+
+    client, _ = run_on_exchange(steps)
+
+    assert client is None
+
+
+def test_token_is_refreshed_before_it_expires(monkeypatch):
+    grants = auth_grants(monkeypatch)
+
+    async def steps(exchange):
+        session = SessionManager("simulator", "simulator", connect=exchange.connect, refresh_margin=120)
+        client = await session.start()
+        first_token = session.token.access_token
+        await asyncio.sleep(SIM_ACCESS_TOKEN_TTL_SECONDS - 120 + 10)
+        assert session.refreshes == 1 and session.token.access_token != first_token
+        assert (await client.request("private/get_position", {"instrument_name": exchange.instrument_name}))["result"]
+        await session.close()
+
+        # A later session of the process starts from the cached token
+        async with SessionManager("simulator", "simulator", connect=exchange.connect) as warm:
+            await warm.start()
+
+    run_on_exchange(steps)
+
+    assert grants == ["client_credentials", "refresh_token", "refresh_token"]
+
+
+def test_dropped_connection_is_reopened_resubscribed_and_resynced():
+    async def steps(exchange):
+        session = SessionManager("simulator", "simulator", connect=exchange.connect, backoff=1, max_backoff=1)
+        client = await session.start()
+        book = LocalOrderBook(exchange.instrument_name)
+        await book.start(client)
+        tracker = await get_state_tracker(client, exchange.instrument_name)
+        channels = sorted(client.subscribed_channels())
+        position_reads = exchange.request_counts["private/get_position"]
+
+        # The first attempt to reconnect fails, the second one succeeds after the backoff
+        session._connect = failing_connect(exchange, [1])
+        exchange.drop_connections()
+        while client.reconnecting is None:
+            await asyncio.sleep(0)
+        assert not book.ready
+        # Requests sent during the reconnection wait for it instead of failing
+        response = await client.request("private/get_position", {"instrument_name": exchange.instrument_name})
+        await book.wait_ready(5)
+
+        assert "result" in response
+        assert session.reconnects == 1 and session.last_reconnect_seconds == pytest.approx(1)
+        assert session.client is client and not client.closed
+        [socket] = exchange._sockets
+        assert socket.authenticated and sorted(socket.channels) == channels
+        # The request above, and the resync of the state tracker
+        assert exchange.request_counts["private/get_position"] == position_reads + 2
+        assert tracker.position is not None
+        await session.close()
+        return channels
+
+    channels, _ = run_on_exchange(steps)
+
+    assert "book.BTC-PERPETUAL.100ms" in channels and "user.orders.BTC-PERPETUAL.raw" in channels
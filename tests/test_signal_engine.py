@@ -0,0 +1,61 @@
+"""
+SignalEngine against the rules of the signals table.
+
+The fixture has the schema of signals-etl.btc_perpetual_binance.master_signals_ao_1h: bars with
+their AO and entry signals, which the engine fed the same bars must reproduce. The committed one
+holds synthetic bars whose signals come from benchmarks.signal_parity.reference_signals, a plain
+implementation of the table's rules independent of the engine, as its first line records. Rows of
+the table itself, exported with python -m benchmarks.signal_parity --start ... --export-fixture,
+replace it as they are. Live, the engine is fed Deribit candles while the table is computed from
+Binance BTCUSDT bars, so this checks the rules, not the venue.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.signal_parity import compare, synthetic_bars
+from deribit_utils.signal_engine import AO_SLOW_PERIOD, SignalEngine, ao_signals
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "master_signals_ao_1h.csv")
+
+
+def bars_of(medians):
+    """
+    Bars whose median price, (high + low) / 2, is each of medians.
+    """
+    medians = np.asarray(medians, dtype=float)
+    return pd.DataFrame({
+        "open_time": pd.date_range("2024-01-01", periods=len(medians), freq="h", tz="UTC"),
+        "open": medians, "high": medians + 1, "low": medians - 1, "close": medians,
+    })
+
+
+def test_crossings():
+    # With periods 1 and 3, AO is the median minus the mean of the last three medians
+    bars = bars_of([10, 10, 10, 13, 13, 7, 7, 10])
+    signals = SignalEngine(fast_period=1, slow_period=3).run(bars)
+
+    assert signals["AO"].iloc[:2].isna().all()
+    assert np.allclose(signals["AO"].tolist()[2:], [0, 2, 1, -4, -2, 2])
+    # 0 -> 2 crosses above, 1 -> -4 crosses below, -2 -> 2 crosses above
+    assert signals.index[signals["Long_Entry"]].tolist() == [3, 7]
+    assert signals.index[signals["Short_Entry"]].tolist() == [5]
+
+
+def test_engine_matches_vectorized_rules():
+    bars = synthetic_bars(0.5)
+    incremental = SignalEngine().run(bars)
+
+    assert compare("vectorized", ao_signals(bars), incremental, bars["close"].to_numpy()) == 0
+    assert incremental["Long_Entry"].sum() > 0 and incremental["Short_Entry"].sum() > 0
+
+
+def test_engine_matches_signals_table_fixture():
+    bars = pd.read_csv(FIXTURE_PATH, parse_dates=["open_time"], comment="#")
+    assert len(bars) > AO_SLOW_PERIOD
+    assert bars["Long_Entry"].any() and bars["Short_Entry"].any()
+
+    incremental = SignalEngine().run(bars)
+
+    assert compare("table", bars, incremental, bars["close"].to_numpy()) == 0
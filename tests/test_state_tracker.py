@@ -0,0 +1,32 @@
+"""
+StateTracker keeps the open orders and a bounded number of finished ones.
+"""
+import asyncio
+
+from deribit_utils import state_tracker
+from deribit_utils.state_tracker import StateTracker
+
+
+def order(order_id, state, timestamp):
+    return {"order_id": order_id, "order_state": state, "last_update_timestamp": timestamp}
+
+
+def test_finished_orders_are_evicted_beyond_the_limit(monkeypatch):
+    monkeypatch.setattr(state_tracker, "FINISHED_ORDERS_KEPT", 3)
+    tracker = StateTracker("BTC-PERPETUAL")
+    tracker.track(order("resting", "open", 1))
+    for i, state in enumerate(["filled", "cancelled", "rejected", "filled", "filled"]):
+        tracker.track(order(f"done-{i}", "open", 10 * i))
+        tracker.track(order(f"done-{i}", state, 10 * i + 1))
+        tracker.track(order(f"done-{i}", state, 10 * i + 2))  # A repeated final state is not counted again
+
+    assert set(tracker.orders) == {"resting", "done-2", "done-3", "done-4"}
+
+
+def test_waiter_arriving_after_the_fill_sees_it():
+    async def test():
+        tracker = StateTracker("BTC-PERPETUAL")
+        tracker.track(order("entry", "filled", 2))
+        return await tracker.wait_until_filled("entry", timeout=0.1)
+
+    assert asyncio.run(test()).order_state == "filled"
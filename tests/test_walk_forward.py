@@ -0,0 +1,36 @@
+"""
+walk_forward against a brute-force optimization: one sweep of the grid over the train bars of
+each window, and one backtest of its best combination over the test bars.
+"""
+import pytest
+
+from backtest_utils.backtest import SUMMARY_COLUMNS, backtest, sweep
+from backtest_utils.walk_forward import PARAMETER_COLUMNS, walk_forward, walk_forward_windows
+from benchmarks.bench_backtest import random_hourly_bars
+
+GRID = {"stop_losses": (0.03, 0.09), "take_profits": (0.05, 0.09),
+        "long_multipliers": (1, 2), "short_multipliers": (2, 4)}
+TRAIN_BARS, TEST_BARS = 300, 150
+
+
+@pytest.fixture(scope="module")
+def bars():
+    return random_hourly_bars(0.1)  # 876 hourly bars, a few dozen signals
+
+
+def test_walk_forward_matches_a_sweep_of_each_window(bars):
+    results = walk_forward(bars, TRAIN_BARS, TEST_BARS, processes=2, **GRID)
+
+    windows = walk_forward_windows(len(bars), TRAIN_BARS, TEST_BARS)
+    assert len(results) == len(windows) == 4
+    for (_, row), (train_start, train_end, test_start, test_end) in zip(results.iterrows(), windows):
+        train = sweep(bars.iloc[train_start:train_end], processes=1, **GRID)
+        best = train.loc[train["sharpe"].idxmax()]
+        assert row["train_sharpe"] == pytest.approx(best["sharpe"], rel=1e-9)
+        chosen = train.set_index(PARAMETER_COLUMNS).loc[tuple(row[PARAMETER_COLUMNS])]
+        assert chosen["sharpe"] == pytest.approx(best["sharpe"], rel=1e-9)
+
+        test = backtest(bars.iloc[test_start:test_end], **row[PARAMETER_COLUMNS].to_dict())
+        for column in SUMMARY_COLUMNS:
+            assert row[f"test_{column}"] == pytest.approx(test[column], rel=1e-9, abs=1e-12)
+        assert row["test_start"] == bars.index[test_start]
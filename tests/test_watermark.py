@@ -0,0 +1,48 @@
+"""
+Watermark kept in a durable store shared by several instances, with a local file as a fallback.
+"""
+import datetime
+
+from bigquery_utils.bq_utils import Watermark
+from gcp_utils.run_ledger import LocalRunStore
+
+BAR = datetime.datetime(2024, 1, 1, 13, tzinfo=datetime.timezone.utc)
+
+
+class UnavailableStore:
+    def read(self, key):
+        raise ConnectionError("store unavailable")
+
+
+def test_warm_instance_reads_the_value_committed_by_another(tmp_path):
+    store = LocalRunStore(str(tmp_path / "store"))
+    first = Watermark(str(tmp_path / "first.json"), store=store)
+    second = Watermark(str(tmp_path / "second.json"), store=store)
+    first.set("signals.open_time", value=BAR)
+    assert second.get("signals.open_time")["value"] == {"datetime": BAR.isoformat()}
+
+    first.set("signals.open_time", value=BAR + datetime.timedelta(hours=1))
+
+    # second already loaded its entries and wrote its local file, and still sees the newer value
+    assert second.get("signals.open_time")["value"] == {"datetime": (BAR + datetime.timedelta(hours=1)).isoformat()}
+
+
+def test_value_never_moves_backwards(tmp_path):
+    store = LocalRunStore(str(tmp_path / "store"))
+    ahead = Watermark(str(tmp_path / "ahead.json"), store=store)
+    behind = Watermark(str(tmp_path / "behind.json"), store=store)
+    ahead.set("signals.open_time", value=BAR + datetime.timedelta(hours=1))
+
+    behind.set("signals.open_time", value=BAR)
+
+    assert Watermark(str(tmp_path / "cold.json"), store=store).get("signals.open_time")["value"] == \
+        {"datetime": (BAR + datetime.timedelta(hours=1)).isoformat()}
+
+
+def test_local_file_is_the_fallback_when_the_store_is_unavailable(tmp_path):
+    path = str(tmp_path / "watermark.json")
+    Watermark(path, store=LocalRunStore(str(tmp_path / "store"))).set("signals.open_time", value=BAR)
+
+    fallback = Watermark(path, store=UnavailableStore())
+
+    assert fallback.get("signals.open_time")["value"] == {"datetime": BAR.isoformat()}